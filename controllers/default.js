@@ -1,11 +1,64 @@
 const Pty = require('node-pty');
 const fs = require('fs');
+const net = require('net');
+const childProcess = require('child_process');
+
+// If set, sessions are forked by fork_server.py listening on this unix
+// socket instead of spawning a fresh python3 for every websocket
+const FORK_SERVER_SOCKET = process.env.BATTLESHIP_FORK_SERVER;
+// Line printed by fork_server.py once it listens on its socket
+const FORK_SERVER_READY = 'Fork server ready';
+
+// Sessions opened before the fork server is ready wait in this list
+var forkServerReady = false;
+var forkServerWaiting = [];
+
+function whenForkServerReady(callback) {
+    if (forkServerReady) {
+        callback();
+    } else {
+        forkServerWaiting.push(callback);
+    }
+}
 
 exports.install = function () {
 
     ROUTE('/');
     WEBSOCKET('/', socket, ['raw']);
 
+    if (FORK_SERVER_SOCKET) {
+        // Fork server imports and warms up the game once for all sessions,
+        // its socket can only be used once it says it is ready
+        var forkServer = childProcess.spawn('python3', ['fork_server.py',
+            '--socket', FORK_SERVER_SOCKET], {
+            cwd: process.env.PWD,
+            env: process.env,
+            stdio: ['ignore', 'pipe', 'inherit']
+        });
+        var forkServerOutput = '';
+
+        forkServer.stdout.setEncoding('utf8');
+        forkServer.stdout.on('data', function (data) {
+            process.stdout.write(data);
+            if (forkServerReady) {
+                return;
+            }
+            forkServerOutput += data;
+            if (forkServerOutput.indexOf(FORK_SERVER_READY) !== -1) {
+                forkServerReady = true;
+                forkServerOutput = '';
+                forkServerWaiting.splice(0).forEach(function (callback) {
+                    callback();
+                });
+            }
+        });
+
+        forkServer.on('exit', function (code, signal) {
+            forkServerReady = false;
+            console.log('Fork server exited: ', code, signal);
+        });
+    }
+
 };
 
 function socket() {
@@ -15,10 +68,22 @@ function socket() {
 
     this.on('open', function (client) {
 
-        // Spawn terminal
+        if (FORK_SERVER_SOCKET) {
+            whenForkServerReady(function () {
+                // Player may have left while the fork server warmed up
+                if (!client.closed) {
+                    openSession(client);
+                }
+            });
+            return;
+        }
+
+        // Spawn terminal, wide enough for the 10x10 two-map frame
+        // (about 102 columns), narrower terminals wrap it and every
+        // frame has to be drawn in full
         client.tty = Pty.spawn('python3', ['run.py'], {
             name: 'xterm-color',
-            cols: 80,
+            cols: 120,
             rows: 24,
             cwd: process.env.PWD,
             env: process.env
@@ -37,6 +102,12 @@ function socket() {
     });
 
     this.on('close', function (client) {
+        if (client.session) {
+            // Fork server kills the game once its connection is gone
+            client.session.destroy();
+            client.session = null;
+            console.log("Session closed and terminal unloaded");
+        }
         if (client.tty) {
             client.tty.kill(9);
             client.tty = null;
@@ -45,10 +116,34 @@ function socket() {
     });
 
     this.on('message', function (client, msg) {
+        client.session && client.session.write(msg);
         client.tty && client.tty.write(msg);
     });
 }
 
+// Asks the fork server for a session, it runs on its own pty
+function openSession(client) {
+
+    client.session = net.createConnection(FORK_SERVER_SOCKET);
+    // Chunks can end inside a glyph, the decoder keeps its bytes
+    // for the next chunk instead of sending broken characters
+    client.session.setEncoding('utf8');
+
+    client.session.on('close', function () {
+        client.session = null;
+        client.close();
+        console.log("Session closed");
+    });
+
+    client.session.on('error', function (err) {
+        console.log('Fork server session error: ', err);
+    });
+
+    client.session.on('data', function (data) {
+        client.send(data);
+    });
+}
+
 if (process.env.CREDS != null) {
     console.log("Creating creds.json file.");
     fs.writeFile('creds.json', process.env.CREDS, 'utf8', function (err) {
@@ -57,4 +152,4 @@ if (process.env.CREDS != null) {
             socket.emit("console_output", "Error saving credentials: " + err);
         }
     });
-}
\ No newline at end of file
+}
@@ -0,0 +1,338 @@
+# fork_server.py - start game sessions by forking a warmed up interpreter
+
+# Import required libraries
+import argparse  # For reading the server settings from command line
+import fcntl  # For setting the terminal size of a session
+import gc  # For keeping warmed up objects shared between sessions
+import os  # For forking sessions and reaping them
+import pty  # For giving every session its own terminal
+import selectors  # For relaying all sessions from one loop
+import signal  # For stopping sessions whose player left
+import socket  # For the unix socket sessions are asked for on
+import struct  # For packing the terminal size
+import termios  # For the terminal size request
+
+import run  # The game engine, imported and warmed up once
+
+
+# Default server settings, can be changed from command line
+DEFAULT_SOCKET = "/tmp/battleship.sock"
+# Terminal size of a session, the same the pty bridge used to spawn with
+DEFAULT_COLUMNS = 120
+DEFAULT_LINES = 24
+# Bytes relayed in one go between a session terminal and its connection
+RELAY_CHUNK_SIZE = 65536
+# Bytes waiting to be sent one way before the other end is not read any
+# more, so a slow player holds back only its own game
+RELAY_BUFFER_LIMIT = 1048576
+
+
+"""Warm up functions
+------------------"""
+
+
+def warm_up():
+    """
+    Builds everything a game needs before the first session is forked, so
+    every session starts with it ready instead of building it again.
+
+    Imports are already done at this point. The game state, layouts of the
+    default frames, fleet fit checks and free placement indexes of the
+    default settings are built by playing one headless game and rendering
+    the frames of a default game once.
+    """
+    state = run.GameState(seed=0)
+    run.simulate_cpu_vs_cpu(state.height, state.width, state.fleet,
+                            state.gaps_on_map, seed=0)
+    run.game_adjust_check_if_fleet_fits_on_map(state.height, state.width,
+                                               state.fleet,
+                                               state.gaps_on_map)
+
+    # Frames of the instructions page and of the game
+    map_game = run.create_map(state.height, state.width, run.CELL_EMPTY)
+    run.render_map_and_list(state, map_game, run.INSTRUCTIONS, "MAP EXAMPLE",
+                            10)
+    run.render_two_maps(state, map_game, map_game, "CPU Map", "Player Map",
+                        10)
+    run.render_map_and_fleet_aligned_columns(state, map_game, state.fleet,
+                                             "Fleet", 10)
+
+    # Objects made so far are never freed, so forked sessions do not copy
+    # the pages holding them just to update their reference counts
+    gc.collect()
+    gc.freeze()
+
+
+"""Session functions
+------------------"""
+
+
+class RelaySession:
+    """
+    One forked session and the bytes waiting to be relayed to either end.
+
+    The terminal and the connection are both non-blocking, so one slow
+    player or one busy game never stalls the relay loop serving all the
+    others. Whatever can not be written at once waits in the buffer of its
+    direction until its end is writable again.
+
+    Attributes:
+        pid (int): Process id of the game.
+        master (int): Master end of the terminal of the game.
+        connection (socket): The connection of the player.
+        to_game (bytearray): Typed bytes not written to the terminal yet.
+        to_player (bytearray): Drawn bytes not sent to the player yet.
+        game_ended (bool): True once the game has exited, the session
+        ends as soon as everything it drew has been sent.
+    """
+
+    __slots__ = ("pid", "master", "connection", "to_game", "to_player",
+                 "game_ended")
+
+    def __init__(self, pid, master, connection):
+        self.pid = pid
+        self.master = master
+        self.connection = connection
+        self.to_game = bytearray()
+        self.to_player = bytearray()
+        self.game_ended = False
+
+
+def start_session(connection, argv, columns, lines):
+    """
+    Forks a session: a child playing the game on its own terminal.
+
+    Args:
+        connection (socket): The connection of the player.
+        argv (list): Command line arguments of the game.
+        columns (int): Terminal width of the session.
+        lines (int): Terminal height of the session.
+
+    Returns:
+        tuple: (pid, master) of the session, the master end of its
+        terminal is relayed to the connection.
+    """
+    pid, master = pty.fork()
+    if pid == 0:
+        # Child: the game, on the terminal it was given as stdin and stdout
+        exit_code = 0
+        try:
+            # Listener, connections and terminals of other sessions belong
+            # to the server, a session keeping them open would stop their
+            # players from ever seeing them closed
+            os.closerange(3, os.sysconf("SC_OPEN_MAX"))
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            # Size the terminal the way the pty bridge did, before the game
+            # asks for it
+            fcntl.ioctl(pty.STDOUT_FILENO, termios.TIOCSWINSZ,
+                        struct.pack("HHHH", lines, columns, 0, 0))
+            run.main(argv, os.environ)
+        except SystemExit as error:
+            exit_code = error.code if isinstance(error.code, int) else 1
+        except BaseException:
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+
+    return pid, master
+
+
+def stop_session(selector, sessions, master):
+    """
+    Ends a session: closes its terminal and connection and kills the game
+    if it is still running.
+
+    Args:
+        selector (selectors.BaseSelector): Selector relaying the sessions.
+        sessions (dict): Master fd mapped to its RelaySession.
+        master (int): Master fd of the session to stop.
+    """
+    session = sessions.pop(master)
+    for fileobj in (master, session.connection):
+        try:
+            selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+    os.close(master)
+    session.connection.close()
+    try:
+        os.kill(session.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def relay_events(selector, session):
+    """
+    Watches each end of a session for what it can do next: reading while
+    the buffer it fills has room, writing while its own buffer has bytes.
+
+    Args:
+        selector (selectors.BaseSelector): Selector relaying the sessions.
+        session (RelaySession): The session to update.
+    """
+    master_events = 0
+    if not session.game_ended and (len(session.to_player) <
+                                   RELAY_BUFFER_LIMIT):
+        master_events |= selectors.EVENT_READ
+    if session.to_game:
+        master_events |= selectors.EVENT_WRITE
+    connection_events = 0
+    if len(session.to_game) < RELAY_BUFFER_LIMIT:
+        connection_events |= selectors.EVENT_READ
+    if session.to_player:
+        connection_events |= selectors.EVENT_WRITE
+
+    for fileobj, events in ((session.master, master_events),
+                            (session.connection, connection_events)):
+        registered = fileobj in selector.get_map()
+        if events and registered:
+            selector.modify(fileobj, events, session.master)
+        elif events:
+            selector.register(fileobj, events, session.master)
+        elif registered:
+            selector.unregister(fileobj)
+
+
+def relay(session, key, events):
+    """
+    Moves bytes of a session between its terminal and its connection, as
+    far as they can go without blocking.
+
+    Args:
+        session (RelaySession): The session to relay.
+        key (selectors.SelectorKey): The end which is ready.
+        events (int): What the end is ready for.
+
+    Returns:
+        bool: False once the session has to be stopped: the player left,
+        or the game ended and everything it drew has been sent.
+    """
+    try:
+        if key.fileobj is session.connection:
+            if events & selectors.EVENT_READ:
+                # Player typed something
+                data = session.connection.recv(RELAY_CHUNK_SIZE)
+                if not data:
+                    return False
+                session.to_game += data
+            if events & selectors.EVENT_WRITE and session.to_player:
+                sent = session.connection.send(session.to_player)
+                del session.to_player[:sent]
+        else:
+            if events & selectors.EVENT_READ:
+                # Game drew something, EIO once the game has exited
+                try:
+                    data = os.read(session.master, RELAY_CHUNK_SIZE)
+                except BlockingIOError:
+                    raise
+                except OSError:
+                    data = b""
+                if data:
+                    session.to_player += data
+                else:
+                    session.game_ended = True
+            if events & selectors.EVENT_WRITE and session.to_game:
+                written = os.write(session.master, session.to_game)
+                del session.to_game[:written]
+    except BlockingIOError:
+        # Ready ends can still turn out busy, they are tried again later
+        pass
+    except OSError:
+        return False
+    return not (session.game_ended and not session.to_player)
+
+
+def reap_sessions():
+    """
+    Collects the exit status of every finished session, so no zombies are
+    left behind.
+    """
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+"""Server functions
+-----------------"""
+
+
+def serve(path, argv, columns, lines):
+    """
+    Listens on a unix socket and relays every connection to a freshly
+    forked session, until the server is stopped.
+
+    Args:
+        path (str): Path of the unix socket.
+        argv (list): Command line arguments every game is started with.
+        columns (int): Terminal width of the sessions.
+        lines (int): Terminal height of the sessions.
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(128)
+
+    # Finished sessions are reaped as soon as they exit
+    signal.signal(signal.SIGCHLD, lambda signum, frame: reap_sessions())
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ, "listener")
+    sessions = {}
+    print(f"Fork server ready on {path}", flush=True)
+
+    while True:
+        for key, events in selector.select():
+            if key.data == "listener":
+                connection, _ = listener.accept()
+                pid, master = start_session(connection, argv, columns, lines)
+                connection.setblocking(False)
+                os.set_blocking(master, False)
+                sessions[master] = RelaySession(pid, master, connection)
+                relay_events(selector, sessions[master])
+                continue
+
+            session = sessions.get(key.data)
+            if session is None:
+                continue
+            if relay(session, key, events):
+                relay_events(selector, session)
+            else:
+                stop_session(selector, sessions, session.master)
+
+
+"""Command line
+-------------"""
+
+
+def main():
+    """
+    Reads the server settings from command line, warms up and serves.
+    """
+    parser = argparse.ArgumentParser(
+        description="Start Battleship sessions by forking a warmed up "
+                    "interpreter.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET,
+                        help="path of the unix socket to listen on")
+    parser.add_argument("--columns", type=int, default=DEFAULT_COLUMNS,
+                        help="terminal width of a session")
+    parser.add_argument("--lines", type=int, default=DEFAULT_LINES,
+                        help="terminal height of a session")
+    args, game_argv = parser.parse_known_args()
+
+    # Fail here rather than in every session
+    run.read_intro_mode(game_argv, os.environ)
+
+    warm_up()
+    try:
+        serve(args.socket, game_argv, args.columns, args.lines)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
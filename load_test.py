@@ -0,0 +1,538 @@
+# load_test.py - play many scripted terminal games at once and measure them
+
+# Import required libraries
+import argparse  # For reading the load test settings from command line
+import asyncio  # For driving all sessions from one event loop
+import fcntl  # For setting the terminal size of a pty session
+import os  # For the processes and memory of the sessions
+import pty  # For giving every local session its own terminal
+import struct  # For packing the terminal size
+import sys  # For starting the game with the same interpreter
+import tempfile  # For the unix socket of a fork server
+import termios  # For the terminal size request
+import time  # For measuring latencies and throughput
+
+
+# Default load test settings, can be changed from command line
+DEFAULT_TRANSPORT = "pty"
+DEFAULT_LEVELS = (1, 10, 50, 100)
+DEFAULT_THINK_MS = 0
+DEFAULT_TIMEOUT = 30
+DEFAULT_PERCENTILES = (50, 95, 99)
+# Ways of reaching the game:
+# - "pty": a new 'python3 run.py' on its own pty for every session
+# - "fork": sessions forked by fork_server.py, the way the websocket route
+#   of index.js gets them when BATTLESHIP_FORK_SERVER is set
+# - "tcp": sessions played in threads of server.py
+TRANSPORTS = ("pty", "fork", "tcp")
+# Terminal size of a session, the same the pty bridge spawns with
+SESSION_COLUMNS = 120
+SESSION_LINES = 24
+# Port server.py is started on for the "tcp" transport
+TCP_PORT = 8023
+# Seconds between two memory samples while sessions are playing
+MEMORY_SAMPLE_SECONDS = 0.2
+# Bytes read from a session in one go
+READ_CHUNK_SIZE = 65536
+
+# Lines typed by every session: start the game from the instructions page,
+# then deploy the default fleet (5 ships with an alignment, then 3 single
+# cell ships). Shots follow, see 'session_script'.
+DEPLOYMENT_SCRIPT = ("", "0,0,h", "2,0,h", "4,0,h", "6,0,h", "8,0,h",
+                     "0,6,h", "2,6", "4,6", "6,6")
+# Text the game prints when it waits for the next line: the instructions
+# page, and the deployment and shooting prompts
+PROMPT_MARKERS = (b"just press", b"Please enter")
+# Text the game prints when it is over and asks to play again
+GAME_OVER_MARKER = b"play again"
+
+
+"""Script functions
+-----------------"""
+
+
+def session_script(height=10, width=10):
+    """
+    Lines typed by a scripted player, in order.
+
+    After the deployment every cell of the CPU map is shot once, row by
+    row, so every shot is valid and the game always ends before the
+    script does.
+
+    Args:
+        height (int, optional): The height of the game map.
+        width (int, optional): The width of the game map.
+
+    Returns:
+        list: Lines to type, without new lines.
+    """
+    script = list(DEPLOYMENT_SCRIPT)
+    for row in range(height):
+        for column in range(width):
+            script.append(f"{row},{column}")
+    return script
+
+
+"""Transport functions
+--------------------"""
+
+
+async def open_pty_session(directory):
+    """
+    Start a game in a new process on its own pty.
+
+    Args:
+        directory (str): Directory holding run.py.
+
+    Returns:
+        tuple: (reader, send, close) of the session, see 'open_session'.
+    """
+    master, slave = pty.openpty()
+    fcntl.ioctl(slave, termios.TIOCSWINSZ,
+                struct.pack("HHHH", SESSION_LINES, SESSION_COLUMNS, 0, 0))
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "run.py", "--skip-intro", stdin=slave, stdout=slave,
+        stderr=slave, cwd=directory, start_new_session=True)
+    os.close(slave)
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=READ_CHUNK_SIZE)
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader),
+        os.fdopen(master, "rb", 0))
+
+    def send(data):
+        os.write(master, data)
+
+    async def close():
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+        transport.close()
+
+    return reader, send, close
+
+
+async def open_stream_session(connect):
+    """
+    Connect to a game served by fork_server.py or server.py.
+
+    Args:
+        connect (coroutine): Opens the connection, returns (reader, writer).
+
+    Returns:
+        tuple: (reader, send, close) of the session, see 'open_session'.
+    """
+    reader, writer = await connect
+
+    async def close():
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    return reader, writer.write, close
+
+
+async def open_session(target):
+    """
+    Open one session of the game.
+
+    Args:
+        target (dict): Where the game is served, see 'start_target'.
+
+    Returns:
+        tuple: (reader, send, close): a StreamReader with everything the
+        game draws, a function typing bytes into the game and a coroutine
+        ending the session.
+    """
+    if target["transport"] == "pty":
+        return await open_pty_session(target["directory"])
+    if target["transport"] == "fork":
+        return await open_stream_session(
+            asyncio.open_unix_connection(target["socket"]))
+    return await open_stream_session(
+        asyncio.open_connection("127.0.0.1", target["port"]))
+
+
+async def start_target(transport, directory, sessions):
+    """
+    Start the server the sessions are played against, if it needs one.
+
+    Args:
+        transport (str): One of TRANSPORTS.
+        directory (str): Directory holding the game.
+        sessions (int): How many sessions will be played at once.
+
+    Returns:
+        dict: The target with keys:
+            - transport (str): The transport.
+            - directory (str): Directory holding the game.
+            - process (Process): The server, or None for "pty".
+            - socket (str): Unix socket of the fork server.
+            - port (int): TCP port of server.py.
+    """
+    target = {"transport": transport, "directory": directory,
+              "process": None, "socket": None, "port": TCP_PORT}
+    if transport == "fork":
+        target["socket"] = os.path.join(tempfile.mkdtemp(), "battleship.sock")
+        arguments = ["fork_server.py", "--socket", target["socket"],
+                     "--skip-intro"]
+    elif transport == "tcp":
+        arguments = ["server.py", "--port", str(TCP_PORT), "--intro", "skip",
+                     "--max-sessions", str(sessions)]
+    else:
+        return target
+
+    target["process"] = await asyncio.create_subprocess_exec(
+        sys.executable, *arguments, stdout=asyncio.subprocess.PIPE,
+        cwd=directory)
+    # Both servers print one line once they are ready
+    await target["process"].stdout.readline()
+    return target
+
+
+async def stop_target(target):
+    """
+    Stop the server started by 'start_target'.
+
+    Args:
+        target (dict): The target to stop.
+    """
+    process = target["process"]
+    if process is None:
+        return
+    process.terminate()
+    await process.wait()
+    if target["socket"] and os.path.exists(target["socket"]):
+        os.unlink(target["socket"])
+
+
+"""Session functions
+------------------"""
+
+
+async def read_until_prompt(reader, timeout):
+    """
+    Read what the game draws until it waits for the next line.
+
+    Args:
+        reader (asyncio.StreamReader): Output of the session.
+        timeout (float): Seconds to wait for the prompt.
+
+    Returns:
+        bytes: The marker found (one of PROMPT_MARKERS or
+        GAME_OVER_MARKER), or b"" if the session ended first.
+    """
+    output = bytearray()
+    deadline = time.perf_counter() + timeout
+    while True:
+        # Nothing is typed after the game is over but the answer to it
+        if GAME_OVER_MARKER in output:
+            return GAME_OVER_MARKER
+        for marker in PROMPT_MARKERS:
+            if marker in output:
+                return marker
+        try:
+            data = await asyncio.wait_for(reader.read(READ_CHUNK_SIZE),
+                                          deadline - time.perf_counter())
+        except OSError:
+            # A pty raises EIO once the game has exited
+            data = b""
+        if not data:
+            return b""
+        output += data
+
+
+async def play_session(target, script, think_seconds, timeout):
+    """
+    Play one scripted game and time every answer of the game.
+
+    Latency of an input is the time from typing the line to the moment the
+    next prompt has been drawn, so it covers the whole frame the game draws
+    in between, and the CPU's turn.
+
+    Args:
+        target (dict): Where the game is served.
+        script (list): Lines to type, see 'session_script'.
+        think_seconds (float): Pause of the player before every line.
+        timeout (float): Seconds to wait for any single answer.
+
+    Returns:
+        dict: Session results with keys:
+            - first_frame (float): Seconds until the first prompt.
+            - latencies (list): Seconds to the next prompt, per input.
+            - finished (bool): True if the game was played to its end.
+    """
+    result = {"first_frame": None, "latencies": [], "finished": False}
+    start = time.perf_counter()
+    reader, send, close = await open_session(target)
+    try:
+        marker = await read_until_prompt(reader, timeout)
+        result["first_frame"] = time.perf_counter() - start
+        for line in script:
+            if marker in (b"", GAME_OVER_MARKER):
+                break
+            if think_seconds:
+                await asyncio.sleep(think_seconds)
+            sent = time.perf_counter()
+            send(line.encode() + b"\n")
+            marker = await read_until_prompt(reader, timeout)
+            if marker:
+                result["latencies"].append(time.perf_counter() - sent)
+
+        if marker == GAME_OVER_MARKER:
+            # Do not play again
+            send(b"n\n")
+            result["finished"] = True
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        await close()
+    return result
+
+
+"""Measure functions
+------------------"""
+
+
+def descendant_pids(pid):
+    """
+    Finds all processes started by a process, directly or not.
+
+    Args:
+        pid (int): The process to start from.
+
+    Returns:
+        list: Process ids of its descendants, empty where /proc is not
+        available.
+    """
+    children = {}
+    try:
+        names = os.listdir("/proc")
+    except OSError:
+        return []
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat", "rb") as stat:
+                # Process name may hold spaces, fields after it do not
+                fields = stat.read().rsplit(b")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        children.setdefault(int(fields[1]), []).append(int(name))
+
+    found = []
+    waiting = [pid]
+    while waiting:
+        for child in children.get(waiting.pop(), ()):
+            found.append(child)
+            waiting.append(child)
+    return found
+
+
+def process_memory(pid):
+    """
+    Finds how much memory a process uses, in bytes.
+
+    Proportional set size (Pss) is used where the kernel reports it, so
+    pages shared by forked sessions are split between them instead of being
+    counted once per session. Resident set size is used otherwise.
+
+    Args:
+        pid (int): The process.
+
+    Returns:
+        int: Memory of the process, 0 if it is gone.
+    """
+    for path, key in ((f"/proc/{pid}/smaps_rollup", b"Pss:"),
+                      (f"/proc/{pid}/status", b"VmRSS:")):
+        try:
+            with open(path, "rb") as file:
+                for line in file:
+                    if line.startswith(key):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return 0
+
+
+async def sample_memory(peak):
+    """
+    Samples the memory of every game process until cancelled, and keeps the
+    highest total.
+
+    Args:
+        peak (list): One item, the highest total in bytes, updated in place.
+    """
+    while True:
+        total = sum(process_memory(pid) for pid in descendant_pids(
+            os.getpid()))
+        peak[0] = max(peak[0], total)
+        await asyncio.sleep(MEMORY_SAMPLE_SECONDS)
+
+
+def latency_percentile(values, percentile):
+    """
+    Finds a percentile of sorted values using the nearest rank method.
+
+    Args:
+        values (list): Sorted values.
+        percentile (float): Percentile to find, from 0 to 100.
+
+    Returns:
+        float: The smallest value with at least 'percentile' percent of
+        all values at or below it, or None if there are no values.
+    """
+    if not values:
+        return None
+    # Nearest rank, ceil done with integers to avoid float rounding
+    rank = max(1, -(-percentile * len(values) // 100))
+    return values[int(rank) - 1]
+
+
+"""Load test functions
+--------------------"""
+
+
+async def run_level(transport, directory, sessions, script, think_seconds,
+                    timeout):
+    """
+    Plays one level of the ramp: 'sessions' scripted games at once.
+
+    Args:
+        transport (str): One of TRANSPORTS.
+        directory (str): Directory holding the game.
+        sessions (int): How many games are played at the same time.
+        script (list): Lines typed by every session.
+        think_seconds (float): Pause of the players before every line.
+        timeout (float): Seconds to wait for any single answer.
+
+    Returns:
+        dict: Level results with keys:
+            - sessions (int): Games played at the same time.
+            - finished (int): Games played to their end.
+            - elapsed (float): Seconds the level took.
+            - first_frames (list): Sorted seconds to the first prompt.
+            - latencies (list): Sorted seconds from input to next prompt.
+            - memory (int): Highest memory of all game processes, bytes.
+    """
+    target = await start_target(transport, directory, sessions)
+    peak = [0]
+    sampler = asyncio.create_task(sample_memory(peak))
+    start = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(
+            play_session(target, script, think_seconds, timeout)
+            for _ in range(sessions)))
+    finally:
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+        await stop_target(target)
+
+    return {"sessions": sessions,
+            "finished": sum(result["finished"] for result in results),
+            "elapsed": elapsed,
+            "first_frames": sorted(result["first_frame"] for result in results
+                                   if result["first_frame"] is not None),
+            "latencies": sorted(latency for result in results
+                                for latency in result["latencies"]),
+            "memory": peak[0]}
+
+
+"""Print functions
+----------------"""
+
+
+def print_header(percentiles=DEFAULT_PERCENTILES):
+    """
+    Prints the column labels of the results table.
+
+    Args:
+        percentiles (tuple, optional): Latency percentiles shown.
+    """
+    labels = ["Sessions", "Finished", "Inputs/s", "Games/s", "First p50"]
+    labels += [f"p{percentile} ms" for percentile in percentiles]
+    labels += ["MB total", "MB/session"]
+    print(" ".join(f"{label:>10}" for label in labels))
+
+
+def print_level(level, percentiles=DEFAULT_PERCENTILES):
+    """
+    Prints the results of one level as a row of the results table.
+
+    Args:
+        level (dict): Level results, see 'run_level'.
+        percentiles (tuple, optional): Latency percentiles shown.
+    """
+    def milliseconds(value):
+        return "-" if value is None else f"{1000 * value:.1f}"
+
+    elapsed = level["elapsed"] or 1
+    memory = level["memory"] / (1024 * 1024)
+    cells = [str(level["sessions"]), str(level["finished"]),
+             f"{len(level['latencies']) / elapsed:.0f}",
+             f"{level['finished'] / elapsed:.2f}",
+             milliseconds(latency_percentile(level["first_frames"], 50))]
+    cells += [milliseconds(latency_percentile(level["latencies"], percentile))
+              for percentile in percentiles]
+    cells += [f"{memory:.1f}" if memory else "-",
+              f"{memory / level['sessions']:.2f}" if memory else "-"]
+    print(" ".join(f"{cell:>10}" for cell in cells), flush=True)
+
+
+"""Command line
+-------------"""
+
+
+async def run_load_test(transport, directory, levels, think_seconds,
+                        timeout):
+    """
+    Plays every level of the ramp in turn and prints a row for each.
+
+    Args:
+        transport (str): One of TRANSPORTS.
+        directory (str): Directory holding the game.
+        levels (list): Sessions played at once, per level.
+        think_seconds (float): Pause of the players before every line.
+        timeout (float): Seconds to wait for any single answer.
+    """
+    script = session_script()
+    print_header()
+    for sessions in levels:
+        print_level(await run_level(transport, directory, sessions, script,
+                                    think_seconds, timeout))
+
+
+def main():
+    """
+    Reads the load test settings from command line and runs it.
+    """
+    parser = argparse.ArgumentParser(
+        description="Play many scripted Battleship games at once and "
+                    "measure latency, throughput and memory.")
+    parser.add_argument("--transport", choices=TRANSPORTS,
+                        default=DEFAULT_TRANSPORT,
+                        help="how sessions reach the game")
+    parser.add_argument("--levels", default=",".join(
+        str(level) for level in DEFAULT_LEVELS),
+        help="comma separated sessions played at once, one level each")
+    parser.add_argument("--think-ms", type=float, default=DEFAULT_THINK_MS,
+                        help="pause of the players before every line")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                        help="seconds to wait for any single answer")
+    args = parser.parse_args()
+
+    levels = [int(level) for level in args.levels.split(",") if level]
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        asyncio.run(run_load_test(args.transport, directory, levels,
+                                  args.think_ms / 1000, args.timeout))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
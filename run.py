@@ -5,8 +5,35 @@
 import random  # For generating random numbers
 import copy  # For creating deep copies of data structures
 import os  # For clearing the terminal screen
+import sys  # For writing whole frames to the terminal at once
+import shutil  # For finding out the size of the terminal
 import time  # For time-related functionalities
 import re  # For handling user input expressions
+import collections  # For compact simulation result records
+import functools  # For caching fleet feasibility checks
+import argparse  # For reading start options from command line
+import array  # For compact columns of the game actions log
+import json  # For writing the game log as JSON lines
+import struct  # For writing the game log as binary records
+import threading  # For writing coalesced output after a short window
+import signal  # For ending sessions which are idle or too long
+import tempfile  # For creating binary log files with their header
+import io  # For telling input() the coalesced output has no terminal
+
+try:
+    import resource  # Optional, soft memory ceiling of a session
+except ImportError:
+    resource = None
+
+try:
+    import termios  # Optional, typed lines are not echoed in JSON mode
+except ImportError:
+    termios = None
+
+try:
+    import numpy as np  # Optional, vectorized pattern search on big maps
+except ImportError:
+    np = None
 
 
 # Constants for map dimensions and default symbol
@@ -18,17 +45,75 @@ map_width_cpu = ""  # empty value for map size, it can be adjusted in
 # settings, if not, function will assign irr DEFAULT_WIDTH
 DEFAULT_SYMBOL = '?'  # Symbol representing an empty cell in the map
 DEFAULT_GAPS_BETWEEN_MAPS = True
+# How the CPU looks for ships when no damaged ship is waiting to be sunk:
+# - "density": shoot the cell covered by most placements of remaining ships
+# - "biggest_ship": shoot inside a random free window around the biggest ship
+CPU_HUNT_MODES = ("density", "biggest_ship")
+DEFAULT_CPU_HUNT_MODE = "density"
+# Fleet feasibility checks: how many answers are cached, and how many ship
+# placements one check may try before its answer is FLEET_FIT_UNKNOWN. An
+# unknown answer is settled by trying FLEET_FIT_DEPLOY_ATTEMPTS random
+# deployments, the way the fleet is deployed in the game.
+FLEET_FIT_CACHE_SIZE = 256
+FLEET_FIT_SEARCH_LIMIT = 100000
+FLEET_FIT_UNKNOWN = None
+FLEET_FIT_DEPLOY_ATTEMPTS = 50
+# How the logo is shown before the first prompt:
+# - "animated": drawn one character at a time, then held for a second
+# - "instant": drawn in one write, then held for a moment
+# - "skip": not shown at all
+INTRO_MODES = ("animated", "instant", "skip")
+DEFAULT_INTRO_MODE = "animated"
+# Seconds the logo stays on the terminal after it is drawn, per intro mode
+INTRO_HOLD_SECONDS = {"animated": 1, "instant": 0.3, "skip": 0}
+# Environment variable choosing a fast start: "1" (or "instant") draws the
+# logo in one write, "skip" leaves it out. The command line flags
+# --fast-start and --skip-intro do the same and win over it.
+FAST_START_VARIABLE = "BATTLESHIP_FAST_START"
+# Outcome codes of the game actions log. Messages are only built from them
+# when the log is printed. ACTION_HEADER marks the first entry of a log,
+# which is printed as ACTION_LOG_HEADER.
+ACTION_HEADER, ACTION_MISS, ACTION_HIT, ACTION_SUNK, ACTION_GAME_OVER = range(
+    5)
+ACTION_LOG_HEADER = ("Player", "Time", "Row", "Column", "")
+# Headless simulations keep only this many latest actions in their log
+SIMULATION_LOG_CAPACITY = 16
+# Column labels of the printed log, and how many latest actions are printed
+# at the end of a CPU vs CPU game
+LOG_LABELS = ("Player", "Time", "Row", "Column", "Result")
+LOG_PRINT_TAIL = 200
+# Names of the outcome codes in log files
+ACTION_NAMES = ("start", "miss", "hit", "sunk", "game_over")
+# Environment variable with the path of a file every action is streamed to.
+# Paths ending with LOG_SINK_BINARY_SUFFIX get binary records, any other
+# path gets JSON lines. Several sessions may share one file, every record
+# carries the id of its session and the number of its game in the session.
+LOG_SINK_VARIABLE = "BATTLESHIP_LOG"
+LOG_SINK_BINARY_SUFFIX = ".bin"
+# Actions collected before they are written to the log file in one go
+LOG_SINK_BATCH_SIZE = 64
+# Games streamed to a log file keep only this many latest actions in memory
+LOG_SINK_MEMORY_CAPACITY = 256
+# Binary log file: LOG_SINK_MAGIC, then records starting with their type
+# and session id. Name ids are numbered per session.
+# - LOG_RECORD_NAME: type 0, session, name id, name length, then the name
+# - LOG_RECORD_ACTION: type 1, session, game, player id, time, row, column,
+#   outcome, ship id, shot row, shot column
+LOG_SINK_MAGIC = b"BATTLESHIPLOG2\n"
+LOG_RECORD_NAME = struct.Struct("<BQHH")
+LOG_RECORD_ACTION = struct.Struct("<BQHHdiiBHii")
+# Default row and column labels, every game gets its own copy in GameState
 MAP_ROW_INDEXES = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
 MAP_COLUMN_INDEXES = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
 
-# Initialize game-related variables
-game_result = True  # Variable to store the game outcome if it is True - game
-# is ongoing
-cpu_shot_log_tmp = []  # Temporarily store CPU actions if a ship is hit
-start_time = time.time()  # tamer will start with game
-
-# Initialize a log to store game actions
-game_actions_log = []
+# Compact record of one headless CPU vs CPU game:
+# - winner: Name of the CPU which sunk the whole enemy fleet, or None
+# - shots: Number of shots the winner needed
+# - sunk_turns: Tuple of (player, ship_name, turn) for every ship sunk
+# - hit_cells: Bitboards of the cells hit on the maps of CPU 1 and CPU 2
+SimulationResult = collections.namedtuple("SimulationResult",
+                                          ["winner", "shots", "sunk_turns",
+                                           "hit_cells"])
 
 
 # Define color codes for different ship statuses
@@ -41,6 +126,45 @@ DEFAULT_COLORS = {
     "Reset": "\u001b[0m",  # Reset ANSI escape code in string
 }
 
+# ANSI escape sequences for drawing on the terminal:
+# - SCREEN_CLEAR: move the cursor home and clear the whole screen
+# - SCREEN_CELL_PATTERN: one visible character with the colors around it
+SCREEN_CLEAR = "\u001b[H\u001b[2J"
+SCREEN_CELL_PATTERN = re.compile(r"(?:\x1b\[[0-9;]*m)*[^\x1b](?:\x1b\[0m)?")
+SCREEN_RESET = DEFAULT_COLORS["Reset"]
+# Lines kept free under a frame for prompts and typed input. A frame which
+# does not leave them free on the terminal, or has lines wider than the
+# terminal, is always drawn in full.
+SCREEN_PROMPT_LINES = 4
+# Unchanged cells between two changed ones which are written again anyway,
+# because moving the cursor over them would take more bytes
+SCREEN_MERGE_GAP = 3
+# Environment variable with a flush window in milliseconds. Output flushed
+# within the window after the first pending write is sent in one write.
+OUTPUT_WINDOW_VARIABLE = "BATTLESHIP_FLUSH_WINDOW_MS"
+# Environment variable choosing how the game is drawn, one of OUTPUT_MODES:
+# - "ansi": frames of ANSI text for terminals
+# - "json": one compact JSON message per prompt for the web client, only
+#   the cells that changed since the previous prompt are sent, see
+#   'output_json_message'
+OUTPUT_MODE_VARIABLE = "BATTLESHIP_OUTPUT"
+OUTPUT_MODES = ("ansi", "json")
+DEFAULT_OUTPUT_MODE = "ansi"
+# Kinds of cell events sent in JSON mode: the outcome codes of the actions
+# log, then OUTPUT_EVENT_DEPLOY for a ship deployed by the player
+OUTPUT_EVENT_DEPLOY = len(ACTION_NAMES)
+OUTPUT_EVENT_NAMES = ACTION_NAMES + ("deploy",)
+# Environment variables with the limits of one session, unset or 0 for no
+# limit:
+# - IDLE_TIMEOUT_VARIABLE: seconds a prompt may wait for the player
+# - SESSION_LIMIT_VARIABLE: seconds the whole session may last
+# - MEMORY_LIMIT_VARIABLE: megabytes of address space the session may use
+IDLE_TIMEOUT_VARIABLE = "BATTLESHIP_IDLE_TIMEOUT"
+SESSION_LIMIT_VARIABLE = "BATTLESHIP_SESSION_LIMIT"
+MEMORY_LIMIT_VARIABLE = "BATTLESHIP_MEMORY_LIMIT_MB"
+# How many frame layouts (map size, labels and gap) are kept built
+LAYOUT_CACHE_SIZE = 64
+
 # Define symbols for different ship statuses
 SHIP_SYMBOLS = {
     "Single": [DEFAULT_COLORS["DarkYellow"] + chr(0x25C6) + DEFAULT_COLORS[
@@ -69,6 +193,28 @@ SHIP_SYMBOLS = {
     ],
 }
 
+# Maps store small integer codes instead of the symbols above, so a row
+# fits in a bytearray and cells are compared as numbers. SHIP_CELLS has the
+# same keys and layout as SHIP_SYMBOLS, and CELL_SYMBOLS turns a code back
+# into its symbol when a map is printed. Code 0 is an empty cell.
+CELL_EMPTY = 0
+CELL_SYMBOLS = [DEFAULT_SYMBOL]
+SHIP_CELLS = {}
+for ship_status, status_symbols in SHIP_SYMBOLS.items():
+    SHIP_CELLS[ship_status] = tuple(range(
+        len(CELL_SYMBOLS), len(CELL_SYMBOLS) + len(status_symbols)))
+    CELL_SYMBOLS.extend(status_symbols)
+CELL_SYMBOLS = tuple(CELL_SYMBOLS)
+# The same symbols without colors, used when NO_COLOR is set. A sunk ship
+# can not be told apart by its color any more, so it is shown as hit.
+CELL_SYMBOLS_PLAIN = [re.sub(r"\x1b\[[0-9;]*m", "", symbol)
+                      for symbol in CELL_SYMBOLS]
+for ship_status, status_cells in SHIP_CELLS.items():
+    if ship_status.endswith("Sunk"):
+        for cell in status_cells:
+            CELL_SYMBOLS_PLAIN[cell] = CELL_SYMBOLS_PLAIN[SHIP_CELLS["Hit"][0]]
+CELL_SYMBOLS_PLAIN = tuple(CELL_SYMBOLS_PLAIN)
+
 # Define the default fleet configuration
 DEFAULT_FLEET = {
     "AircraftCarrier": {"Size": 5, "Quantity": 1, "Coordinates": []},
@@ -116,11 +262,13 @@ GAME_ADJUST_MAIN = ["If you to adjust your FLEET, type \u001b[33mF\u001b[0m "
 def clear_terminal():
     """
     Clear the terminal screen.
-    This function uses different commands for POSIX (Unix/Linux/macOS) and
-    Windows systems.
+    POSIX (Unix/Linux/macOS) terminals are cleared in-band with ANSI escape
+    sequences, so no 'clear' process has to be started. Windows still uses
+    the 'cls' command.
     """
     if os.name == 'posix':  # Unix/Linux/macOS
-        os.system('clear')
+        sys.stdout.write(SCREEN_CLEAR)
+        sys.stdout.flush()
     elif os.name == 'nt':  # Windows
         os.system('cls')
 
@@ -129,19 +277,26 @@ def clear_terminal():
 ---------------------"""
 
 
-def print_acid_effect():
+def print_acid_effect(intro_mode=DEFAULT_INTRO_MODE):
     """
     Prints a text art of an acid-like effect to the terminal.
 
     This function performs the following steps:
     1. Clears the terminal screen for a clean start.
     2. Prints each character of the `acid_text` string one by one with a
-    slight delay.
+    slight delay, or the whole text in one write in "instant" mode.
     3. Waits for a short moment to let the user view the effect.
     4. Clears the terminal screen again.
 
+    Args:
+        intro_mode (str, optional): How the logo is shown, one of
+        INTRO_MODES. Nothing is printed in "skip" mode.
+
     Note: The function uses the `os` and `time` modules.
     """
+    if intro_mode == "skip":
+        return
+
     # ASCII art representation of the acid effect
 
     acid_logo = """
@@ -160,31 +315,658 @@ wwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwwww
     # Step 1: Clear the terminal
     clear_terminal()
 
-    # Step 2: Print the text character by character
-    for char in acid_logo:
-        print(char, end='', flush=True)  # Using flush=True to force the
-        # output to be printed
-        time.sleep(0.005)  # Delay of 0.005 seconds for each character
+    # Step 2: Print the text character by character, or all of it at once
+    if intro_mode == "instant":
+        sys.stdout.write(acid_logo)
+        sys.stdout.flush()
+    else:
+        for char in acid_logo:
+            print(char, end='', flush=True)  # Using flush=True to force the
+            # output to be printed
+            time.sleep(0.005)  # Delay of 0.005 seconds for each character
 
     # Step 3: Wait for a moment to let the user view the effect
-    time.sleep(1)
+    time.sleep(INTRO_HOLD_SECONDS[intro_mode])
 
     # Step 4: Clear the terminal again
     clear_terminal()
 
 
+def read_intro_mode(argv, environ):
+    """
+    Finds out how the logo should be shown from the command line and the
+    environment.
+
+    Args:
+        argv (list): Command line arguments, without the program name.
+        environ (mapping): Environment variables, FAST_START_VARIABLE is
+        read from it.
+
+    Returns:
+        str: The intro mode, one of INTRO_MODES.
+    """
+    parser = argparse.ArgumentParser(description="Play Battleship against "
+                                                 "the CPU.")
+    parser.add_argument("--fast-start", action="store_true",
+                        help="draw the logo in one go")
+    parser.add_argument("--skip-intro", action="store_true",
+                        help="start without the logo")
+    args = parser.parse_args(argv)
+
+    # Command line wins over the environment
+    if args.skip_intro:
+        return "skip"
+    if args.fast_start:
+        return "instant"
+
+    fast_start = environ.get(FAST_START_VARIABLE, "").strip().lower()
+    if fast_start in INTRO_MODES:
+        return fast_start
+    if fast_start in ("1", "true", "yes", "on"):
+        return "instant"
+    return DEFAULT_INTRO_MODE
+
+
+"""Game state
+----------"""
+
+
+class GameState:
+    """
+    Everything one game needs: settings, labels, maps, fleets, logs and its
+    own random generator.
+
+    Engine functions take the state as their first argument instead of
+    reading module globals, so any number of games can run side by side in
+    one process without sharing anything.
+
+    Attributes:
+        height (int): The height of the game map.
+        width (int): The width of the game map.
+        fleet (dict): Fleet configuration the game is played with.
+        gaps_on_map (bool): If True, ships can not touch each other.
+        row_indexes (list): Row labels printed on maps and typed by players.
+        column_indexes (list): Column labels printed on maps and typed by
+        players.
+        random (random.Random): Random generator of this game.
+        screen (Screen): What the game has drawn on the terminal.
+        cell_symbols (tuple): Symbol printed for every cell code, without
+        colors when the NO_COLOR environment variable is set.
+        hunt_mode (str): How the CPU hunts for ships, one of
+        CPU_HUNT_MODES.
+        start_time (float): Time when the game started, for logging.
+        game_result (bool): True while the game is ongoing.
+        log_capacity (int): How many latest actions the log keeps, or None
+        to keep all of them.
+        log_sink (LogSink): File every action is streamed to, or None.
+        cell_events (list): Cell events not sent yet in JSON output mode,
+        None when the game is drawn as ANSI frames.
+        game_actions_log (ActionLog): Log of game actions, kept for
+        printing and replay only.
+        shots_fired (dict): Player name mapped to the bitboard of cells the
+        player has shot at.
+        cpu_shot_log_tmp (list): Hits of the CPU on ships not sunk yet.
+        map_cpu_hidden, map_cpu_display (GameMap): Maps of the CPU.
+        fleet_cpu (Fleet): Fleet of the CPU.
+        map_player_hidden, map_player_display (GameMap): Maps of the player.
+        fleet_player (Fleet): Fleet of the player.
+    """
+    __slots__ = ("height", "width", "fleet", "gaps_on_map", "row_indexes",
+                 "column_indexes", "random", "screen", "cell_symbols",
+                 "hunt_mode",
+                 "start_time",
+                 "log_capacity", "log_sink", "cell_events", "game_result",
+                 "game_actions_log",
+                 "shots_fired", "cpu_shot_log_tmp",
+                 "map_cpu_hidden", "map_cpu_display", "fleet_cpu",
+                 "map_player_hidden", "map_player_display", "fleet_player")
+
+    def __init__(self, height=DEFAULT_MAP_HEIGHT, width=DEFAULT_MAP_WIDTH,
+                 fleet=None, gaps_on_map=DEFAULT_GAPS_BETWEEN_MAPS,
+                 seed=None, hunt_mode=DEFAULT_CPU_HUNT_MODE,
+                 log_capacity=None, log_sink=None,
+                 output_mode=DEFAULT_OUTPUT_MODE):
+        self.height = height
+        self.width = width
+        self.fleet = copy.deepcopy(DEFAULT_FLEET if fleet is None else
+                                   fleet)
+        self.gaps_on_map = gaps_on_map
+        self.row_indexes = list(MAP_ROW_INDEXES)
+        self.column_indexes = list(MAP_COLUMN_INDEXES)
+        self.random = random.Random(seed)
+        self.screen = Screen()
+        self.cell_symbols = (CELL_SYMBOLS_PLAIN if os.environ.get("NO_COLOR")
+                             else CELL_SYMBOLS)
+        self.hunt_mode = hunt_mode
+        # Actions streamed to a file do not have to stay in memory
+        if log_sink is not None and log_capacity is None:
+            log_capacity = LOG_SINK_MEMORY_CAPACITY
+        self.log_capacity = log_capacity
+        self.log_sink = log_sink
+        self.cell_events = [] if output_mode == "json" else None
+        self.map_cpu_hidden = self.map_cpu_display = self.fleet_cpu = None
+        self.map_player_hidden = self.map_player_display = None
+        self.fleet_player = None
+        game_state_reset(self)
+
+
+def game_state_reset(state):
+    """
+    Resets the logs, result and timer of a game, so a new round can start.
+
+    Args:
+        state (GameState): The game to reset.
+    """
+    state.start_time = time.time()  # Timer will start with game
+    state.game_result = True  # If it is True - game is ongoing
+    state.game_actions_log = ActionLog(state.log_capacity, state.log_sink)
+    action_log_append(state.game_actions_log, "Player", 0, 0, 0,
+                      ACTION_HEADER)
+    state.shots_fired = {}  # Cells every player has shot at
+    state.cpu_shot_log_tmp = []  # CPU hits on ships which are not sunk
+
+
+def game_state_resize_labels(state, height, width):
+    """
+    Extends row and column labels, so a map of the given size can be
+    printed. The label style (numbers or letters) is kept.
+
+    Args:
+        state (GameState): The game whose labels are extended.
+        height (int): The new height of the game map.
+        width (int): The new width of the game map.
+    """
+    if height > len(state.row_indexes):
+        # Create Row indexes based on the current symbol
+        if str(state.row_indexes[0]).isdigit():
+            state.row_indexes = list(range(height + 1))
+        elif str(state.row_indexes[0]).isalpha():
+            state.row_indexes = [chr(97 + i) for i in range(height + 1)]
+
+    if width > len(state.column_indexes):
+        # Create Column indexes based on the current symbol
+        if str(state.column_indexes[1]).isdigit():
+            state.column_indexes = list(range(width + 1))
+        elif str(state.column_indexes[1]).isalpha():
+            state.column_indexes = [chr(97 + i) for i in range(width + 1)]
+
+
+"""Action log
+----------"""
+
+
+class ActionLog:
+    """
+    Log of game actions kept as columns of typed arrays.
+
+    Every action is a few numbers (player, time, row, column, outcome code
+    and details), and its message is only built when an entry is read.
+    Entries read as (player, time, row, column, message) tuples, the same
+    layout the log had as a list of lists, so it can be indexed, sliced and
+    iterated like one.
+
+    With a capacity the log is a ring buffer: once full, every new action
+    replaces the oldest one, so an endless simulation uses a fixed amount
+    of memory. With a sink every action is also streamed to a file, where
+    the whole game is kept.
+
+    Attributes:
+        capacity (int): How many latest actions are kept, or None to keep
+        all of them.
+        sink (LogSink): File every action is streamed to, or None.
+        start (int): Position of the oldest kept action in the columns.
+        total (int): How many actions were ever added.
+        names (list): Player and ship names, referenced by id.
+        name_ids (dict): Name mapped to its id in names.
+        players (array): Name id of the player of every action.
+        times (array): Seconds since the game started.
+        rows, columns (array): Coordinates of every action.
+        outcomes (array): Outcome code of every action, one of ACTION_*.
+        details (array): Name id of the sunk ship, for ACTION_SUNK.
+        shot_rows, shot_columns (array): Coordinates of the shot which sunk
+        a ship, for ACTION_SUNK.
+    """
+
+    __slots__ = ("capacity", "sink", "start", "total", "names", "name_ids",
+                 "players", "times", "rows", "columns", "outcomes",
+                 "details", "shot_rows", "shot_columns")
+
+    def __init__(self, capacity=None, sink=None):
+        self.capacity = capacity
+        self.sink = sink
+        self.start = 0
+        self.total = 0
+        self.names = []
+        self.name_ids = {}
+        self.players = array.array("H")
+        self.times = array.array("d")
+        self.rows = array.array("i")
+        self.columns = array.array("i")
+        self.outcomes = array.array("B")
+        self.details = array.array("H")
+        self.shot_rows = array.array("i")
+        self.shot_columns = array.array("i")
+
+    def __len__(self):
+        return len(self.outcomes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [action_log_entry(self, position) for position in
+                    range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("action log index out of range")
+        return action_log_entry(self, index)
+
+
+def action_log_name_id(log, name):
+    """
+    Find the id of a player or ship name, adding it to the log if needed.
+
+    Args:
+        log (ActionLog): The log holding the names.
+        name (str): The name to look up.
+
+    Returns:
+        int: Index of the name in log.names.
+    """
+    name_id = log.name_ids.get(name)
+    if name_id is None:
+        name_id = log.name_ids[name] = len(log.names)
+        log.names.append(name)
+    return name_id
+
+
+def action_log_append(log, player, timer, row, column, outcome,
+                      ship_name="", shot_row=0, shot_column=0):
+    """
+    Add one action to the log, replacing the oldest one if the log is full.
+
+    Args:
+        log (ActionLog): The log to add to.
+        player (str): Name of the player who performed the action.
+        timer (float): Seconds since the game started.
+        row (int): Row of the action.
+        column (int): Column of the action.
+        outcome (int): Outcome code, one of ACTION_*.
+        ship_name (str, optional): Name of the sunk ship, for ACTION_SUNK.
+        shot_row, shot_column (int, optional): Coordinates of the shot which
+        sunk the ship, for ACTION_SUNK.
+    """
+    player_id = log.name_ids.get(player)
+    if player_id is None:
+        player_id = action_log_name_id(log, player)
+    detail = action_log_name_id(log, ship_name) if ship_name else 0
+    log.total += 1
+    if log.sink is not None:
+        log_sink_write(log.sink, player, timer, row, column, outcome,
+                       ship_name, shot_row, shot_column)
+
+    # Ring buffer is full, the oldest action is overwritten in place
+    if log.capacity is not None and len(log.outcomes) >= log.capacity:
+        position = log.start
+        log.players[position] = player_id
+        log.times[position] = timer
+        log.rows[position] = row
+        log.columns[position] = column
+        log.outcomes[position] = outcome
+        log.details[position] = detail
+        log.shot_rows[position] = shot_row
+        log.shot_columns[position] = shot_column
+        log.start = (position + 1) % log.capacity
+        return
+
+    log.players.append(player_id)
+    log.times.append(timer)
+    log.rows.append(row)
+    log.columns.append(column)
+    log.outcomes.append(outcome)
+    log.details.append(detail)
+    log.shot_rows.append(shot_row)
+    log.shot_columns.append(shot_column)
+
+
+def action_log_position(log, index):
+    """
+    Turn the index of an entry (0 is the oldest kept) into its position in
+    the columns of the log.
+
+    Args:
+        log (ActionLog): The log.
+        index (int): Index of the entry, from 0 to len(log) - 1.
+
+    Returns:
+        int: Position of the entry in the columns.
+    """
+    if log.start:
+        return (log.start + index) % len(log.outcomes)
+    return index
+
+
+def action_log_entry(log, index):
+    """
+    Read one entry of the log, building its message.
+
+    Args:
+        log (ActionLog): The log to read.
+        index (int): Index of the entry, from 0 to len(log) - 1.
+
+    Returns:
+        tuple: (player, time, row, column, message) of the entry.
+    """
+    position = action_log_position(log, index)
+    if log.outcomes[position] == ACTION_HEADER:
+        return ACTION_LOG_HEADER
+    return (log.names[log.players[position]], log.times[position],
+            log.rows[position], log.columns[position],
+            action_log_message(log, position))
+
+
+def action_log_message(log, position):
+    """
+    Build the human readable message of an action.
+
+    Args:
+        log (ActionLog): The log holding the action.
+        position (int): Position of the action in the columns.
+
+    Returns:
+        str: The message, as shown in the game and in the printed log.
+    """
+    outcome = log.outcomes[position]
+    player = log.names[log.players[position]]
+    row = log.rows[position]
+    column = log.columns[position]
+    if outcome == ACTION_MISS:
+        return (f'{player} performed shot on coordinates {row} and'
+                f' {column} and it was a MISS')
+    if outcome == ACTION_HIT:
+        return (f'{player} performed shot on coordinates {row} '
+                f'and {column} and it was a HIT. Some Ship Damaged')
+    if outcome == ACTION_SUNK:
+        return (f'{player} performed shot on coordinates '
+                f'{log.shot_rows[position]} and '
+                f'{log.shot_columns[position]} and '
+                f'{log.names[log.details[position]]} was SUNK')
+    if outcome == ACTION_GAME_OVER:
+        return "Game Over"
+    return ""
+
+
+def action_log_messages(log, count):
+    """
+    Build the messages of the latest actions, for the banner above the maps.
+
+    Args:
+        log (ActionLog): The log to read.
+        count (int): How many latest actions to show.
+
+    Returns:
+        str: One message per line, every line ending with a new line.
+    """
+    return "".join(
+        action_log_message(log, action_log_position(log, index)) + "\n"
+        for index in range(max(0, len(log) - count), len(log)))
+
+
+"""Log sink
+--------"""
+
+
+class LogSink:
+    """
+    Append-only log file every game action is streamed to.
+
+    Actions are encoded as they happen, collected in batches of
+    LOG_SINK_BATCH_SIZE and written in one go, so memory stays flat no
+    matter how long the session is. A game is started by a "start" action
+    and ended by a "game_over" one, and the file is synced to disk at the
+    end of every game, so completed games can be analyzed offline with
+    read_log_sink.
+
+    Several sessions can append to the same file: every batch is written
+    with a single unbuffered write to a file opened for appending, so
+    batches of different sessions never mix inside a record, and every
+    record carries the session id, so they can be told apart.
+
+    Attributes:
+        file (file): The log file, opened for appending bytes, unbuffered.
+        binary (bool): True for binary records, False for JSON lines.
+        session (int): Random 64 bit id of the session writing the sink.
+        game (int): Number of the game being written, counted from 1.
+        pending (list): Encoded actions not written yet.
+        name_ids (dict): Names already written to a binary file by this
+        session, mapped to their ids.
+        last_outcome (int): Outcome code of the last action written, or
+        None.
+    """
+
+    __slots__ = ("file", "binary", "session", "game", "pending", "name_ids",
+                 "last_outcome")
+
+    def __init__(self, file, binary):
+        self.file = file
+        self.binary = binary
+        self.session = int.from_bytes(os.urandom(8), "little")
+        self.game = 0
+        self.pending = []
+        self.name_ids = {}
+        self.last_outcome = None
+
+
+def open_log_sink(path):
+    """
+    Open a log file for appending, creating a new binary file with its
+    header first.
+
+    Args:
+        path (str): Path of the log file, or None for no log file. Paths
+        ending with LOG_SINK_BINARY_SUFFIX get binary records.
+
+    Returns:
+        LogSink: The opened sink, or None if no path was given.
+    """
+    if not path:
+        return None
+    binary = path.endswith(LOG_SINK_BINARY_SUFFIX)
+    if binary and not os.path.exists(path):
+        log_sink_create_binary(path)
+    return LogSink(open(path, "ab", buffering=0), binary)
+
+
+def log_sink_create_binary(path):
+    """
+    Create a binary log file holding only its header, unless another
+    session has just created it.
+
+    The header is written to a temporary file which is then linked to the
+    path, so the file appears with its header already in place and no
+    session can append a record before it, or write the header twice.
+
+    Args:
+        path (str): Path of the binary log file.
+    """
+    directory = os.path.dirname(path) or "."
+    descriptor, temporary = tempfile.mkstemp(dir=directory)
+    try:
+        os.write(descriptor, LOG_SINK_MAGIC)
+        os.close(descriptor)
+        os.link(temporary, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(temporary)
+
+
+def log_sink_write(sink, player, timer, row, column, outcome, ship_name,
+                   shot_row, shot_column):
+    """
+    Encode one action and write the batch once it is full.
+
+    Args:
+        sink (LogSink): The sink to write to.
+        player (str): Name of the player who performed the action.
+        timer (float): Seconds since the game started.
+        row, column (int): Coordinates of the action.
+        outcome (int): Outcome code, one of ACTION_*.
+        ship_name (str): Name of the sunk ship, or "".
+        shot_row, shot_column (int): Coordinates of the shot which sunk the
+        ship.
+    """
+    # A game restarted before its first action is not written twice
+    if outcome == ACTION_HEADER and sink.last_outcome == ACTION_HEADER:
+        return
+    sink.last_outcome = outcome
+    if outcome == ACTION_HEADER:
+        sink.game += 1
+
+    if sink.binary:
+        sink.pending.append(LOG_RECORD_ACTION.pack(
+            1, sink.session, sink.game, log_sink_name_id(sink, player),
+            timer, row, column, outcome, log_sink_name_id(sink, ship_name),
+            shot_row, shot_column))
+    else:
+        record = {"session": f"{sink.session:016x}", "game": sink.game,
+                  "player": player, "time": timer, "row": row,
+                  "column": column, "outcome": ACTION_NAMES[outcome]}
+        if outcome == ACTION_SUNK:
+            record.update(ship=ship_name, shot_row=shot_row,
+                          shot_column=shot_column)
+        sink.pending.append(json.dumps(record).encode() + b"\n")
+
+    if len(sink.pending) >= LOG_SINK_BATCH_SIZE:
+        log_sink_flush(sink)
+
+
+def log_sink_name_id(sink, name):
+    """
+    Find the id of a name in a binary log file, writing a name record
+    before its first use.
+
+    Args:
+        sink (LogSink): The binary sink.
+        name (str): Player or ship name.
+
+    Returns:
+        int: The id of the name.
+    """
+    name_id = sink.name_ids.get(name)
+    if name_id is None:
+        name_id = sink.name_ids[name] = len(sink.name_ids)
+        encoded = name.encode()
+        sink.pending.append(LOG_RECORD_NAME.pack(
+            0, sink.session, name_id, len(encoded)) + encoded)
+    return name_id
+
+
+def log_sink_flush(sink):
+    """
+    Write the pending batch of actions to the log file, in one write so
+    it lands whole after the batches of other sessions.
+
+    Args:
+        sink (LogSink): The sink to flush.
+    """
+    if sink.pending:
+        batch = b"".join(sink.pending)
+        sink.pending.clear()
+        written = sink.file.write(batch)
+        # A write is only cut short by a full disk or a signal
+        while written < len(batch):
+            batch = batch[written:]
+            written = sink.file.write(batch)
+
+
+def log_sink_sync(sink):
+    """
+    Write everything pending and make sure it is on disk, at game end.
+
+    Args:
+        sink (LogSink): The sink to sync, or None.
+    """
+    if sink is None:
+        return
+    log_sink_flush(sink)
+    sink.file.flush()
+    os.fsync(sink.file.fileno())
+
+
+def log_sink_close(sink):
+    """
+    Sync and close a log file.
+
+    Args:
+        sink (LogSink): The sink to close, or None.
+    """
+    if sink is None:
+        return
+    log_sink_sync(sink)
+    sink.file.close()
+
+
+def read_log_sink(path):
+    """
+    Read the actions of a log file written by a LogSink, one at a time, so
+    a long log never has to be loaded whole.
+
+    Args:
+        path (str): Path of the log file, JSON lines or binary.
+
+    Yields:
+        dict: One action with keys session (hex id of the session), game
+        (number of the game in its session), player, time, row, column and
+        outcome (one of ACTION_NAMES), and ship, shot_row and shot_column
+        for a sunk ship.
+    """
+    with open(path, "rb") as file:
+        if file.read(len(LOG_SINK_MAGIC)) != LOG_SINK_MAGIC:
+            # JSON lines, one action per line
+            file.seek(0)
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        # Names of every session, sessions number their names on their own
+        session_names = {}
+        while True:
+            record_type = file.read(1)
+            if not record_type:
+                return
+            if record_type[0] == 0:
+                _, session, name_id, length = LOG_RECORD_NAME.unpack(
+                    record_type + file.read(LOG_RECORD_NAME.size - 1))
+                session_names.setdefault(session, {})[name_id] = (
+                    file.read(length).decode())
+                continue
+            (_, session, game, player, timer, row, column, outcome, ship,
+             shot_row, shot_column) = LOG_RECORD_ACTION.unpack(
+                record_type + file.read(LOG_RECORD_ACTION.size - 1))
+            names = session_names[session]
+            record = {"session": f"{session:016x}", "game": game,
+                      "player": names[player], "time": timer, "row": row,
+                      "column": column, "outcome": ACTION_NAMES[outcome]}
+            if outcome == ACTION_SUNK:
+                record.update(ship=names[ship], shot_row=shot_row,
+                              shot_column=shot_column)
+            yield record
+
+
 """Initial game start functions
 -----------------------------"""
 
 
-def create_initial_game_variables(height, width, symbol, fleet):
+def create_initial_game_variables(height, width, cell, fleet):
     """
     Creates and returns the initial game variables for the Battleship game.
 
     Parameters:
     - height (int): The height of the game map.
     - width (int): The width of the game map.
-    - symbol (str): The default symbol to fill the game map with.
+    - cell (int): The cell code to fill the game map with, usually
+    CELL_EMPTY.
     - fleet (dict): The initial fleet configuration.
 
     Returns:
@@ -194,10 +976,10 @@ def create_initial_game_variables(height, width, symbol, fleet):
         3. new_fleet (dict): A deep copy of the initial fleet configuration.
     """
 
-    # Create the game map with the given dimensions and default symbol.
+    # Create the game map with the given dimensions and default cell code.
     # The function 'create_map' is assumed to be defined elsewhere in the
     # code.
-    map_display = create_map(width, height, symbol)
+    map_display = create_map(width, height, cell)
 
     # Create a deep copy of the game map to serve as the hidden map.
     # Deep copy ensures that changes to one map won't affect the other.
@@ -205,52 +987,57 @@ def create_initial_game_variables(height, width, symbol, fleet):
 
     # Create a deep copy of the initial fleet configuration.
     # This allows us to manipulate the fleet during the game without
-    # affecting the original configuration.
-    new_fleet = copy.deepcopy(fleet)
+    # affecting the original configuration. Deployed ship cells will be
+    # indexed on it.
+    new_fleet = Fleet(copy.deepcopy(fleet))
 
     # Return the newly created game variables as a tuple.
     return map_hidden, map_display, new_fleet
 
 
-def game_instructions():
+def game_instructions(state):
     """
     Displays the game instructions and allows the player to adjust game
     settings.
 
+    Args:
+    - state (GameState): The game, its settings are used as a starting
+    point and its labels are changed by the settings menu.
+
     Global Variables:
     - SHIP_SYMBOLS: Dictionary holding symbols for different ship states.
     - INSTRUCTIONS: String containing game instructions.
-    - DEFAULT_MAP_HEIGHT, DEFAULT_MAP_WIDTH: Default dimensions of  game map
-    - DEFAULT_FLEET: Default fleet configuration.
-    - MAP_ROW_INDEXES, MAP_COLUMN_INDEXES: Default row and column labels.
-    - DEFAULT_GAPS_BETWEEN_MAPS: Default gap between the two displayed maps.
 
     Returns:
     - tuple: A tuple containing updated game settings or False if interrupted.
     """
 
     # Declare global variables accessed within the function
-    global SHIP_SYMBOLS, INSTRUCTIONS, DEFAULT_MAP_HEIGHT, DEFAULT_MAP_WIDTH,\
-        DEFAULT_FLEET, MAP_ROW_INDEXES, MAP_COLUMN_INDEXES, \
-        DEFAULT_GAPS_BETWEEN_MAPS
+    global SHIP_SYMBOLS, INSTRUCTIONS
 
-    # Initialize default game settings
-    height = DEFAULT_MAP_HEIGHT
-    width = DEFAULT_MAP_WIDTH
-    gaps_on_map = DEFAULT_GAPS_BETWEEN_MAPS
-    fleet = copy.deepcopy(DEFAULT_FLEET)
+    # Initialize game settings from the game state
+    height = state.height
+    width = state.width
+    gaps_on_map = state.gaps_on_map
+    fleet = copy.deepcopy(state.fleet)
 
     # Create a temporary map and fleet for demonstration purposes
-    tmp_map = create_map(height, width, DEFAULT_SYMBOL)
-    tmp_fleet = copy.deepcopy(DEFAULT_FLEET)
+    tmp_map = create_map(height, width, CELL_EMPTY)
+    tmp_fleet = copy.deepcopy(fleet)
 
     # Deploy ships on the temporary map
-    tmp_map, tmp_fleet = cpu_deploy_all_ships(tmp_map, tmp_fleet, gaps_on_map)
+    tmp_map, tmp_fleet = cpu_deploy_all_ships(state, tmp_map, tmp_fleet,
+                                              gaps_on_map)
 
     # Main loop to display instructions and handle user input
     while True:
-        # Display the example map alongside the game instructions
-        print_map_and_list(tmp_map, INSTRUCTIONS, "MAP EXAMPLE", 10)
+        # Display the example map alongside the game instructions, the web
+        # client only needs the settings
+        if state.cell_events is not None:
+            output_json_settings(state, height, width, fleet, gaps_on_map)
+        else:
+            print_map_and_list(state, tmp_map, INSTRUCTIONS, "MAP EXAMPLE",
+                               10)
 
         try:
             # Prompt the user to decide whether to adjust the game settings
@@ -260,7 +1047,7 @@ def game_instructions():
             if changes in ["Y", "YES"]:
                 # Call the function to modify game settings
                 height, width, fleet, gaps_on_map = modify_game_settings(
-                    height, width, fleet, gaps_on_map)
+                    state, height, width, fleet, gaps_on_map)
                 continue  # Continue the loop to display updated settings
             if changes == "0":
                 # Return the final game settings
@@ -268,7 +1055,7 @@ def game_instructions():
             # now this is a tiny secret who will read code, you can see how
             # this game works, try cvc
             if changes.lower() == "cvc":
-                cpu_vs_cpu(height, width, fleet, gaps_on_map)
+                cpu_vs_cpu(state, height, width, fleet, gaps_on_map)
 
             else:
                 # Return the final game settings
@@ -284,13 +1071,14 @@ def game_instructions():
 ------------------------------"""
 
 
-def modify_game_settings(height, width, fleet, gaps_on_map):
+def modify_game_settings(state, height, width, fleet, gaps_on_map):
     """
     Adjusts game settings based on user input. The settings include map
     dimensions,
     fleet configuration, row and column labels, and gaps between maps.
 
     Args:
+    - state (GameState): The game, its labels and random generator are used.
     - height (int): The height of the map.
     - width (int): The width of the map.
     - fleet (dict): The current fleet configuration.
@@ -311,15 +1099,15 @@ def modify_game_settings(height, width, fleet, gaps_on_map):
         # Create a temporary map and fleet for demonstration purposes
         tmp_fleet = copy.deepcopy(fleet)  # Reset the fleet for new ship
         # alignment
-        tmp_map = create_map(height, width, DEFAULT_SYMBOL)
+        tmp_map = create_map(height, width, CELL_EMPTY)
 
         # Deploy ships on the temporary map
-        tmp_map, tmp_fleet = cpu_deploy_all_ships(tmp_map, tmp_fleet,
+        tmp_map, tmp_fleet = cpu_deploy_all_ships(state, tmp_map, tmp_fleet,
                                                   gaps_on_map)
 
         # Clear the terminal and display the current state
         clear_terminal()
-        print_map_and_list(tmp_map, GAME_ADJUST_MAIN, "MAP EXAMPLE", 10)
+        print_map_and_list(state, tmp_map, GAME_ADJUST_MAIN, "MAP EXAMPLE", 10)
 
         try:
             # Get user input for which setting to adjust
@@ -335,22 +1123,23 @@ def modify_game_settings(height, width, fleet, gaps_on_map):
 
             # Modify fleet settings
             if user_input == "F":
-                fleet = modify_game_settings_fleet(height, width, fleet,
+                fleet = modify_game_settings_fleet(state, height, width, fleet,
                                                    gaps_on_map)
 
             # Modify map dimensions
             elif user_input == "M":
-                height, width = modify_game_settings_map(height, width,
+                height, width = modify_game_settings_map(state, height, width,
                                                          fleet, gaps_on_map)
 
             # Modify row and column labels
             elif user_input == "I":
-                modify_game_settings_labels(height, width, fleet, gaps_on_map)
+                modify_game_settings_labels(state, height, width, fleet,
+                                            gaps_on_map)
 
             # Modify gap settings
             elif user_input == "G":
-                gaps_on_map = modify_game_settings_gaps(height, width, fleet,
-                                                        gaps_on_map)
+                gaps_on_map = modify_game_settings_gaps(state, height, width,
+                                                        fleet, gaps_on_map)
 
             # Exit the loop and return the final settings
             elif user_input == "0":
@@ -366,12 +1155,13 @@ def modify_game_settings(height, width, fleet, gaps_on_map):
             return False  # Return False to indicate interruption
 
 
-def modify_game_settings_gaps(height, width, fleet, gaps_on_map):
+def modify_game_settings_gaps(state, height, width, fleet, gaps_on_map):
     """
     Allows the user to enable or disable the requirement for gaps between
     ships on the game map.
 
     Args:
+    - state (GameState): The game, its labels and random generator are used.
     - height (int): The height of the game map.
     - width (int): The width of the game map.
     - fleet (dict): The current state of the fleet.
@@ -456,10 +1246,8 @@ def modify_game_settings_gaps(height, width, fleet, gaps_on_map):
                     # before we apply gaps, we need to check if it is valid:
                     # Test if the fleet can fit on the map with the new
                     # dimensions
-                    tmp_map, = create_map(height, width, DEFAULT_SYMBOL)
-                    tmp_fleet = copy.deepcopy(fleet)
                     check_result = game_adjust_check_if_fleet_fits_on_map(
-                        tmp_map, tmp_fleet, gaps_on_map)
+                        height, width, fleet, gaps_on_map)
                     if check_result:
                         return gaps_on_map
                     else:
@@ -478,11 +1266,12 @@ def modify_game_settings_gaps(height, width, fleet, gaps_on_map):
             # interruption
 
 
-def modify_game_settings_labels(height, width, fleet, gaps_on_map):
+def modify_game_settings_labels(state, height, width, fleet, gaps_on_map):
     """
     Allows the user to customize the row and column labels on the game map.
 
     Args:
+    - state (GameState): The game, its labels and random generator are used.
     - height (int): The height of the game map.
     - width (int): The width of the game map.
     - fleet (dict): The current state of the fleet.
@@ -496,8 +1285,8 @@ def modify_game_settings_labels(height, width, fleet, gaps_on_map):
     - bool: False if the game adjustment was interrupted.
     """
 
-    # Declare the global variable for the default symbol used in the map
-    global DEFAULT_SYMBOL, MAP_ROW_INDEXES, MAP_COLUMN_INDEXES
+    # Declare the global variable for the code of an empty map cell
+    global CELL_EMPTY
 
     input_validation = True  # Initialize input validation flag
     input_values = [1, 2]  # Initialize the list to store the user input
@@ -508,12 +1297,12 @@ def modify_game_settings_labels(height, width, fleet, gaps_on_map):
         try:
             # Create a temporary map and a deep copy of the fleet for
             # demonstration purposes
-            tmp_map = create_map(height, width, DEFAULT_SYMBOL)
+            tmp_map = create_map(height, width, CELL_EMPTY)
             tmp_fleet = copy.deepcopy(fleet)
 
             # Deploy the fleet on the temporary map for demonstration
-            tmp_map, tmp_fleet = cpu_deploy_all_ships(tmp_map, fleet,
-                                                      gaps_on_map)
+            tmp_map, tmp_fleet = cpu_deploy_all_ships(state, tmp_map,
+                                                      tmp_fleet, gaps_on_map)
 
             # Define the text to display alongside the map
             tmp_text = [
@@ -528,7 +1317,7 @@ def modify_game_settings_labels(height, width, fleet, gaps_on_map):
             ]
 
             # Display the map and instructions side by side
-            print_map_and_list(tmp_map, tmp_text, "Map Example", 10)
+            print_map_and_list(state, tmp_map, tmp_text, "Map Example", 10)
 
             # Check if the previous input was invalid and display a warning
             if not input_validation:
@@ -554,16 +1343,17 @@ def modify_game_settings_labels(height, width, fleet, gaps_on_map):
             if input_validation:
                 # Create row indexes based on the first symbol
                 if input_values[0].isdigit():
-                    MAP_ROW_INDEXES = list(range(height + 1))
+                    state.row_indexes = list(range(height + 1))
                 elif input_values[0].isalpha():
-                    MAP_ROW_INDEXES = [chr(97 + i) for i in range(height + 1)]
+                    state.row_indexes = [chr(97 + i) for i in
+                                         range(height + 1)]
 
                 # Create column indexes based on the second symbol
                 if input_values[1].isdigit():
-                    MAP_COLUMN_INDEXES = list(range(width + 1))
+                    state.column_indexes = list(range(width + 1))
                 elif input_values[1].isalpha():
-                    MAP_COLUMN_INDEXES = [chr(97 + i) for i in range(width
-                                                                     + 1)]
+                    state.column_indexes = [chr(97 + i) for i in
+                                            range(width + 1)]
 
                 return
 
@@ -574,11 +1364,12 @@ def modify_game_settings_labels(height, width, fleet, gaps_on_map):
             # interrupted
 
 
-def modify_game_settings_map(height, width, fleet, gaps_on_map):
+def modify_game_settings_map(state, height, width, fleet, gaps_on_map):
     """
     Allows the user to customize the dimensions of the game map.
 
     Args:
+    - state (GameState): The game, its labels and random generator are used.
     - height (int): The current height of the game map.
     - width (int): The current width of the game map.
     - fleet (dict): The current state of the fleet.
@@ -592,8 +1383,8 @@ def modify_game_settings_map(height, width, fleet, gaps_on_map):
     - bool: False if the game adjustment was interrupted.
     """
 
-    # Declare the global variable for the default symbol used in the map
-    global DEFAULT_SYMBOL, MAP_ROW_INDEXES, MAP_COLUMN_INDEXES
+    # Declare the global variable for the code of an empty map cell
+    global CELL_EMPTY
 
     input_values = [10, 10]     # Initialize the list to store the user input
     # values
@@ -608,12 +1399,12 @@ def modify_game_settings_map(height, width, fleet, gaps_on_map):
 
             # Create a temporary map and a deep copy of the fleet for
             # demonstration purposes
-            tmp_map = create_map(height, width, DEFAULT_SYMBOL)
+            tmp_map = create_map(height, width, CELL_EMPTY)
             tmp_fleet = copy.deepcopy(fleet)
 
             # Deploy the fleet on the temporary map for demonstration
-            tmp_map, tmp_fleet = cpu_deploy_all_ships(tmp_map, tmp_fleet,
-                                                      gaps_on_map)
+            tmp_map, tmp_fleet = cpu_deploy_all_ships(state, tmp_map,
+                                                      tmp_fleet, gaps_on_map)
 
             # Define the text to display alongside the map
             tmp_text = [
@@ -626,7 +1417,7 @@ def modify_game_settings_map(height, width, fleet, gaps_on_map):
             ]
 
             # Display the map and instructions side by side
-            print_map_and_list(tmp_map, tmp_text, "Map Example", 10)
+            print_map_and_list(state, tmp_map, tmp_text, "Map Example", 10)
 
             # Check if the previous input was invalid and display a warning
             if not input_validation:
@@ -652,31 +1443,13 @@ def modify_game_settings_map(height, width, fleet, gaps_on_map):
             if input_validation:
                 # before we try if game fits all ships, we need to change Row
                 # and column labels, otherwise map can not be printed:
-                if input_values[0] > len(MAP_ROW_INDEXES):
-                    # Create Row indexes based on the second symbol
-                    if str(MAP_ROW_INDEXES[0]).isdigit():
-                        MAP_ROW_INDEXES = list(range(input_values[0] + 1))
-                    elif str(MAP_ROW_INDEXES[0]).isalpha():
-                        MAP_ROW_INDEXES = [chr(97 + i) for i in range(
-                            input_values[0] + 1)]
-
-                if input_values[1] > len(MAP_COLUMN_INDEXES):
-                    # Create Column indexes based on the second symbol
-                    if str(MAP_COLUMN_INDEXES[1]).isdigit():
-                        MAP_COLUMN_INDEXES = list(range(input_values[1] + 1))
-                    elif str(MAP_COLUMN_INDEXES[1]).isalpha():
-                        MAP_COLUMN_INDEXES = [chr(97 + i) for i in range(
-                            input_values[1] + 1)]
-
-                # create temporary map to test with
-                tmp_map = create_map(int(input_values[0]), int(input_values[
-                                                                   1]),
-                                     DEFAULT_SYMBOL)
-                tmp_fleet = copy.deepcopy(fleet)
+                game_state_resize_labels(state, input_values[0],
+                                         input_values[1])
 
                 # Test if the fleet can fit on the map with the new dimensions
                 check_result = game_adjust_check_if_fleet_fits_on_map(
-                    tmp_map, tmp_fleet, gaps_on_map)
+                    int(input_values[0]), int(input_values[1]), fleet,
+                    gaps_on_map)
 
                 # If the fleet fits, update the map dimensions
                 if check_result:
@@ -695,11 +1468,12 @@ def modify_game_settings_map(height, width, fleet, gaps_on_map):
             # interrupted
 
 
-def modify_game_settings_fleet(height, width, fleet, gaps_on_map):
+def modify_game_settings_fleet(state, height, width, fleet, gaps_on_map):
     """
     Allows the user to customize the fleet of ships.
 
     Args:
+    - state (GameState): The game, its labels and random generator are used.
     - height (int): The current height of the game map.
     - width (int): The current width of the game map.
     - fleet (dict): The current state of the fleet.
@@ -711,8 +1485,8 @@ def modify_game_settings_fleet(height, width, fleet, gaps_on_map):
     - dict: New fleet dictionary if adjustments were successful.
     - bool: False if the game adjustment was interrupted.
     """
-    global DEFAULT_SYMBOL  # Declare the global variable for the default
-    # symbol used in the map
+    global CELL_EMPTY  # Declare the global variable for the code of an
+    # empty map cell
 
     while True:
         # Clear the terminal for a fresh display
@@ -721,12 +1495,12 @@ def modify_game_settings_fleet(height, width, fleet, gaps_on_map):
 
         # Create a temporary map and a deep copy of the fleet for
         # demonstration purposes
-        tmp_map = create_map(height, width, DEFAULT_SYMBOL)
+        tmp_map = create_map(height, width, CELL_EMPTY)
         tmp_fleet = copy.deepcopy(fleet)
 
-        tmp_map, tmp_fleet = cpu_deploy_all_ships(tmp_map, tmp_fleet,
+        tmp_map, tmp_fleet = cpu_deploy_all_ships(state, tmp_map, tmp_fleet,
                                                   gaps_on_map)
-        print_map_and_fleet_aligned_columns(tmp_map, tmp_fleet,
+        print_map_and_fleet_aligned_columns(state, tmp_map, tmp_fleet,
                                             "Map Example", 10)
 
         # Display user instructions
@@ -748,7 +1522,7 @@ def modify_game_settings_fleet(height, width, fleet, gaps_on_map):
 
             if user_input == "N":
                 fleet = modify_game_settings_fleet_add_new_ship(
-                    height, width, fleet, gaps_on_map)
+                    state, height, width, fleet, gaps_on_map)
             elif user_input == "0":
                 return fleet
             elif user_input.isdigit():
@@ -760,13 +1534,14 @@ def modify_game_settings_fleet(height, width, fleet, gaps_on_map):
                 if 0 <= index < len(ship_names):
                     ship_name = ship_names[index]
                     fleet = modify_game_settings_fleet_single_ship(
-                        height, width, fleet, gaps_on_map, ship_name)
+                        state, height, width, fleet, gaps_on_map, ship_name)
 
             else:
                 closest_ship_name = find_closest_ship_name(user_input, fleet)
                 if closest_ship_name:
                     fleet = modify_game_settings_fleet_single_ship(
-                        height, width, fleet, gaps_on_map, closest_ship_name)
+                        state, height, width, fleet, gaps_on_map,
+                        closest_ship_name)
 
         except KeyboardInterrupt:
             print("Game adjustment interrupted.")
@@ -838,12 +1613,13 @@ def find_closest_ship_name(user_input, fleet):
     return closest_match
 
 
-def modify_game_settings_fleet_add_new_ship(height, width, fleet,
+def modify_game_settings_fleet_add_new_ship(state, height, width, fleet,
                                             gaps_on_map):
     """
     Allows the user to add a new ship to the fleet.
 
     Args:
+    - state (GameState): The game, its labels and random generator are used.
     - height (int): The height of the game map.
     - width (int): The width of the game map.
     - fleet (dict): The current state of the fleet.
@@ -855,8 +1631,8 @@ def modify_game_settings_fleet_add_new_ship(height, width, fleet,
     - dict: Updated fleet dictionary if a new ship was successfully added.
     """
 
-    # Access the global variable for the default symbol used on the map
-    global DEFAULT_SYMBOL
+    # Access the global variable for the code of an empty map cell
+    global CELL_EMPTY
 
     # Initialize variables for user input validation and fleet fitting check
     validated_user_input_1 = ["ShipName", "Size", "QTY"]
@@ -872,15 +1648,15 @@ def modify_game_settings_fleet_add_new_ship(height, width, fleet,
 
             # Create a temporary map and a deep copy of the fleet for
             # demonstration
-            tmp_map = create_map(height, width, DEFAULT_SYMBOL)
+            tmp_map = create_map(height, width, CELL_EMPTY)
             tmp_fleet = copy.deepcopy(fleet)
 
             # Deploy the fleet on the temporary map for demonstration
-            tmp_map, tmp_fleet = cpu_deploy_all_ships(tmp_map, tmp_fleet,
-                                                      gaps_on_map)
+            tmp_map, tmp_fleet = cpu_deploy_all_ships(state, tmp_map,
+                                                      tmp_fleet, gaps_on_map)
 
             # Display the map and fleet side by side
-            print_map_and_fleet_aligned_columns(tmp_map, tmp_fleet,
+            print_map_and_fleet_aligned_columns(state, tmp_map, tmp_fleet,
                                                 "Map Example", 10)
 
             # Validate that user has entered exactly 3 values for the new ship
@@ -921,10 +1697,8 @@ def modify_game_settings_fleet_add_new_ship(height, width, fleet,
 
                 # If the second validation also succeeds
                 if validation_result_2:
-                    # Make a deep copy of the current fleet and map for
-                    # testing
+                    # Make a deep copy of the current fleet for testing
                     tmp_fleet = copy.deepcopy(fleet)
-                    tmp_map = create_map(height, width, DEFAULT_SYMBOL)
 
                     # Add the new ship to the temporary fleet
                     tmp_fleet[validated_user_input_1[0]] = \
@@ -934,7 +1708,7 @@ def modify_game_settings_fleet_add_new_ship(height, width, fleet,
 
                     # Check if the updated fleet can fit on the map
                     check_result = game_adjust_check_if_fleet_fits_on_map(
-                        tmp_map, tmp_fleet, gaps_on_map)
+                        height, width, tmp_fleet, gaps_on_map)
 
                     # If the new fleet fits, update the actual fleet
                     if check_result:
@@ -950,12 +1724,13 @@ def modify_game_settings_fleet_add_new_ship(height, width, fleet,
                   "correct number of values.")
 
 
-def modify_game_settings_fleet_single_ship(height, width, fleet, gaps_on_map,
-                                           ship_name):
+def modify_game_settings_fleet_single_ship(state, height, width, fleet,
+                                           gaps_on_map, ship_name):
     """
     Allows the user to modify or delete a single existing ship from the fleet.
 
     Args:
+    - state (GameState): The game, its labels and random generator are used.
     - height (int): The height of the game map.
     - width (int): The width of the game map.
     - fleet (dict): The current state of the fleet.
@@ -968,8 +1743,8 @@ def modify_game_settings_fleet_single_ship(height, width, fleet, gaps_on_map,
     - dict: Updated fleet dictionary if ship was modified or deleted.
     """
 
-    # Access the global variable for the default symbol used on the map
-    global DEFAULT_SYMBOL
+    # Access the global variable for the code of an empty map cell
+    global CELL_EMPTY
 
     # Initialize variables
     ship_size = fleet[ship_name]["Size"]
@@ -987,15 +1762,15 @@ def modify_game_settings_fleet_single_ship(height, width, fleet, gaps_on_map,
 
             # Create a temporary map and deep copy of the fleet for
             # demonstration
-            tmp_map = create_map(height, width, DEFAULT_SYMBOL)
+            tmp_map = create_map(height, width, CELL_EMPTY)
             tmp_fleet = copy.deepcopy(fleet)
 
             # Deploy this temporary fleet onto the temporary map
-            tmp_map, tmp_fleet = cpu_deploy_all_ships(tmp_map, tmp_fleet,
-                                                      gaps_on_map)
+            tmp_map, tmp_fleet = cpu_deploy_all_ships(state, tmp_map,
+                                                      tmp_fleet, gaps_on_map)
 
             # Display the map and fleet side-by-side
-            print_map_and_fleet_aligned_columns(tmp_map, tmp_fleet,
+            print_map_and_fleet_aligned_columns(state, tmp_map, tmp_fleet,
                                                 "Map Example", 10)
 
             # Display validation and fitting errors, if any
@@ -1035,7 +1810,6 @@ def modify_game_settings_fleet_single_ship(height, width, fleet, gaps_on_map,
                 # If input is valid, attempt to modify the ship
                 if validation_result:
                     tmp_fleet = copy.deepcopy(fleet)
-                    tmp_map = create_map(height, width, DEFAULT_SYMBOL)
                     tmp_fleet[ship_name]["Size"] = int(
                         validated_user_input[0])
                     tmp_fleet[ship_name]["Quantity"] = int(
@@ -1043,7 +1817,7 @@ def modify_game_settings_fleet_single_ship(height, width, fleet, gaps_on_map,
 
                     # Check if the modified fleet fits on the map
                     check_result = game_adjust_check_if_fleet_fits_on_map(
-                        tmp_map, tmp_fleet, gaps_on_map)
+                        height, width, tmp_fleet, gaps_on_map)
 
                     if check_result:
                         fleet[ship_name]["Size"] = int(
@@ -1063,40 +1837,286 @@ def modify_game_settings_fleet_single_ship(height, width, fleet, gaps_on_map,
 --------------------------------------"""
 
 
-def game_adjust_check_if_fleet_fits_on_map(map, fleet, gaps_on_map):
+def game_adjust_check_if_fleet_fits_on_map(height, width, fleet,
+                                           gaps_on_map):
     """
-    Checks if the entire fleet can be deployed on the given map.
+    Checks if the entire fleet can be deployed on a map of the given size.
 
-    This function attempts to deploy the fleet on the map multiple times.
-    If it succeeds at least once, it returns True. Otherwise, it returns
-    False.
+    The answer comes from fleet_fits_on_map, which is cached, so settings
+    screens asking the same question again get the answer straight away.
+    It is exact unless the search gave up on a very crowded map. Then the
+    fleet is deployed at random (see fleet_fits_by_deploying), and it is
+    accepted only if one of the deployments succeeds. That answer is cached
+    the same way.
 
     Args:
-    - map (list of lists): The game map represented as a 2D list.
+    - height (int): The height of the game map.
+    - width (int): The width of the game map.
     - fleet (dict): The current state of the fleet.
+    - gaps_on_map (bool): If True, ships can not touch each other.
 
     Returns:
     - bool: True if the fleet can be deployed on the map, False otherwise.
     """
+    ship_sizes = fleet_signature(fleet)
+    fits = fleet_fits_on_map(height, width, ship_sizes, gaps_on_map)
+    if fits is FLEET_FIT_UNKNOWN:
+        # Too many placements to check them all, try deploying it instead
+        if fleet_fits_by_deploying(height, width, ship_sizes, gaps_on_map):
+            return True
+        print("Unable to confirm that the fleet fits on the map, try "
+              "fewer or smaller ships.")
+        return False
+    if fits:
+        return True
+
+    print("Unable to fit the fleet on the map.")
+    return False
+
+
+def fleet_signature(fleet):
+    """
+    Describe a fleet by the sizes of its ships only.
 
-    # Loop 50 times to try and fit the fleet on the map
-    # This accounts for the randomness in ship placement
-    for i in range(50):
-        # Create a deep copy of the fleet for temporary manipulation
-        tmp_fleet = copy.deepcopy(fleet)
+    Names and coordinates do not change where ships fit, so two fleets with
+    the same signature always fit on the same maps.
+
+    Args:
+    - fleet (dict): The fleet of ships.
+
+    Returns:
+    - tuple: Size of every ship in the fleet, biggest first.
+    """
+    return tuple(sorted((ship_info["Size"] for ship_info in fleet.values()
+                         for _ in range(ship_info["Quantity"])),
+                        reverse=True))
+
+
+@functools.lru_cache(maxsize=FLEET_FIT_CACHE_SIZE)
+def fleet_fits_on_map(height, width, ship_sizes, gaps_on_map):
+    """
+    Find out if ships of the given sizes can all be placed on the map.
+
+    Cheap bounds are checked first: every ship has to fit in a row or a
+    column, and the ships have to fit by area. With gaps every ship of
+    size n reserves a (n + 1) x 2 block on a map one row and one column
+    bigger, so the area bound is taken on that map. Only then ships are
+    placed one by one, biggest first, by a backtracking search over
+    placement bitmasks (see fleet_fits_search).
+
+    Args:
+    - height (int): The height of the game map.
+    - width (int): The width of the game map.
+    - ship_sizes (tuple): Sizes of all ships, biggest first, see
+    fleet_signature.
+    - gaps_on_map (bool): If True, ships can not touch each other.
+
+    Returns:
+    - bool: True if all ships can be placed, False otherwise. A search which
+    would take more than FLEET_FIT_SEARCH_LIMIT placements, or more ships
+    than the recursion limit, is answered with FLEET_FIT_UNKNOWN, which is
+    cached like the other answers.
+    """
+    if not ship_sizes:
+        return True
+    if height < 1 or width < 1 or ship_sizes[0] > max(height, width):
+        return False
+
+    # Area bounds
+    if sum(ship_sizes) > height * width:
+        return False
+    if gaps_on_map and sum(2 * (size + 1) for size in ship_sizes) > (
+            height + 1) * (width + 1):
+        return False
+
+    search = {"height": height, "width": width, "gaps_on_map": gaps_on_map,
+              "ship_sizes": ship_sizes, "failed": set(),
+              "placements_left": FLEET_FIT_SEARCH_LIMIT,
+              # Remaining ship cells from each ship on, for area pruning
+              "cells_left": [sum(ship_sizes[index:]) for index in range(
+                  len(ship_sizes))]}
+    try:
+        if fleet_fits_search(search, 0, 0, None):
+            return True
+    except RecursionError:  # Thousands of ships, too many to place
+        return FLEET_FIT_UNKNOWN
+    # A search out of budget gave up before trying every placement
+    if search["placements_left"] < 0:
+        return FLEET_FIT_UNKNOWN
+    return False
+
+
+@functools.lru_cache(maxsize=FLEET_FIT_CACHE_SIZE)
+def fleet_fits_by_deploying(height, width, ship_sizes, gaps_on_map):
+    """
+    Find out if ships of the given sizes fit by deploying them at random,
+    the way the CPU fleet is deployed in the game, up to
+    FLEET_FIT_DEPLOY_ATTEMPTS times.
+
+    Used when fleet_fits_on_map gives up. A failed deployment does not
+    prove that the ships do not fit, but a crowded map is then rejected
+    rather than risking a game which can not be deployed.
+
+    Args:
+    - height (int): The height of the game map.
+    - width (int): The width of the game map.
+    - ship_sizes (tuple): Sizes of all ships, biggest first, see
+    fleet_signature.
+    - gaps_on_map (bool): If True, ships can not touch each other.
+
+    Returns:
+    - bool: True if one of the deployments succeeded.
+    """
+    # Names do not change where ships fit, one entry per ship size
+    fleet = {f"Size {size}": {"Size": size,
+                              "Quantity": ship_sizes.count(size),
+                              "Coordinates": []}
+             for size in sorted(set(ship_sizes), reverse=True)}
+    state = GameState(height, width, fleet, gaps_on_map)
+    for _ in range(FLEET_FIT_DEPLOY_ATTEMPTS):
+        map_game = create_map(height, width, CELL_EMPTY)
+        if cpu_deploy_all_ships(state, map_game, copy.deepcopy(fleet),
+                                gaps_on_map):
+            return True
+    return False
+
+
+def fleet_fits_search(search, index, blocked, previous):
+    """
+    Place the ship number 'index' and all smaller ones on the map, trying
+    every legal placement of it before giving up.
+
+    Legal anchors of a ship are found for all cells at once by shifting
+    the bitboard of free cells. Ships of the same size are interchangeable,
+    so each one is placed after the previous one (by bit index, then
+    horizontal before vertical), and states (ship, blocked map, previous
+    ship) already known to fail are not searched again.
+
+    Args:
+    - search (dict): Map size, gap setting, ship sizes, failed states and
+    the remaining placement budget.
+    - index (int): Index of the ship to place in search["ship_sizes"].
+    - blocked (int): Bitboard of cells taken by placed ships and their gaps.
+    - previous (tuple): (bit, vertical) of the previous ship if it had the
+    same size, otherwise None.
 
-        # Try to deploy all ships in the fleet onto the map
-        # The 'cpu_deploy_all_ships' function returns False if deployment is
-        # not possible
-        result = cpu_deploy_all_ships(map, tmp_fleet, gaps_on_map)
+    Returns:
+    - bool: True if all remaining ships can be placed.
+    """
+    ship_sizes = search["ship_sizes"]
+    if index == len(ship_sizes):
+        return True
+
+    height, width = search["height"], search["width"]
+    full = bitboard_full(height, width)
+    free = full & ~blocked
+    if search["cells_left"][index] > bin(free).count("1"):
+        return False
+    if (index, blocked, previous) in search["failed"]:
+        return False
+
+    size = ship_sizes[index]
+    horizontal, vertical = fleet_fits_anchors(height, width, free, size)
+    if size == 1:
+        vertical = 0  # A single cell has only one placement per anchor
+
+    # Anchors before the previous ship of the same size were tried already
+    first_bit = previous[0] if previous else 0
+    anchors = (horizontal | vertical) >> first_bit << first_bit
+
+    while anchors:
+        lowest_bit = anchors & -anchors
+        anchors ^= lowest_bit
+        bit = lowest_bit.bit_length() - 1
+        for is_vertical, orientation_anchors in ((False, horizontal),
+                                                 (True, vertical)):
+            if not orientation_anchors & lowest_bit or (
+                    previous and (bit, is_vertical) <= previous):
+                continue
+
+            search["placements_left"] -= 1
+            if search["placements_left"] < 0:
+                return False  # Out of budget, the answer is unknown
+
+            cells = fleet_fits_ship_cells(width, bit, size, is_vertical)
+            if search["gaps_on_map"]:
+                cells = bitboard_dilate(height, width, cells)
+
+            next_previous = None
+            if index + 1 < len(ship_sizes) and ship_sizes[index + 1] == size:
+                next_previous = (bit, is_vertical)
+            if fleet_fits_search(search, index + 1, blocked | cells,
+                                 next_previous):
+                return True
+
+    search["failed"].add((index, blocked, previous))
+    return False
+
+
+def fleet_fits_anchors(height, width, free, size):
+    """
+    Find the anchors (top-left cells) where a ship of the given size fits
+    on the free cells, horizontally and vertically.
+
+    Args:
+    - height (int): The height of the game map.
+    - width (int): The width of the game map.
+    - free (int): Bitboard of the free cells.
+    - size (int): Size of the ship.
+
+    Returns:
+    - tuple: Bitboards of horizontal and vertical anchors.
+    """
+    # Anchors which leave room for the ship before the right edge
+    horizontal = free & bitboard_columns(height, width, 0, width - size + 1)
+    vertical = free
+    for step in range(1, size):
+        horizontal &= free >> step
+        vertical &= free >> (step * width)
+    return horizontal, vertical
+
+
+def fleet_fits_ship_cells(width, bit, size, is_vertical):
+    """
+    Build the bitboard of the cells of a ship.
+
+    Args:
+    - width (int): The width of the game map.
+    - bit (int): Bit index of the top-left cell of the ship.
+    - size (int): Size of the ship.
+    - is_vertical (bool): True for a vertical ship.
+
+    Returns:
+    - int: Bitboard of the ship cells.
+    """
+    if not is_vertical:
+        return ((1 << size) - 1) << bit
+    cells = 0
+    for step in range(size):
+        cells |= 1 << (bit + step * width)
+    return cells
+
+
+def bitboard_dilate(height, width, board):
+    """
+    Grow a bitboard by one cell in all eight directions, the same cells
+    map_allocate_empty_space_for_ship reserves around a ship.
+
+    Args:
+    - height (int): The height of the game map.
+    - width (int): The width of the game map.
+    - board (int): The bitboard to grow.
 
-        # If deployment was successful, break the loop and return True
-        if not result:
-            return result
+    Returns:
+    - int: The grown bitboard, clipped to the map.
+    """
+    first_column = bitboard_columns(height, width, 0, 1)
+    last_column = bitboard_columns(height, width, width - 1, 1)
 
-    # If we've gone through all 50 attempts without success, return False
-    print("Unable to fit the fleet on the map after 50 attempts.")
-    return True
+    # Left and right first, so up and down also cover the corners
+    board |= (board << 1 & ~first_column) | (board >> 1 & ~last_column)
+    board |= board << width | board >> width
+    return board & bitboard_full(height, width)
 
 
 def validate_user_input(input_str, parts, type=None):
@@ -1157,46 +2177,693 @@ def validate_user_input(input_str, parts, type=None):
 --------------"""
 
 
-def create_map(width, height, symbol):
+def create_map(width, height, cell):
     """
-    Initialize a 2D map with a default symbol.
+    Initialize a 2D map with a default cell code.
 
     Args:
         width (int): The width of the map.
         height (int): The height of the map.
-        symbol (str): The default symbol to fill the map with.
+        cell (int): The cell code to fill the map with, usually CELL_EMPTY.
 
     Returns:
-        List[List[str]]: A 2D list initialized with the default symbol.
+        GameMap: A 2D list initialized with the default cell code.
     """
-    return [[symbol for _ in range(height)] for _ in range(width)]
+    return GameMap(width, height, cell)
 
 
-"""Print functions
-----------------"""
+"""Bitboard board engine
+----------------------"""
 
 
-def print_fleet(fleet):
-    """Print the fleet information in a formatted manner.
+# Names of the bitboard layers kept by every GameMap. A cell belongs to at
+# most one layer at a time; a cell in none of them is empty.
+BITBOARD_LAYERS = ("occupied", "shot", "hit", "exclusion")
 
-    Args:
-        fleet (dict): Dictionary containing fleet information.
+# Maps with at least this many cells are searched with NumPy when it is
+# installed. On smaller maps the cost of calling into NumPy is higher than
+# the pure Python search it replaces.
+NUMPY_MIN_CELLS = 1024
+
+# Up to this many anchors are added to a NumPy placement density one bit
+# at a time, more are unpacked from the bitboard in one go. Maps without
+# NumPy always take them bit by bit.
+DENSITY_SPARSE_ANCHORS = 32
+
+# Number of window cell offsets (see density_window_offsets) kept between
+# calls, one per map width and window shape, and of densities of an empty
+# map (see density_of_empty_map), one per map size and fleet left.
+DENSITY_OFFSETS_CACHE_SIZE = 256
+DENSITY_EMPTY_MAP_CACHE_SIZE = 64
+
+# Number of column masks (see bitboard_columns) kept between calls. A game
+# only asks for a few, one per map size and ship size.
+BITBOARD_COLUMNS_CACHE_SIZE = 64
+
+
+class GameMap(list):
+    """
+    A 2D game map (list of rows) that also keeps its state as bitboards.
+
+    The rows are bytearrays of cell codes (CELL_EMPTY and SHIP_CELLS),
+    turned into symbols only when the map is printed, and all occupancy
+    and shot queries are answered from Python integers holding one bit per
+    cell. Bit index of a cell is row * width + column.
+
+    Attributes:
+        height (int): Number of rows on the map.
+        width (int): Number of columns on the map.
+        occupied (int): Bitboard of cells holding a ship segment.
+        shot (int): Bitboard of cells marked as a missed shot.
+        hit (int): Bitboard of cells marked as a hit.
+        exclusion (int): Bitboard of gap cells reserved around ships.
+        area_index (list): Cached summed-area table of non-empty cells, or
+        None when it has to be rebuilt.
+        placements (dict): Free-placement index, (height, width) of a window
+        mapped to the bitboard of anchors where that window is still free.
+        density (list): Per-cell count of free windows covering the cell,
+        weighted by density_weights, or None before it is first needed. A
+        NumPy array on maps searched with NumPy.
+        density_weights (dict): (height, width) of a window mapped to how
+        many ships of that shape are counted in density.
     """
-    print("{: <20} {: <10} {: <10}".format(
-        "ShipType", "Size", "Quantity"))
-    print("=" * 40)
-    for ship, ship_details in fleet.items():
-        size = ship_details["Size"]
-        quantity = ship_details["Quantity"]
-        print("{: <20} {: <10} {: <10} ".format(
-            ship, size, quantity))
 
+    __slots__ = ("height", "width", "area_index", "placements", "density",
+                 "density_weights") + BITBOARD_LAYERS
 
-def print_fleet_with_coodinates(fleet):
-    """Print the fleet information in a formatted manner.
+    def __init__(self, height, width, cell):
+        super().__init__(bytearray((cell,)) * width for _ in range(height))
+        self.height = height
+        self.width = width
+        self.occupied = 0
+        self.shot = 0
+        self.hit = 0
+        self.exclusion = 0
+        self.area_index = None
+        self.placements = {}
+        self.density = None
+        self.density_weights = {}
+
+
+def bitboard_full(height, width):
+    """
+    Return a bitboard with every cell of a height x width map set.
 
     Args:
-        fleet (dict): Dictionary containing fleet information.
+        height (int): Number of rows on the map.
+        width (int): Number of columns on the map.
+
+    Returns:
+        int: Bitboard with height * width bits set.
+    """
+    return (1 << (height * width)) - 1
+
+
+@functools.lru_cache(maxsize=BITBOARD_COLUMNS_CACHE_SIZE)
+def bitboard_columns(height, width, first, count):
+    """
+    Return a bitboard with 'count' columns set from column 'first' on.
+
+    Args:
+        height (int): Number of rows on the map.
+        width (int): Number of columns on the map.
+        first (int): The first column to set.
+        count (int): How many columns to set, nothing is set if below 1.
+
+    Returns:
+        int: Bitboard of the columns on every row.
+    """
+    row_bits = ((1 << max(0, count)) - 1) << first
+    board = 0
+    for row in range(height):
+        board |= row_bits << (row * width)
+    return board
+
+
+def bitboard_cell(map_game, row, column):
+    """
+    Return the bitboard holding only the given cell.
+
+    Args:
+        map_game (GameMap): The game map.
+        row (int): Row index of the cell.
+        column (int): Column index of the cell.
+
+    Returns:
+        int: Bitboard with a single bit set.
+    """
+    return 1 << (row * map_game.width + column)
+
+
+def bitboard_from_coordinates(map_game, coordinates_list):
+    """
+    Convert a list of [row, column] coordinates into a bitboard.
+
+    Coordinates outside of the map boundaries are ignored.
+
+    Args:
+        map_game (GameMap): The game map.
+        coordinates_list (list): List of [row, column] coordinates.
+
+    Returns:
+        int: Bitboard with a bit set for every coordinate on the map.
+    """
+    board = 0
+    for row, column in coordinates_list:
+        if 0 <= row < map_game.height and 0 <= column < map_game.width:
+            board |= 1 << (row * map_game.width + column)
+    return board
+
+
+def bitboard_to_coordinates(map_game, board):
+    """
+    Convert a bitboard into a list of (row, column) tuples in row order.
+
+    Args:
+        map_game (GameMap): The game map.
+        board (int): The bitboard to convert.
+
+    Returns:
+        List[Tuple[int, int]]: Coordinates of every set bit.
+    """
+    width = map_game.width
+    if map_uses_numpy(map_game):
+        rows, columns = np.divmod(np.flatnonzero(bitboard_to_array(
+            map_game, board)), width)
+        return list(zip(rows.tolist(), columns.tolist()))
+    bits = bin(board)[:1:-1]  # Least significant bit first
+    return [divmod(index, width) for index, bit in enumerate(bits)
+            if bit == "1"]
+
+
+def map_uses_numpy(map_game):
+    """
+    Tell if the map is big enough to be searched with NumPy, and NumPy is
+    installed.
+
+    Args:
+        map_game (GameMap): The game map.
+
+    Returns:
+        bool: True if the NumPy search should be used.
+    """
+    return (np is not None and
+            map_game.height * map_game.width >= NUMPY_MIN_CELLS)
+
+
+def bitboard_to_array(map_game, board):
+    """
+    Unpack a bitboard into a 2D NumPy array of booleans.
+
+    Args:
+        map_game (GameMap): The game map.
+        board (int): The bitboard to unpack.
+
+    Returns:
+        numpy.ndarray: Array of shape (height, width), True on set bits.
+    """
+    cells = map_game.height * map_game.width
+    packed = np.frombuffer(board.to_bytes((cells + 7) // 8, "little"),
+                           dtype=np.uint8)
+    bits = np.unpackbits(packed, count=cells, bitorder="little")
+    return bits.reshape(map_game.height, map_game.width).astype(bool)
+
+
+def bitboard_from_array(array):
+    """
+    Pack a 2D NumPy array of booleans into a bitboard.
+
+    Args:
+        array (numpy.ndarray): Array of shape (height, width).
+
+    Returns:
+        int: Bitboard with a bit set for every True cell.
+    """
+    packed = np.packbits(array.ravel(), bitorder="little")
+    return int.from_bytes(packed.tobytes(), "little")
+
+
+def bitboard_empty(map_game):
+    """
+    Return the bitboard of empty cells (no ship, shot, hit or gap).
+
+    Args:
+        map_game (GameMap): The game map.
+
+    Returns:
+        int: Bitboard of cells which are still empty.
+    """
+    return bitboard_full(map_game.height, map_game.width) & ~(
+        map_game.occupied | map_game.shot | map_game.hit |
+        map_game.exclusion)
+
+
+def map_has_taken_cells(map_game):
+    """
+    Check if any cell of the map holds a ship, a shot, a hit or a gap.
+
+    Args:
+        map_game (GameMap): The game map.
+
+    Returns:
+        bool: False while the whole map is empty.
+    """
+    return bool(map_game.occupied | map_game.shot | map_game.hit |
+                map_game.exclusion)
+
+
+def map_build_area_index(map_game):
+    """
+    Build the summed-area table (integral image) of non-empty cells.
+
+    Entry [row][column] holds the number of non-empty cells in the
+    rectangle above and left of that point, so the table has one extra
+    leading row and column of zeros. It is built in a single pass over the
+    map.
+
+    Args:
+        map_game (GameMap): The game map.
+
+    Returns:
+        List[List[int]]: The (height + 1) x (width + 1) summed-area table.
+    """
+    width = map_game.width
+    empty = bitboard_empty(map_game)
+    area_index = [[0] * (width + 1)]
+    for row in range(map_game.height):
+        row_bits = (empty >> (row * width)) & ((1 << width) - 1)
+        previous = area_index[-1]
+        totals = [0]
+        running = 0
+        for column in range(width):
+            if not row_bits >> column & 1:
+                running += 1
+            totals.append(previous[column + 1] + running)
+        area_index.append(totals)
+    return area_index
+
+
+def map_get_area_index(map_game):
+    """
+    Return the summed-area table of the map, building it only when needed.
+
+    The table is cached on the map and dropped by map_mark_cells, so it is
+    reused by every search made between two changes of the map, e.g. the
+    whole shrinking window loop of one CPU move.
+
+    Args:
+        map_game (GameMap): The game map.
+
+    Returns:
+        List[List[int]]: The summed-area table of non-empty cells.
+    """
+    if map_game.area_index is None:
+        map_game.area_index = map_build_area_index(map_game)
+    return map_game.area_index
+
+
+def map_mark_cells(map_game, board, layer):
+    """
+    Move the cells of a bitboard into one bitboard layer of the map.
+
+    The cells are removed from every other layer first, so each cell keeps
+    a single state, the same way a cell holds a single symbol.
+
+    Args:
+        map_game (GameMap): The game map.
+        board (int): Bitboard of the cells to mark.
+        layer (str): One of BITBOARD_LAYERS, or None to mark cells empty.
+    """
+    for name in BITBOARD_LAYERS:
+        setattr(map_game, name, getattr(map_game, name) & ~board)
+    if layer:
+        setattr(map_game, layer, getattr(map_game, layer) | board)
+        # Cells were taken, only anchors overlapping them become illegal
+        map_placements_invalidate(map_game, board)
+    else:
+        # Cells were freed, anchors can only be found again from scratch
+        map_game.placements = {}
+        map_game.density = None
+        map_game.density_weights = {}
+
+    # The cached summed-area table no longer matches the map
+    map_game.area_index = None
+
+
+def map_placements_invalidate(map_game, board):
+    """
+    Drop from the free-placement index every anchor overlapping the board.
+
+    An anchor of a height x width window overlaps a taken cell when the
+    cell is at most height - 1 rows below and width - 1 columns right of
+    it, so the taken cells are spread up and left by that much and removed
+    from the anchors. Bits which wrap into the previous row land on anchors
+    too close to the right edge, which are never in the index. Windows
+    counted in the placement density are taken out of it as well.
+
+    Args:
+        map_game (GameMap): The game map.
+        board (int): Bitboard of the cells which were taken.
+    """
+    map_width = map_game.width
+    density_weights = map_game.density_weights
+    # Small maps drop windows from their density list right here, a shot
+    # drops only a few and a call per window size costs more than that
+    density_list = (map_game.density if density_weights and
+                    not map_uses_numpy(map_game) else None)
+
+    # Spreads are built once per window width and height and shared by all
+    # window sizes of the index
+    row_spreads = [board]
+    column_spreads = {}
+    for (height, width), anchors in map_game.placements.items():
+        if not anchors:
+            continue  # Nothing left to drop
+        while len(row_spreads) < width:
+            row_spreads.append(row_spreads[-1] | board >> len(row_spreads))
+        spreads = column_spreads.setdefault(width, [row_spreads[width - 1]])
+        while len(spreads) < height:
+            shift = len(spreads) * map_width
+            spreads.append(spreads[-1] | spreads[0] >> shift)
+        dropped = anchors & spreads[height - 1]
+        if not dropped:
+            continue
+        map_game.placements[height, width] = anchors ^ dropped
+
+        # Only the windows crossing the taken cells leave the density
+        weight = density_weights.get((height, width))
+        if not weight:
+            continue
+        if density_list is None:
+            map_density_add(map_game, height, width, dropped, -weight)
+        else:
+            density_list_add(density_list, density_window_offsets(
+                map_width, height, width), dropped, -weight)
+
+
+def map_free_anchors(map_game, height, width):
+    """
+    Return the bitboard of anchors where a height x width window is free.
+
+    The answer comes from the free-placement index of the map. A window
+    size asked for the first time is found with search_map_for_pattern, or
+    straight from the map size while nothing is taken, and from then on it
+    is kept up to date by map_mark_cells.
+
+    Args:
+        map_game (GameMap): The game map.
+        height (int): The height of the window.
+        width (int): The width of the window.
+
+    Returns:
+        int: Bitboard of the top-left anchors of free windows.
+    """
+    anchors = map_game.placements.get((height, width))
+    if anchors is None:
+        if not map_has_taken_cells(map_game):
+            # Every window which fits the map is free
+            anchors = bitboard_columns(map_game.height - height + 1,
+                                       map_game.width, 0,
+                                       map_game.width - width + 1)
+        elif map_uses_numpy(map_game):
+            anchors = map_scan_for_anchors_numpy(map_game, height, width)
+        else:
+            anchors = bitboard_from_coordinates(
+                map_game, map_scan_for_pattern(map_game, height, width))
+        map_game.placements[height, width] = anchors
+    return anchors
+
+
+def map_scan_for_anchors_numpy(map_game, height, width):
+    """
+    Find the anchors of all free height x width windows with NumPy.
+
+    The map is turned into an int8 grid of taken cells and its summed-area
+    table is built with two cumulative sums, so every window of the map is
+    checked in the same few array operations, the same way
+    map_scan_for_pattern does it cell by cell.
+
+    Args:
+        map_game (GameMap): The game map.
+        height (int): The height of the window, at least 1.
+        width (int): The width of the window, at least 1.
+
+    Returns:
+        int: Bitboard of the top-left anchors of free windows.
+    """
+    taken = (~bitboard_to_array(map_game, bitboard_empty(map_game))).astype(
+        np.int8)
+    area_index = np.zeros((map_game.height + 1, map_game.width + 1),
+                          dtype=np.int32)
+    area_index[1:, 1:] = taken.cumsum(axis=0, dtype=np.int32).cumsum(axis=1)
+
+    # Taken cells in every window, one entry per anchor which fits the map
+    window_sums = (area_index[height:, width:] - area_index[:-height, width:]
+                   - area_index[height:, :-width] +
+                   area_index[:-height, :-width])
+
+    anchors = np.zeros((map_game.height, map_game.width), dtype=bool)
+    anchors[:window_sums.shape[0], :window_sums.shape[1]] = window_sums == 0
+    return bitboard_from_array(anchors)
+
+
+def map_density_add(map_game, height, width, anchors, weight):
+    """
+    Add the cells of every window anchored on the bitboard to the placement
+    density of the map.
+
+    Args:
+        map_game (GameMap): The game map, its density has to be built.
+        height (int): The height of the windows.
+        width (int): The width of the windows.
+        anchors (int): Bitboard of the top-left anchors of the windows.
+        weight (int): Added to every covered cell, negative to remove the
+        windows.
+    """
+    density = map_game.density
+    offsets = density_window_offsets(map_game.width, height, width)
+
+    # Small maps are taken bit by bit straight into the list, that is
+    # cheaper than any call into NumPy or a coordinate list
+    if not map_uses_numpy(map_game):
+        density_list_add(density, offsets, anchors, weight)
+        return
+
+    # A shot drops only a few windows, those are taken bit by bit, a whole
+    # board is cheaper to unpack in one go
+    if bin(anchors).count("1") <= DENSITY_SPARSE_ANCHORS:
+        anchor_cells = []
+        while anchors:
+            lowest_bit = anchors & -anchors
+            anchor_cells.append(lowest_bit.bit_length() - 1)
+            anchors ^= lowest_bit
+    else:
+        anchor_cells = np.flatnonzero(bitboard_to_array(map_game, anchors))
+
+    # All covered cells go in one call, windows overlap so the same cell
+    # can be in the list many times
+    np.add.at(density, (np.asarray(anchor_cells, dtype=np.intp)[
+        :, None] + offsets).ravel(), weight)
+
+
+def density_list_add(density, offsets, anchors, weight):
+    """
+    Add the cells of every window anchored on the bitboard to a placement
+    density kept as a list, one anchor bit at a time.
+
+    Args:
+        density (list): Per-cell counts, changed in place.
+        offsets (tuple): Window cells relative to the anchor, see
+        density_window_offsets.
+        anchors (int): Bitboard of the top-left anchors of the windows.
+        weight (int): Added to every covered cell, negative to remove the
+        windows.
+    """
+    while anchors:
+        lowest_bit = anchors & -anchors
+        anchor = lowest_bit.bit_length() - 1
+        for offset in offsets:
+            density[anchor + offset] += weight
+        anchors ^= lowest_bit
+
+
+@functools.lru_cache(maxsize=DENSITY_EMPTY_MAP_CACHE_SIZE)
+def density_of_empty_map(height, width, weights):
+    """
+    Build the placement density of a map where nothing is taken yet.
+
+    It only depends on the map size and the weights, so every game played
+    with the same settings starts hunting from the same counts.
+
+    Args:
+        height (int): Number of rows on the map.
+        width (int): Number of columns on the map.
+        weights (tuple): ((height, width), weight) of every counted window
+        shape, sorted.
+
+    Returns:
+        tuple: Weighted count of windows covering every cell.
+    """
+    density = [0] * (height * width)
+    for (window_height, window_width), weight in weights:
+        density_list_add(density, density_window_offsets(
+            width, window_height, window_width), bitboard_columns(
+            height - window_height + 1, width, 0, width - window_width + 1),
+            weight)
+    return tuple(density)
+
+
+@functools.lru_cache(maxsize=DENSITY_OFFSETS_CACHE_SIZE)
+def density_window_offsets(map_width, height, width):
+    """
+    Return the bit index of every cell of a window relative to its anchor.
+
+    Args:
+        map_width (int): Number of columns on the map.
+        height (int): The height of the window.
+        width (int): The width of the window.
+
+    Returns:
+        tuple: Offsets of the window cells, row by row.
+    """
+    return tuple(row * map_width + column for row in range(height)
+                 for column in range(width))
+
+
+def map_density_set_weights(map_game, weights):
+    """
+    Make the placement density of the map count the given window shapes.
+
+    The density is built the first time it is needed. After that only the
+    shapes whose weight changed (a ship was sunk) are added or removed, and
+    shots keep it up to date through map_placements_invalidate.
+
+    Args:
+        map_game (GameMap): The game map.
+        weights (dict): (height, width) of a window mapped to how many ships
+        of that shape are left.
+    """
+    # Nothing was sunk since the last call, shots kept the density up to
+    # date on their own
+    if map_game.density is not None and weights == map_game.density_weights:
+        return
+
+    if map_game.density is None:
+        cells = map_game.height * map_game.width
+        if map_uses_numpy(map_game):
+            map_game.density = np.zeros(cells, dtype=np.int64)
+        elif not map_has_taken_cells(map_game):
+            # The first hunt of a game starts from the cached counts, the
+            # index still gets every window shape so shots can update them
+            for height, width in weights:
+                map_free_anchors(map_game, height, width)
+            map_game.density = list(density_of_empty_map(
+                map_game.height, map_game.width, tuple(sorted(
+                    weights.items()))))
+            map_game.density_weights = {window: weight for window, weight
+                                        in weights.items() if weight}
+            return
+        else:
+            map_game.density = [0] * cells
+        map_game.density_weights = {}
+
+    old_weights = map_game.density_weights
+    for height, width in set(old_weights) | set(weights):
+        change = (weights.get((height, width), 0) -
+                  old_weights.get((height, width), 0))
+        if change:
+            map_density_add(map_game, height, width, map_free_anchors(
+                map_game, height, width), change)
+
+    map_game.density_weights = {window: weight for window, weight in
+                                weights.items() if weight}
+
+
+"""Fleet cell index
+-----------------"""
+
+
+class Fleet(dict):
+    """
+    A fleet dictionary which also indexes every deployed ship cell.
+
+    The dictionary itself is the usual fleet ({ship_name: {"Size",
+    "Quantity", "Coordinates"}}). The extra `cells` attribute maps a
+    (row, column) tuple to (ship_name, coordinates_set_id, coordinates_id),
+    so the ship under a shot is found in O(1).
+
+    Attributes:
+        cells (dict): Index of ship cells, kept in sync by
+        fleet_add_ship_coordinates and remove_coordinates_from_fleet.
+    """
+
+    __slots__ = ("cells",)
+
+    def __init__(self, fleet=()):
+        super().__init__(fleet)
+        self.cells = {}
+        for ship_name in self:
+            fleet_index_ship(self, ship_name)
+
+
+def fleet_index_ship(fleet, ship_name):
+    """
+    (Re)build the cell index entries of every ship of one type.
+
+    Args:
+        fleet (Fleet): The fleet to update.
+        ship_name (str): The ship type to index.
+    """
+    for coordinates_set_id, ship_coordinates_list in enumerate(
+            fleet[ship_name]["Coordinates"]):
+        for coordinates_id, (row, column) in enumerate(
+                ship_coordinates_list):
+            fleet.cells[row, column] = (ship_name, coordinates_set_id,
+                                        coordinates_id)
+
+
+def fleet_add_ship_coordinates(fleet, ship_name, coordinates_list):
+    """
+    Append the coordinates of a deployed ship and index its cells.
+
+    Args:
+        fleet (Fleet): The fleet the ship belongs to.
+        ship_name (str): The ship type.
+        coordinates_list (list): The [row, column] cells of the ship.
+    """
+    ship_coordinates = fleet[ship_name]["Coordinates"]
+    coordinates_set_id = len(ship_coordinates)
+    ship_coordinates.append(coordinates_list)
+    for coordinates_id, (row, column) in enumerate(coordinates_list):
+        fleet.cells[row, column] = (ship_name, coordinates_set_id,
+                                    coordinates_id)
+
+
+"""Print functions
+----------------"""
+
+
+def print_fleet(fleet):
+    """Print the fleet information in a formatted manner.
+
+    Args:
+        fleet (dict): Dictionary containing fleet information.
+    """
+    print("{: <20} {: <10} {: <10}".format(
+        "ShipType", "Size", "Quantity"))
+    print("=" * 40)
+    for ship, ship_details in fleet.items():
+        size = ship_details["Size"]
+        quantity = ship_details["Quantity"]
+        print("{: <20} {: <10} {: <10} ".format(
+            ship, size, quantity))
+
+
+def print_fleet_with_coodinates(fleet):
+    """Print the fleet information in a formatted manner.
+
+    Args:
+        fleet (dict): Dictionary containing fleet information.
     """
     print("{: <20} {: <10} {: <10} {: <50}".format(
         "ShipType", "Size", "Quantity", "Coordinates"))
@@ -1210,352 +2877,1258 @@ def print_fleet_with_coodinates(fleet):
             ship, size, quantity, coordinates))
 
 
-def print_map(map_game):
+def print_map(state, map_game):
     """
     Print the game map in a human-readable format.
 
     Args:
+        state (GameState): The game whose row and column labels are printed.
         map_game (list): A 2D list representing the game map,
                          where each cell contains the status of a ship
                          or water.
 
-    Output:
-        The function will print the game map to the console.
+    Output:
+        The function will print the game map to the console, built by
+        render_map and written in one go.
+    """
+    sys.stdout.write(render_map(state, map_game))
+
+
+def print_two_maps(state, map_left, map_right, label_left, label_right,
+                   gap=10):
+    """
+    Print two 2D maps side by side with labels and a customizable gap.
+
+    The whole frame is built by render_two_maps and written in one go.
+
+    Args:
+        state (GameState): The game whose row and column labels are printed.
+        map_left (list): A 2D list representing the first map.
+        map_right (list): A 2D list representing the second map.
+        label_left (str): Label for the first map.
+        label_right (str): Label for the second map.
+        gap (int): Number of blank spaces between the two maps. Default is 10.
+    """
+    sys.stdout.write(render_two_maps(state, map_left, map_right, label_left,
+                                     label_right, gap))
+
+
+def print_map_and_list(state, map_left, instructions, label_left, gap=10):
+    """
+    Print a 2D map and a list side by side with labels and a customizable gap.
+
+    The whole frame is built by render_map_and_list and written in one go.
+
+    Args:
+        state (GameState): The game whose row and column labels are printed.
+        map_left (list): A 2D list representing the first map.
+        instructions (list): A list of strings representing the instructions.
+        label_left (str): Label for the first map.
+        gap (int): Number of blank spaces between the map and the
+        instructions. Default is 10.
+    """
+    sys.stdout.write(render_map_and_list(state, map_left, instructions,
+                                         label_left, gap))
+
+
+def print_map_and_fleet_aligned_columns(state, map_left, fleet, label_left,
+                                        gap=10):
+    """
+    Print a 2D map and a fleet dictionary with aligned columns side by side,
+    and with a customizable gap.
+
+    The whole frame is built by render_map_and_fleet_aligned_columns and
+    written in one go.
+
+    Args:
+        state (GameState): The game whose row and column labels are printed.
+        map_left (list): A 2D list representing the first map.
+        fleet (dict): A dictionary representing the fleet.
+        label_left (str): Label for the first map.
+        gap (int): Number of blank spaces between the map and the fleet
+        information. Default is 10.
+    """
+    sys.stdout.write(render_map_and_fleet_aligned_columns(
+        state, map_left, fleet, label_left, gap))
+
+
+def print_aligned_log(log_data, gap=10, count=None, start=None):
+    """
+    Prints log data in aligned columns with predefined labels and a
+    customizable gap.
+
+    Long logs can be printed a page at a time: only 'count' entries from
+    'start' are formatted and printed, or the last 'count' entries if no
+    start is given, so ending a big game does not flood the terminal.
+
+    Args:
+        log_data (list): A list of log entries (or an ActionLog). Each entry
+        is a list containing information about the player, time, row,
+        column, and result.
+        gap (int): Number of blank spaces between log columns. Default is 10
+        count (int, optional): How many entries to print, all by default.
+        start (int, optional): Index of the first entry to print. Default
+        is the start of the last 'count' entries.
+
+    Example:
+        print_aligned_log([['CPU', 0.0658, 4, 5, 'Damaged']], gap=5)
+    """
+    sys.stdout.write(render_aligned_log(log_data, count, start))
+
+
+"""Render functions
+-----------------"""
+
+
+# Parts of a frame which only depend on its layout (map size, labels and
+# gap), built once by the layout_* functions:
+# - header: Title, column headers and separator lines, with new lines
+# - row_prefixes: Row label and separator in front of every map row
+# - cell_padding: Spaces in front of every cell value
+# - cell_end: Spaces after every cell value
+# - gap: Spaces between a map and what is next to it
+# - blank: Spaces in place of a map row, when the text next to the map is
+#   longer than the map
+FrameLayout = collections.namedtuple("FrameLayout",
+                                     ["header", "row_prefixes",
+                                      "cell_padding", "cell_end", "gap",
+                                      "blank"])
+
+
+def render_aligned_log(log_data, count=None, start=None):
+    """
+    Build the text of print_aligned_log.
+
+    Every printed entry is turned into strings once, and column widths are
+    found from those strings, so the log is read in a single pass. Entries
+    outside the printed page are not read at all, which keeps the messages
+    of an ActionLog unformatted. An ActionLog which keeps only its latest
+    entries counts the dropped ones as earlier entries not shown.
+
+    Args:
+        log_data (list): A list of log entries, or an ActionLog.
+        count (int, optional): How many entries to print, all by default.
+        start (int, optional): Index of the first entry to print. Default
+        is the start of the last 'count' entries.
+
+    Returns:
+        str: The aligned log, every line ending with a new line.
+    """
+    # Find the page of entries to print
+    total = len(log_data)
+    if count is None:
+        start, stop = 0, total
+    else:
+        if start is None:
+            start = max(0, total - count)
+        stop = min(total, start + count)
+
+    # Predefined labels for the columns, then every entry as strings
+    rows = [LOG_LABELS]
+    rows.extend([str(value) for value in entry] for entry in
+                log_data[start:stop])
+
+    # Calculate the maximum width for each column to align the data
+    max_widths = [max(len(cell) for cell in column) for column in zip(
+        *rows)]
+
+    # Tell what is left out, so a page is not mistaken for the whole log.
+    # Entries dropped from a full ActionLog ring were never shown either.
+    earlier = start
+    if isinstance(log_data, ActionLog):
+        earlier += log_data.total - total
+    lines = []
+    if earlier > 0:
+        lines.append(f"... {earlier} earlier entries not shown\n")
+    for row in rows:
+        lines.append(" | ".join(f"{cell: <{width}}" for cell, width in zip(
+            row, max_widths)) + "\n")
+    if stop < total:
+        lines.append(f"... {total - stop} later entries not shown\n")
+
+    return "".join(lines)
+
+
+def render_map(state, map_game):
+    """
+    Build the text of print_map.
+
+    Args:
+        state (GameState): The game whose row and column labels are used.
+        map_game (list): A 2D list representing the game map.
+
+    Returns:
+        str: The whole map, every line ending with a new line.
+    """
+    layout = layout_map(len(map_game), len(map_game[0]),
+                        tuple(state.column_indexes[:len(map_game)]),
+                        tuple(state.row_indexes[:len(map_game[0])]))
+    return layout.header + "".join(
+        prefix + render_map_cells(row, layout, state.cell_symbols) + "\n"
+        for prefix, row in zip(layout.row_prefixes, map_game))
+
+
+def render_map_cells(row, layout, symbols):
+    """
+    Build the cells of one map row, padded the way the layout says.
+
+    Args:
+        row (bytearray): Cell codes of the row.
+        layout (FrameLayout): Layout of the frame the row is part of.
+        symbols (tuple): Symbol printed for every cell code, CELL_SYMBOLS
+        or CELL_SYMBOLS_PLAIN.
+
+    Returns:
+        str: The cells, without the row label and without a new line.
+    """
+    # Padding and end of neighbour cells are joined into one separator
+    return (layout.cell_padding + (layout.cell_end + layout.cell_padding).join(
+        map(symbols.__getitem__, row)) + layout.cell_end)
+
+
+def render_two_maps(state, map_left, map_right, label_left, label_right,
+                    gap=10):
+    """
+    Build the text of print_two_maps.
+
+    Args:
+        state (GameState): The game whose row and column labels are used.
+        map_left (list): A 2D list representing the first map.
+        map_right (list): A 2D list representing the second map.
+        label_left (str): Label for the first map.
+        label_right (str): Label for the second map.
+        gap (int): Number of blank spaces between the two maps. Default is 10.
+
+    Returns:
+        str: The whole frame, every line ending with a new line.
+    """
+    width = max(len(map_left[0]), len(map_right[0]))
+    layout = layout_two_maps(len(map_left), len(map_left[0]),
+                             len(map_right[0]),
+                             tuple(state.row_indexes[:len(map_left)]),
+                             tuple(state.column_indexes[:width]),
+                             label_left, label_right, gap)
+
+    # Rows of both maps with the gap between them
+    return layout.header + "".join(
+        prefix + render_map_cells(row_left, layout, state.cell_symbols) +
+        layout.gap + prefix +
+        render_map_cells(row_right, layout, state.cell_symbols) + "\n" for
+        prefix, row_left, row_right in zip(layout.row_prefixes, map_left,
+                                           map_right))
+
+
+def render_map_and_side_lines(state, map_left, header, side_lines,
+                              label_left, gap):
+    """
+    Build a frame with a map on the left and lines of text on its right,
+    shared by render_map_and_list and render_map_and_fleet_aligned_columns.
+
+    Args:
+        state (GameState): The game whose row and column labels are used.
+        map_left (list): A 2D list representing the map.
+        header (str): Text printed right of the column headers.
+        side_lines (list): Lines printed right of the map rows.
+        label_left (str): Label for the map.
+        gap (int): Number of blank spaces between the map and the text.
+
+    Returns:
+        str: The whole frame, every line ending with a new line.
+    """
+    layout = layout_map_and_side_lines(
+        len(map_left), len(map_left[0]),
+        tuple(state.row_indexes[:len(map_left)]),
+        tuple(state.column_indexes[:len(map_left[0])]), header, label_left,
+        gap)
+
+    # Rows of the map with the text next to them
+    lines = [layout.header]
+    for row_index in range(max(len(map_left), len(side_lines))):
+        if row_index < len(map_left):
+            line = layout.row_prefixes[row_index] + render_map_cells(
+                map_left[row_index], layout, state.cell_symbols)
+        else:
+            line = layout.blank
+        line += layout.gap
+        if row_index < len(side_lines):
+            line += side_lines[row_index]
+        lines.append(line + "\n")
+
+    return "".join(lines)
+
+
+def render_map_and_list(state, map_left, instructions, label_left, gap=10):
+    """
+    Build the text of print_map_and_list.
+
+    Args:
+        state (GameState): The game whose row and column labels are used.
+        map_left (list): A 2D list representing the first map.
+        instructions (list): A list of strings representing the instructions.
+        label_left (str): Label for the first map.
+        gap (int): Number of blank spaces between the map and the
+        instructions. Default is 10.
+
+    Returns:
+        str: The whole frame, every line ending with a new line.
+    """
+    return render_map_and_side_lines(state, map_left, "Instructions",
+                                     instructions, label_left, gap)
+
+
+def render_map_and_fleet_aligned_columns(state, map_left, fleet, label_left,
+                                         gap=10):
+    """
+    Build the text of print_map_and_fleet_aligned_columns.
+
+    Args:
+        state (GameState): The game whose row and column labels are used.
+        map_left (list): A 2D list representing the first map.
+        fleet (dict): A dictionary representing the fleet.
+        label_left (str): Label for the first map.
+        gap (int): Number of blank spaces between the map and the fleet
+        information. Default is 10.
+
+    Returns:
+        str: The whole frame, every line ending with a new line.
+    """
+    # Calculate the maximum lengths for the ship name, size, and quantity
+    # columns for alignment
+    max_ship_name_length = max(len(ship) for ship in fleet.keys())
+    max_size_length = len("Size")
+    max_quantity_length = len("Quantity")
+
+    # Generate the header for the fleet information
+    fleet_header = (f"{'Ship Name': <{max_ship_name_length}} |"
+                    f" {'Size': >{max_size_length}} |"
+                    f" {'Quantity': >{max_quantity_length}}")
+
+    # Convert the fleet dictionary to a list of formatted strings with
+    # aligned columns
+    fleet_str_lines = [
+        (f"{ship: <{max_ship_name_length}} |"
+         f" {props['Size']: >{max_size_length}}"
+         f" | {props['Quantity']: >{max_quantity_length}}")
+        for ship, props in fleet.items()]
+
+    return render_map_and_side_lines(state, map_left, fleet_header,
+                                     fleet_str_lines, label_left, gap)
+
+
+"""Layout functions
+-----------------"""
+
+
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def layout_map(height, width, row_labels, column_labels):
+    """
+    Build the static parts of a print_map frame.
+
+    Args:
+        height (int): The height of the map.
+        width (int): The width of the map.
+        row_labels (tuple): Labels printed in front of the rows.
+        column_labels (tuple): Labels printed above the columns.
+
+    Returns:
+        FrameLayout: The layout of the frame.
+    """
+    # Column headers (0, 1, 2, ..., N) and a separator line under them
+    header = ("   " + "".join(f"{column_labels[col_index]}  " for col_index
+                              in range(width)) + "\n" +
+              "   " + "=" * (width * 3) + "\n")
+
+    # Row header, every cell value is followed by two spaces
+    row_prefixes = tuple(f"{row_labels[row_index]} | " for row_index in
+                         range(height))
+    return FrameLayout(header, row_prefixes, "", "  ", "", "")
+
+
+def layout_map_grid(height, width, row_labels):
+    """
+    Work out the sizes shared by the layouts of maps printed next to other
+    maps or lists.
+
+    Args:
+        height (int): The height of the map.
+        width (int): The width of the map.
+        row_labels (tuple): Labels printed in front of the rows.
+
+    Returns:
+        tuple: Left offset of the map, total width of the map cells, cell
+        padding and the right-justified row prefixes.
+    """
+    # Constants for character dimensions and formatting
+    char_width = len("X")  # Width of a single character (assuming monospaced
+    # font)
+
+    # Calculate the maximum number of digits in row and column indices
+    num_digits_map_width = len(str(width))
+    num_digits_map_height = len(str(height))
+
+    # Calculate the left-side offset for aligning map and row indices
+    print_map_left_offset = " " * (num_digits_map_height + len(" | "))
+    number_char_table_total = width * (num_digits_map_width + char_width + 1)
+
+    # Every cell is right-justified to the label width, so it gets as many
+    # spaces in front as the height of the map has digits
+    cell_padding = " " * num_digits_map_height
+    row_prefixes = tuple(f"{row_labels[row_index]}".rjust(
+        num_digits_map_width + 1) + " | " for row_index in range(height))
+    return (print_map_left_offset, number_char_table_total, cell_padding,
+            row_prefixes)
+
+
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def layout_two_maps(height, width_left, width_right, row_labels,
+                    column_labels, label_left, label_right, gap):
+    """
+    Build the static parts of a print_two_maps frame.
+
+    Args:
+        height (int): The height of the maps.
+        width_left (int): The width of the first map.
+        width_right (int): The width of the second map.
+        row_labels (tuple): Labels printed in front of the rows.
+        column_labels (tuple): Labels printed above the columns.
+        label_left (str): Label for the first map.
+        label_right (str): Label for the second map.
+        gap (int): Number of blank spaces between the two maps.
+
+    Returns:
+        FrameLayout: The layout of the frame.
+    """
+    print_map_left_offset, number_char_table_total, cell_padding, \
+        row_prefixes = layout_map_grid(height, width_left, row_labels)
+    num_digits_map_width = len(str(width_left))
+    num_digits_map_height = len(str(height))
+    char_width = len("X")
+
+    # Create a string of blank spaces for the gap between maps
+    gap_str = ' ' * gap
+
+    # Centered labels for both maps
+    label_left_centered = label_left.center(number_char_table_total)
+    label_right_centered = label_right.center(number_char_table_total)
+    header = (f"{print_map_left_offset}{label_left_centered}"
+              f"{gap_str}{print_map_left_offset} {label_right_centered}\n")
+
+    # Column headers for both maps, right-justified with proper spacing
+    headers_left = " ".join(f"{column_labels[col_index]}".rjust(
+        num_digits_map_height + char_width) for col_index in range(
+        width_left))
+    headers_right = "".join(f"{column_labels[col_index]}".rjust(
+        num_digits_map_height + char_width) + " " for col_index in range(
+        width_right))
+    header += (f"{print_map_left_offset} {headers_left}{gap_str} "
+               f"{print_map_left_offset} {headers_right}\n")
+
+    # The horizontal separator line to visually separate the maps
+    separator_length_left = width_left * (num_digits_map_width +
+                                          char_width + 1)
+    separator_length_right = width_right * (num_digits_map_width +
+                                            char_width + 1)
+    header += (print_map_left_offset + "=" * separator_length_left +
+               gap_str + " " + print_map_left_offset +
+               "=" * separator_length_right + "\n")
+
+    return FrameLayout(header, row_prefixes, cell_padding, " ", gap_str, "")
+
+
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def layout_map_and_side_lines(height, width, row_labels, column_labels,
+                              header, label_left, gap):
+    """
+    Build the static parts of a frame with a map and lines of text next to
+    it.
+
+    Args:
+        height (int): The height of the map.
+        width (int): The width of the map.
+        row_labels (tuple): Labels printed in front of the rows.
+        column_labels (tuple): Labels printed above the columns.
+        header (str): Text printed right of the column headers.
+        label_left (str): Label for the map.
+        gap (int): Number of blank spaces between the map and the text.
+
+    Returns:
+        FrameLayout: The layout of the frame.
+    """
+    print_map_left_offset, number_char_table_total, cell_padding, \
+        row_prefixes = layout_map_grid(height, width, row_labels)
+    num_digits_map_width = len(str(width))
+    num_digits_map_height = len(str(height))
+    char_width = len("X")
+
+    # Create a string of blank spaces for the gap between map and text
+    gap_str = ' ' * gap
+
+    # Centered label, column headers with the header of the text, and a
+    # separator line
+    frame_header = (print_map_left_offset + label_left.center(
+        number_char_table_total) + "\n")
+    frame_header += (print_map_left_offset + " " + "".join(
+        f"{column_labels[col_index]}".rjust(
+            num_digits_map_height + char_width) + " " for col_index in range(
+            width)) + gap_str + " " + header + "\n")
+    frame_header += ("    ".rjust(num_digits_map_width + 1) + " " + "=" * (
+        number_char_table_total) + "\n")
+
+    # Blank space in place of the map, when the text is longer than it
+    blank = " " * (num_digits_map_width + num_digits_map_height +
+                   len(" | ") + char_width * width)
+
+    return FrameLayout(frame_header, row_prefixes, cell_padding, " ",
+                       gap_str, blank)
+
+
+"""Output functions
+-----------------"""
+
+
+class OutputCoalescer:
+    """
+    Stand-in for sys.stdout which collects everything printed and writes it
+    to the terminal in one go.
+
+    Printing to a terminal flushes on every line, so one turn reaches the
+    websocket bridge as many small pty chunks. With the coalescer installed
+    output is only written when it is flushed: at the end of a frame
+    (output_end_frame), when input() writes its prompt, or by an explicit
+    flush. With a flush window, flushes only make sure output is written
+    at most 'window' seconds later, so everything printed in that time (a
+    frame and the prompt under it) becomes a single write.
+
+    It has no fileno(), so input() never writes its prompt straight to the
+    terminal ahead of the output still collected here. The prompt is
+    written through the coalescer, after everything printed before it.
+
+    Attributes:
+        stream (file): The real standard output.
+        window (float): Seconds a flush may be delayed, 0 to write at once.
+        pending (list): Text printed but not written yet.
+        timer (threading.Timer): Timer of a delayed write, or None.
+        lock (threading.Lock): Guards pending and timer, the delayed write
+        runs in the timer thread.
+    """
+
+    __slots__ = ("stream", "window", "pending", "timer", "lock")
+
+    def __init__(self, stream, window=0):
+        self.stream = stream
+        self.window = window
+        self.pending = []
+        self.timer = None
+        self.lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        return self.stream.encoding
+
+    @property
+    def errors(self):
+        return self.stream.errors
+
+    def fileno(self):
+        raise io.UnsupportedOperation("coalesced output has no fileno")
+
+    def isatty(self):
+        return self.stream.isatty()
+
+    def write(self, text):
+        with self.lock:
+            self.pending.append(text)
+        return len(text)
+
+    def flush(self):
+        if not self.window:
+            output_coalescer_write(self)
+            return
+        with self.lock:
+            if self.timer is None and self.pending:
+                self.timer = threading.Timer(self.window,
+                                             output_coalescer_write, (self,))
+                self.timer.daemon = True
+                self.timer.start()
+
+
+def output_coalescer_write(coalescer):
+    """
+    Write all pending output of a coalescer in one write.
+
+    Args:
+        coalescer (OutputCoalescer): The coalescer to write out.
+    """
+    with coalescer.lock:
+        if coalescer.timer is not None:
+            coalescer.timer.cancel()
+            coalescer.timer = None
+        if not coalescer.pending:
+            return
+        text = "".join(coalescer.pending)
+        coalescer.pending.clear()
+
+        # Bytes go straight to the buffer, the text layer would flush the
+        # terminal again on every line
+        coalescer.stream.buffer.write(text.encode(coalescer.stream.encoding,
+                                                  coalescer.stream.errors))
+        coalescer.stream.buffer.flush()
+
+
+def install_output_coalescer(window=0):
+    """
+    Replace sys.stdout with an OutputCoalescer.
+
+    Args:
+        window (float, optional): Seconds a flush may be delayed.
+
+    Returns:
+        OutputCoalescer: The installed coalescer.
+    """
+    if not isinstance(sys.stdout, OutputCoalescer):
+        sys.stdout.flush()
+        sys.stdout = OutputCoalescer(sys.stdout, window)
+    return sys.stdout
+
+
+def read_output_window(environ):
+    """
+    Read the flush window from the environment.
+
+    Args:
+        environ (mapping): Environment variables, OUTPUT_WINDOW_VARIABLE is
+        read from it.
+
+    Returns:
+        float: The flush window in seconds, 0 if it is not set or not a
+        number.
+    """
+    try:
+        return max(0.0, float(environ.get(OUTPUT_WINDOW_VARIABLE, 0)) / 1000)
+    except ValueError:
+        return 0.0
+
+
+def output_end_frame():
+    """
+    Mark the end of a frame: everything printed so far is written now, in
+    one write, without waiting for the flush window.
+    """
+    if isinstance(sys.stdout, OutputCoalescer):
+        output_coalescer_write(sys.stdout)
+    else:
+        sys.stdout.flush()
+
+
+"""JSON output functions
+----------------------"""
+
+
+def output_json_message(message):
+    """
+    Write one message of the JSON output mode, on a line of its own.
+
+    Every message is a JSON array starting with its kind:
+    - ["settings", settings]: the instructions page waits for ENTER to
+      start, or Y to adjust the settings (which is done in text). The
+      settings object holds height, width, gaps, rows, columns, fleet
+      (ship name -> [size, quantity]), cells (SHIP_CELLS), empty
+      (CELL_EMPTY) and events (OUTPUT_EVENT_NAMES).
+    - ["deploy", ship_name, ship_size, events(, errors)]: the player
+      deploys the next ship.
+    - ["shoot", events(, errors)]: the player shoots.
+    - ["over", events]: the game is over and waits for the answer to play
+      again.
+
+    Events are [board, kind, cells...(, ship_name)]: board 0 is the CPU map
+    and 1 the player map, kind indexes OUTPUT_EVENT_NAMES, and the cells
+    follow flat as row, column and cell code of every cell the event
+    changed.
+    Errors are the messages of a rejected input, only sent if there are
+    any.
+
+    Args:
+        message (list): The message.
+    """
+    sys.stdout.write(json.dumps(message, separators=(",", ":"),
+                                ensure_ascii=False) + "\n")
+
+
+def output_json_prompt(state, kind, *items, errors=()):
+    """
+    Write a prompt message with the cell events not sent yet.
+
+    Args:
+        state (GameState): The game in JSON output mode.
+        kind (str): Kind of the message, see 'output_json_message'.
+        *items: Items of the message between its kind and the events.
+        errors (iterable, optional): Messages of a rejected input.
+    """
+    message = [kind, *items, state.cell_events]
+    errors = [error.strip() for error in errors if error.strip()]
+    if errors:
+        message.append(errors)
+    output_json_message(message)
+    state.cell_events = []
+
+
+def output_json_settings(state, height, width, fleet, gaps_on_map):
+    """
+    Write the settings message of the instructions page.
+
+    Args:
+        state (GameState): The game in JSON output mode.
+        height (int): The height of the game map.
+        width (int): The width of the game map.
+        fleet (dict): The fleet configuration.
+        gaps_on_map (bool): If True, ships can not touch each other.
+
+    Global Variables:
+        SHIP_CELLS (dict): Cell codes used for different states of the ship.
+        CELL_EMPTY (int): The code of an empty cell.
+    """
+    global SHIP_CELLS, CELL_EMPTY
+    output_json_message(["settings", {
+        "height": height, "width": width, "gaps": gaps_on_map,
+        "rows": state.row_indexes[:height],
+        "columns": state.column_indexes[:width],
+        "fleet": {ship_name: [ship_info["Size"], ship_info["Quantity"]]
+                  for ship_name, ship_info in fleet.items()},
+        "cells": SHIP_CELLS, "empty": CELL_EMPTY,
+        "events": OUTPUT_EVENT_NAMES}])
+
+
+def read_output_mode(environ):
+    """
+    Read the output mode from the environment.
+
+    Args:
+        environ (mapping): Environment variables, OUTPUT_MODE_VARIABLE is
+        read from it.
+
+    Returns:
+        str: One of OUTPUT_MODES, DEFAULT_OUTPUT_MODE if it is not set or
+        not known.
+    """
+    output_mode = environ.get(OUTPUT_MODE_VARIABLE, "").lower()
+    return output_mode if output_mode in OUTPUT_MODES else DEFAULT_OUTPUT_MODE
+
+
+def terminal_echo_off():
+    """
+    Stop the terminal from echoing typed lines back, where standard input
+    is a terminal and 'termios' is available.
+
+    Returns:
+        tuple: (fd, attributes) of the terminal to restore, or None if
+        nothing changed.
+    """
+    if termios is None or not sys.stdin.isatty():
+        return None
+    fd = sys.stdin.fileno()
+    attributes = termios.tcgetattr(fd)
+    quiet = list(attributes)
+    quiet[3] &= ~termios.ECHO  # Local modes
+    termios.tcsetattr(fd, termios.TCSANOW, quiet)
+    return fd, attributes
+
+
+def terminal_echo_restore(saved):
+    """
+    Restore the terminal attributes saved by 'terminal_echo_off'.
+
+    Args:
+        saved (tuple): (fd, attributes) of the terminal, or None.
+    """
+    if saved is not None:
+        termios.tcsetattr(saved[0], termios.TCSANOW, saved[1])
+
+
+def cell_events_board(state, maps):
+    """
+    Find which of the given maps the player sees, and as which board.
+
+    Args:
+        state (GameState): The game.
+        maps (tuple): Maps changed by an event.
+
+    Returns:
+        tuple: (board, map_game), board 0 for the CPU map and 1 for the
+        player map, or (None, None) if none of the maps is shown.
+    """
+    for map_game in maps:
+        if map_game is state.map_cpu_hidden:
+            return 0, map_game
+        if map_game is state.map_player_display:
+            return 1, map_game
+    return None, None
+
+
+def cell_events_add(state, kind, maps, coordinates_list, ship_name=None,
+                    board=None):
+    """
+    Record an event changing cells, to be sent with the next prompt in JSON
+    output mode. Nothing is recorded when the game is drawn as ANSI frames.
+
+    Args:
+        state (GameState): The game.
+        kind (int): Kind of the event, indexes OUTPUT_EVENT_NAMES.
+        maps (tuple): Maps changed by the event, only the one the player
+        sees is recorded.
+        coordinates_list (list): Cells changed by the event.
+        ship_name (str, optional): Ship sunk or deployed by the event.
+        board (int, optional): Board of the first map, when it can not be
+        told by the maps of the game state.
+    """
+    if state.cell_events is None:
+        return
+    if board is None:
+        board, map_game = cell_events_board(state, maps)
+        if board is None:
+            return
+    else:
+        map_game = maps[0]
+
+    event = [board, kind]
+    for row, column in coordinates_list:
+        event += (row, column, map_game[row][column])
+    if ship_name:
+        event.append(ship_name)
+    state.cell_events.append(event)
+
+
+def cell_events_snapshot(state, maps, coordinates_list):
+    """
+    Remember the cells a sinking ship may change, before they are changed:
+    the cells of the ship, and the cells around it when ships can not touch.
+
+    Args:
+        state (GameState): The game.
+        maps (tuple): Maps the ship is sunk on.
+        coordinates_list (list): Cells of the ship.
+
+    Returns:
+        tuple: (board, map_game, coordinates, codes) for the map the player
+        sees, or None in ANSI output mode or if the player sees none.
+    """
+    if state.cell_events is None:
+        return None
+    board, map_game = cell_events_board(state, maps)
+    if board is None:
+        return None
+    region = bitboard_from_coordinates(map_game, coordinates_list)
+    if state.gaps_on_map:
+        region = bitboard_dilate(map_game.height, map_game.width, region)
+    coordinates = bitboard_to_coordinates(map_game, region)
+    return (board, map_game, coordinates,
+            [map_game[row][column] for row, column in coordinates])
+
+
+def cell_events_add_changes(state, kind, snapshot, ship_name=None):
+    """
+    Record an event with the cells which changed since a snapshot.
+
+    Args:
+        state (GameState): The game.
+        kind (int): Kind of the event, indexes OUTPUT_EVENT_NAMES.
+        snapshot (tuple): Taken by 'cell_events_snapshot', or None.
+        ship_name (str, optional): Ship the event is about.
+    """
+    if snapshot is None:
+        return
+    board, map_game, coordinates, codes = snapshot
+    changed = [(row, column) for (row, column), code in zip(coordinates, codes)
+               if map_game[row][column] != code]
+    cell_events_add(state, kind, (map_game,), changed, ship_name, board)
+
+
+"""Session limit functions
+------------------------"""
+
+
+class SessionExpired(BaseException):
+    """
+    Raised in the game when a session limit is reached, with the reason as
+    its message.
+
+    It is not an Exception, so the game's own error handling (which catches
+    Exception and KeyboardInterrupt around prompts and shots) does not
+    swallow it, and it ends the whole game in main().
+    """
+
+
+class SessionInput:
+    """
+    Stand-in for sys.stdin which ends the session when the player stays
+    idle at a prompt for too long, or when the whole session lasts too long.
+
+    Limits are kept by one SIGALRM timer. While a prompt waits for the
+    player it is armed for whichever limit comes first, and the alarm ends
+    the game right there. Between prompts it is only armed for the session
+    limit, and an alarm then only marks the session as expired, so the game
+    is never stopped halfway through a shot or a log write, and it ends at
+    the next prompt instead.
+
+    It has no fileno(), so input() reads lines through readline() instead
+    of straight from the terminal.
+
+    Attributes:
+        stream (file): The real standard input.
+        idle_timeout (float): Seconds a prompt may wait, 0 for no limit.
+        deadline (float): time.monotonic() the session must end by, 0 for
+        no limit.
+        waiting (bool): True while a prompt waits for the player.
+        reason (str): Reason of the limit the timer is armed for.
+        expired (str): Reason of a limit reached between prompts, or None.
+    """
+
+    __slots__ = ("stream", "idle_timeout", "deadline", "waiting", "reason",
+                 "expired")
+
+    def __init__(self, stream, idle_timeout=0, deadline=0):
+        self.stream = stream
+        self.idle_timeout = idle_timeout
+        self.deadline = deadline
+        self.waiting = False
+        self.reason = None
+        self.expired = None
+
+    @property
+    def encoding(self):
+        return self.stream.encoding
+
+    @property
+    def errors(self):
+        return self.stream.errors
+
+    def readline(self):
+        return session_input_readline(self)
+
+
+def session_input_readline(session_input):
+    """
+    Wait for the next line typed by the player, within the session limits.
+
+    Args:
+        session_input (SessionInput): The input to read from.
+
+    Returns:
+        str: The line typed by the player.
+
+    Raises:
+        SessionExpired: If a limit was reached before or while waiting.
     """
-    # Global variables for row and column indexes
-    global MAP_ROW_INDEXES, MAP_COLUMN_INDEXES
+    if session_input.expired:
+        raise SessionExpired(session_input.expired)
+    session_input.waiting = True
+    session_input_arm(session_input)
+    try:
+        return session_input.stream.readline()
+    finally:
+        session_input.waiting = False
+        session_input_arm(session_input)
 
-    # Print column headers (0, 1, 2, ..., N)
-    print("   ", end="")
-    for col_index in range(len(map_game[0])):
-        print(f"{MAP_ROW_INDEXES[col_index]}  ", end="")
 
-    # Print a separator line between headers and table
-    print("\n   " + "=" * (len(map_game[0]) * 3))
+def session_input_arm(session_input):
+    """
+    Arm the alarm timer for the limit which is reached first, or disarm it
+    if there is none.
 
-    # Loop through each row
-    for row_index, row in enumerate(map_game):
-        # Print row header
-        print(f"{MAP_COLUMN_INDEXES[row_index]} |", end=" ")
+    Args:
+        session_input (SessionInput): The input whose limits are armed.
+    """
+    seconds = 0
+    reason = None
+    if session_input.deadline:
+        # A deadline already passed still needs the alarm to go off
+        seconds = max(session_input.deadline - time.monotonic(), 1e-6)
+        reason = "session time limit reached"
+    if session_input.waiting and session_input.idle_timeout and (
+            not seconds or session_input.idle_timeout < seconds):
+        seconds = session_input.idle_timeout
+        reason = "no input for too long"
+    session_input.reason = reason
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+
+
+def session_input_alarm(session_input, signum, frame):
+    """
+    SIGALRM handler: end the session now if a prompt is waiting, otherwise
+    at the next prompt.
 
-        # Loop through each cell in the row
-        for value in row:
-            # Print the cell value followed by two spaces
-            print(f"{value}  ", end="")
+    Args:
+        session_input (SessionInput): The input the timer was armed for.
+        signum (int): The signal number.
+        frame (frame): The interrupted frame.
 
-        # Move to the next line at the end of each row
-        print()
+    Raises:
+        SessionExpired: If a prompt is waiting for the player.
+    """
+    if session_input.waiting:
+        raise SessionExpired(session_input.reason)
+    session_input.expired = session_input.reason
 
 
-def print_two_maps(map_left, map_right, label_left, label_right, gap=10):
+def read_session_limit(environ, name):
     """
-    Print two 2D maps side by side with labels and a customizable gap.
+    Read one session limit from the environment.
 
     Args:
-        map_left (list): A 2D list representing the first map.
-        map_right (list): A 2D list representing the second map.
-        label_left (str): Label for the first map.
-        label_right (str): Label for the second map.
-        gap (int): Number of blank spaces between the two maps. Default is 10.
+        environ (mapping): Environment variables.
+        name (str): Name of the variable holding the limit.
+
+    Returns:
+        float: The limit, 0 if it is not set or not a number.
     """
+    try:
+        return max(0.0, float(environ.get(name, 0)))
+    except ValueError:
+        return 0.0
 
-    # Constants for character dimensions and formatting
-    char_width = len("X")  # Width of a single character (assuming monospaced
-    # font)
 
-    # Calculate the maximum number of digits in row and column indices
-    num_digits_map_width = len(str(len(map_left[0])))
-    num_digits_map_height = len(str(len(map_left)))
+def install_session_limits(environ):
+    """
+    Apply the session limits set in the environment.
 
-    # Create a string of blank spaces for the gap between maps
-    gap_str = ' ' * gap
+    The memory limit is a soft limit on the address space of the process,
+    so allocations over it raise MemoryError. It needs the 'resource'
+    module and is skipped where it is not available.
 
-    # Calculate the left-side offset for aligning map and row indices
-    row_index_separator = " | "
-    print_map_left_offset = " " * (num_digits_map_height + len(
-        row_index_separator))
+    Time limits need signals, so they are only installed in the main
+    thread. Sessions served by threads of server.py only get the idle
+    timeout, kept by server.py itself, while sessions forked by
+    fork_server.py get all limits, each by its own timer.
 
-    # Center-align the labels for both maps
-    number_char_table_total = (len(map_left[0]) * (num_digits_map_width +
-                                                   char_width + 1))
-    label_left_centered = label_left.center(number_char_table_total)
-    label_right_centered = label_right.center(number_char_table_total)
+    Args:
+        environ (mapping): Environment variables, IDLE_TIMEOUT_VARIABLE,
+        SESSION_LIMIT_VARIABLE and MEMORY_LIMIT_VARIABLE are read from it.
 
-    # Print the centered labels for both maps
-    print(f"{print_map_left_offset}{label_left_centered}"
-          f"{gap_str}{print_map_left_offset} {label_right_centered}")
-
-    # Print column headers for both maps
-    print(print_map_left_offset, end=" ")
-    for col_index in range(len(map_left[0])):
-        if col_index == len(map_left[0]) - 1:  # Check if it's the last
-            # column index
-            print(f"{MAP_COLUMN_INDEXES[col_index]}".rjust(
-                num_digits_map_height + char_width),  end="")
-        else:
-            print(f"{MAP_COLUMN_INDEXES[col_index]}".rjust(
-                num_digits_map_height + char_width), end=" ")
-    print(gap_str, print_map_left_offset, end=" ")
-    for col_index in range(len(map_right[0])):
-        # Right-justify the column index with proper spacing
-        print(f"{MAP_COLUMN_INDEXES[col_index]}".rjust(
-            num_digits_map_height + char_width), end=" ")
-    print()
-    # Print the horizontal separator line
-    # This step prints a separator line to visually separate the maps
-    separator_length_left = len(map_left[0]) * (num_digits_map_width +
-                                                char_width + 1)
-    separator_length_right = len(map_right[0]) * (num_digits_map_width +
-                                                  char_width + 1)
-    print(print_map_left_offset + "=" * separator_length_left, end=gap_str)
-    print(" " + print_map_left_offset + "=" * separator_length_right)
-
-    # Loop through each row to print map values
-    for row_index, (row_left, row_right) in enumerate(zip(map_left,
-                                                          map_right)):
-        # Print row for the left map
-        print(f"{MAP_ROW_INDEXES[row_index]}".rjust(
-            num_digits_map_width + 1), end=row_index_separator)
-        for value in row_left:
-            width = len(str(value))
-            # Right-justify the map value with proper spacing
-            print(f"{value}".rjust(num_digits_map_height + char_width - (
-                    char_width - width)), end=" ")
-        # Insert the gap between the two maps
-        print(gap_str, end="")
-        # Print row for the right map
-        print(f"{MAP_ROW_INDEXES[row_index]}".rjust(num_digits_map_width +
-                                                    1),
-              end=row_index_separator)
-        for value in row_right:
-            width = len(str(value))
-            # Right-justify the map value with proper spacing
-            print(f"{value}".rjust(num_digits_map_height + char_width - (
-                    char_width - width)), end=" ")
-        # Move to the next line
-        print()
-
-
-def print_map_and_list(map_left, instructions, label_left, gap=10):
+    Returns:
+        tuple: (session_input, memory_soft_limit), the installed input with
+        time limits or None, and the soft memory limit from before the
+        session or None if it was left alone.
     """
-    Print a 2D map and a list side by side with labels and a customizable gap.
+    memory_soft_limit = None
+    memory_limit = read_session_limit(environ, MEMORY_LIMIT_VARIABLE)
+    if memory_limit and resource is not None:
+        limit = int(memory_limit * 1024 * 1024)
+        memory_soft_limit, hard = resource.getrlimit(resource.RLIMIT_AS)
+        if hard != resource.RLIM_INFINITY:
+            limit = min(limit, hard)
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+    idle_timeout = read_session_limit(environ, IDLE_TIMEOUT_VARIABLE)
+    session_limit = read_session_limit(environ, SESSION_LIMIT_VARIABLE)
+    if not (idle_timeout or session_limit) or (
+            threading.current_thread() is not threading.main_thread()):
+        return None, memory_soft_limit
+
+    deadline = time.monotonic() + session_limit if session_limit else 0
+    session_input = SessionInput(sys.stdin, idle_timeout, deadline)
+    signal.signal(signal.SIGALRM,
+                  functools.partial(session_input_alarm, session_input))
+    sys.stdin = session_input
+    session_input_arm(session_input)
+    return session_input, memory_soft_limit
+
+
+def release_session_limits(session_input, memory_soft_limit):
+    """
+    Lift the session limits once the game has ended, so its log can still
+    be written out. Only what install_session_limits changed is put back:
+    the alarm timer is disarmed and the soft memory limit it lowered gets
+    its old value again. It can be called more than once.
 
     Args:
-        map_left (list): A 2D list representing the first map.
-        instructions (list): A list of strings representing the instructions.
-        label_left (str): Label for the first map.
-        gap (int): Number of blank spaces between the map and the
-        instructions. Default is 10.
+        session_input (SessionInput): Input returned by
+        install_session_limits, or None.
+        memory_soft_limit (int): Soft memory limit returned by
+        install_session_limits, or None if it was not changed.
     """
-    # Global variables for row and column indexes
-    global MAP_ROW_INDEXES, MAP_COLUMN_INDEXES
+    if session_input is not None:
+        session_input.idle_timeout = session_input.deadline = 0
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    if memory_soft_limit is not None:
+        hard = resource.getrlimit(resource.RLIMIT_AS)[1]
+        resource.setrlimit(resource.RLIMIT_AS, (memory_soft_limit, hard))
 
-    # Constants for character dimensions and formatting
-    char_width = len("X")  # Width of a single character (assuming monospaced
-    # font)
 
-    # Calculate the maximum number of digits in row and column indices
-    num_digits_map_width = len(str(len(map_left[0])))
-    num_digits_map_height = len(str(len(map_left)))
+"""Screen functions
+-----------------"""
 
-    # Create a string of blank spaces for the gap between map and instructions
-    gap_str = ' ' * gap
 
-    # Calculate the left-side offset for aligning map and row indices
-    row_index_separator = " | "
-    print_map_left_offset = " " * (num_digits_map_height + len(
-        row_index_separator))
+class Screen:
+    """
+    Model of the frame last drawn at the top of the terminal.
 
-    # Center-align the label for the map
-    number_char_table_total = (len(map_left[0]) * (num_digits_map_width +
-                                                   char_width + 1))
-    label_left_centered = label_left.center(number_char_table_total)
+    A frame is drawn in full only the first time. After that only the cells
+    which changed since the previous frame are written, each run of them
+    after an ANSI cursor move, so a turn which changes a few cells sends a
+    few cells instead of the whole screen.
 
-    # Print the centered label for the map
-    print(f"{print_map_left_offset}{label_left_centered}")
-
-    # Print column headers for the map
-    print(print_map_left_offset, end=" ")
-    for col_index in range(len(map_left[0])):
-        print(f"{MAP_COLUMN_INDEXES[col_index]}".rjust(
-            num_digits_map_height + char_width), end=" ")
-    print(gap_str, "Instructions")
-    print("    ".rjust(num_digits_map_width + 1), "=" * (
-        number_char_table_total))  # Draw a separator line
-
-    # Loop through each row to print map values and instructions
-    for row_index in range(max(len(map_left), len(instructions))):
-        # Print row for the map
-        if row_index < len(map_left):
-            print(f"{MAP_ROW_INDEXES[row_index]}".rjust(
-                num_digits_map_width + 1), end=row_index_separator)
-            for value in map_left[row_index]:
-                width = len(str(value))
-                print(f"{value}".rjust(num_digits_map_height + char_width - (
-                        char_width - width)), end=" ")
-        else:
-            print(" " * (num_digits_map_width + num_digits_map_height + len(
-                row_index_separator) + char_width * len(
-                map_left[0])), end="")
+    Attributes:
+        lines (list): Lines of the last frame, or None when the terminal
+        content is unknown and the next frame has to be drawn in full.
+    """
 
-        # Insert the gap between the map and the instructions
-        print(gap_str, end="")
+    __slots__ = ("lines",)
 
-        # Print instruction for the row
-        if row_index < len(instructions):
-            print(instructions[row_index])
-        else:
-            print()
+    def __init__(self):
+        self.lines = None
 
 
-def print_map_and_fleet_aligned_columns(map_left, fleet, label_left, gap=10):
+def screen_draw(screen, frame):
     """
-    Print a 2D map and a fleet dictionary with aligned columns side by side,
-    and with a customizable gap.
+    Draw a frame at the top of the terminal, writing only what changed.
+
+    The cursor is left on the line under the frame, and everything under
+    it (prompts and input of the previous turn) is erased.
 
     Args:
-        map_left (list): A 2D list representing the first map.
-        fleet (dict): A dictionary representing the fleet.
-        label_left (str): Label for the first map.
-        gap (int): Number of blank spaces between the map and the fleet
-        information. Default is 10.
+        screen (Screen): What is on the terminal, updated to the new frame.
+        frame (str): The whole frame, every line ending with a new line.
     """
-    # Global variables for row and column indexes
-    global MAP_ROW_INDEXES, MAP_COLUMN_INDEXES
-
-    # Constants for character dimensions and formatting
-    char_width = len("X")  # Width of a single character (assuming monospaced
-    # font)
+    lines = frame.split("\n")
+    if lines[-1] == "":
+        lines.pop()
+
+    # Lines wider than the terminal wrap onto the next rows, and frames
+    # taller than the terminal scroll it, in both cases cells can not be
+    # addressed by their line and column any more
+    columns, terminal_lines = shutil.get_terminal_size()
+    widest = 0
+    rows = SCREEN_PROMPT_LINES
+    for line in lines:
+        width = len(SCREEN_CELL_PATTERN.findall(line))
+        widest = max(widest, width)
+        # Terminal rows taken by the line once it wraps
+        rows += max(1, -(-width // columns))
+    fits = widest <= columns and rows <= terminal_lines
+
+    if screen.lines is None or not fits:
+        output = SCREEN_CLEAR + frame
+    else:
+        changes = []
+        for row, line in enumerate(lines):
+            old_line = screen.lines[row] if row < len(screen.lines) else ""
+            if line != old_line:
+                changes.append(screen_diff_line(row + 1, old_line, line))
 
-    # Calculate the maximum number of digits in row and column indices for
-    # map_left
-    num_digits_map_width = len(str(len(map_left[0])))
-    num_digits_map_height = len(str(len(map_left)))
+        # Cursor under the frame, erase everything below it
+        changes.append(f"\u001b[{len(lines) + 1};1H\u001b[J")
+        output = "".join(changes)
 
-    # Create a string of blank spaces for the gap between map and fleet
-    gap_str = ' ' * gap
+    sys.stdout.write(output)
+    sys.stdout.flush()
+    # The rows of a frame which did not fit are unknown, so the next frame
+    # is drawn in full too
+    screen.lines = lines if fits else None
 
-    # Calculate the left-side offset for aligning map and row indices
-    row_index_separator = " | "
-    print_map_left_offset = " " * (num_digits_map_height + len(
-        row_index_separator))
 
-    # Center-align the label for map_left
-    number_char_table_total = (len(map_left[0]) * (num_digits_map_width +
-                                                   char_width + 1))
-    label_left_centered = label_left.center(number_char_table_total)
+def screen_forget(screen):
+    """
+    Forget what is on the terminal, so the next frame is drawn in full.
 
-    # Print the centered label for map_left
-    print(f"{print_map_left_offset}{label_left_centered}")
+    Args:
+        screen (Screen): The screen to forget.
+    """
+    screen.lines = None
 
-    # Print column headers for map_left
-    print(print_map_left_offset, end=" ")
-    for col_index in range(len(map_left[0])):
-        print(f"{MAP_COLUMN_INDEXES[col_index]}".rjust(
-            num_digits_map_height + char_width), end=" ")
 
-    # Calculate the maximum lengths for the ship name, size, and quantity
-    # columns for alignment
-    max_ship_name_length = max(len(ship) for ship in fleet.keys())
-    max_size_length = len("Size")
-    max_quantity_length = len("Quantity")
+def screen_cells(line):
+    """
+    Split a line into its visible cells.
 
-    # Generate the header for the fleet information
-    fleet_header = (f"{'Ship Name': <{max_ship_name_length}} |"
-                    f" {'Size': >{max_size_length}} |"
-                    f" {'Quantity': >{max_quantity_length}}")
-    print(gap_str, fleet_header)
-    print("    ".rjust(num_digits_map_width + 1), "=" * (
-        number_char_table_total))  # Draw a separator line
+    Every cell keeps the color escape sequences written with it, and the
+    color it is drawn with, so cells with the same character but another
+    color are different.
 
-    # Convert the fleet dictionary to a list of formatted strings with
-    # aligned columns
-    fleet_str_lines = [
-        (f"{ship: <{max_ship_name_length}} |"
-         f" {props['Size']: >{max_size_length}}"
-         f" | {props['Quantity']: >{max_quantity_length}}")
-        for ship, props in fleet.items()]
+    Args:
+        line (str): A line of a frame.
 
-    # Loop through each row to print map values and fleet information
-    for row_index in range(max(len(map_left), len(fleet_str_lines))):
-        # Print row for map_left
-        if row_index < len(map_left):
-            print(f"{MAP_ROW_INDEXES[row_index]}".rjust(
-                num_digits_map_width + 1), end=row_index_separator)
-            for value in map_left[row_index]:
-                width = len(str(value))
-                print(f"{value}".rjust(num_digits_map_height + char_width - (
-                        char_width - width)), end=" ")
-        else:
-            # Print spaces to align with the map when the map is shorter than
-            # the fleet information
-            print(" " * (num_digits_map_width + num_digits_map_height + len(
-                row_index_separator) + char_width * len(
-                map_left[0])), end="")
-
-        # Insert the gap between the map and the fleet
-        print(gap_str, end="")
-
-        # Print fleet information for the row
-        if row_index < len(fleet_str_lines):
-            print(fleet_str_lines[row_index])
-        else:
-            print()
+    Returns:
+        List[Tuple[str, str]]: (color active before the cell, cell text)
+        for every visible character.
+    """
+    cells = []
+    active = ""
+    for cell in SCREEN_CELL_PATTERN.findall(line):
+        cells.append((active, cell))
+        active = screen_color_after(active, cell)
+    return cells
 
 
-def print_aligned_log(log_data, gap=10):
+def screen_color_after(color, cell):
     """
-    Prints log data in aligned columns with predefined labels and a
-    customizable gap.
+    Find the color which is active after a cell is written.
 
     Args:
-        log_data (list): A list of log entries. Each entry is a list
-        containing information about the player, time, row, column,
-        and result.
-        gap (int): Number of blank spaces between log columns. Default is 10
+        color (str): Color escape sequence active before the cell, or an
+        empty string for the default color.
+        cell (str): The cell text, with its escape sequences.
 
-    Example:
-        print_aligned_log([['CPU', 0.0658, 4, 5, 'Damaged']], gap=5)
+    Returns:
+        str: Color escape sequence active after the cell, or an empty
+        string for the default color.
     """
+    for sequence in re.findall(r"\x1b\[[0-9;]*m", cell):
+        color = "" if sequence == SCREEN_RESET else sequence
+    return color
 
-    # Predefined labels for the columns
-    labels = ['Player', 'Time', 'Row', 'Column', 'Result']
 
-    # Calculate the maximum width for each column to align the data
-    max_widths = [0] * len(labels)
-    for i in range(len(labels)):
-        max_widths[i] = max(len(labels[i]), max(len(str(entry[i])) for entry
-                                                in log_data))
+def screen_diff_line(row, old_line, new_line):
+    """
+    Build the escape sequences turning one line of the terminal from the
+    old line into the new one.
 
-    # Create a string filled with blank spaces for the gap between columns
-    gap_str = ' ' * gap
+    Args:
+        row (int): Terminal row of the line, counted from 1.
+        old_line (str): The line on the terminal.
+        new_line (str): The line to draw.
 
-    # Print the header row with labels, aligning each column based on its
-    # maximum width
-    header_str = " | ".join(f"{labels[i]: <{max_widths[i]}}" for i in range(
-        len(labels)))
-    print(header_str)
+    Returns:
+        str: Cursor moves and the cells which changed.
+    """
+    old_cells = screen_cells(old_line)
+    new_cells = screen_cells(new_line)
+
+    # Group changed cells into runs, short unchanged gaps are rewritten
+    runs = []
+    for column, cell in enumerate(new_cells):
+        if column < len(old_cells) and old_cells[column] == cell:
+            continue
+        if runs and column - runs[-1][1] <= SCREEN_MERGE_GAP:
+            runs[-1][1] = column + 1
+        else:
+            runs.append([column, column + 1])
 
-    # Print each log entry, aligning each column based on its maximum width
-    for entry in log_data:
-        entry_str = " | ".join(f"{str(entry[i]): <{max_widths[i]}}" for i in
-                               range(len(entry)))
-        print(entry_str)
+    output = []
+    for start, end in runs:
+        # The run starts in the color the line has at that cell, and does
+        # not leave its color on for the next write
+        color = new_cells[start][0]
+        output.append(f"\u001b[{row};{start + 1}H{color}" + "".join(
+            cell for _, cell in new_cells[start:end]))
+        if screen_color_after(*new_cells[end - 1]):
+            output.append(SCREEN_RESET)
 
-    # No return statement is needed as the function prints directly to the
-    # console
+    # Old line was longer, erase what is left of it
+    if len(new_cells) < len(old_cells):
+        output.append(f"\u001b[{row};{len(new_cells) + 1}H\u001b[K")
+    return "".join(output)
 
 
 """User Game Play Functions
 -------------------------"""
 
 
-def player_shoot_input(map_hidden, map_display, enemy_fleet):
+def player_shoot_input(state, map_hidden, map_display, enemy_fleet):
     """
     Handles the player's shooting action by taking input coordinates and
     updating the game state.
 
     Args:
+        state (GameState): The game, its labels and logs are used.
         map_hidden (list): The hidden 2D map of CPU, which we are targeting.
         map_display (list): The 2D map that is visible to the player.
         enemy_fleet (dict): The enemy fleet's information.
@@ -1567,9 +4140,6 @@ def player_shoot_input(map_hidden, map_display, enemy_fleet):
         miss
     """
 
-    # Global variables for row and column indexes and the CPU's shot log
-    global MAP_ROW_INDEXES, MAP_COLUMN_INDEXES, cpu_shot_log_tmp
-
     # Flag to track whether the user's input is valid
     input_validation = True
     coordinate_value_correct = True
@@ -1584,22 +4154,27 @@ def player_shoot_input(map_hidden, map_display, enemy_fleet):
     while True:
         try:
             # If the last input was invalid, print an error message
+            errors = []
             if not input_validation:
-                clear_terminal()
-                print_two_maps(map_hidden, map_display,
-                               "CPU Map", "Player Map", 10)
-                print(f' Please enter JUST 2 values, as you have entered '
-                      f'{len(input_values)}')
+                errors.append(f' Please enter JUST 2 values, as you have '
+                              f'entered {len(input_values)}')
                 input_validation = True  # Resetting validation
             if not coordinate_value_correct:
-                clear_terminal()
-                print_two_maps(map_hidden, map_display,
-                               "CPU Map", "Player Map", 10)
-                print(coordinate_return_message)
+                errors.append(coordinate_return_message)
+
+            # The web client gets the cells changed since the last prompt
+            # and the errors, terminals get the maps
+            if state.cell_events is not None:
+                output_json_prompt(state, "shoot", errors=errors)
+            else:
+                for error in errors:
+                    screen_draw(state.screen, render_two_maps(
+                        state, map_hidden, map_display, "CPU Map",
+                        "Player Map", 10) + error + "\n")
 
-            # Prompt the user for coordinates to shoot at
-            print(f'Please enter coordinates to shoot, Row and Column, '
-                  f'in this pattern')
+                # Prompt the user for coordinates to shoot at
+                print(f'Please enter coordinates to shoot, Row and Column, '
+                      f'in this pattern')
 
             user_input = input()
 
@@ -1609,13 +4184,13 @@ def player_shoot_input(map_hidden, map_display, enemy_fleet):
                 validate_user_input(user_input, 2))
 
             # Determine the correct input type based on MAP ROW_INDEXES and
-            # MAP_COLUMN_INDEXES.
-            input_row = get_corrected_input(input_values[0], MAP_ROW_INDEXES)
+            # state.column_indexes.
+            input_row = get_corrected_input(input_values[0], state.row_indexes)
             input_column = get_corrected_input(input_values[1],
-                                               MAP_COLUMN_INDEXES)
+                                               state.column_indexes)
 
-            if input_row in MAP_ROW_INDEXES:
-                row = MAP_ROW_INDEXES.index(input_row)
+            if input_row in state.row_indexes:
+                row = state.row_indexes.index(input_row)
                 row_value_correct = True
                 row_return_message = ""
             else:
@@ -1623,8 +4198,8 @@ def player_shoot_input(map_hidden, map_display, enemy_fleet):
                 row_return_message = (f'There is no such Row on current map '
                                       f'with index {input_row}')
 
-            if input_column in MAP_COLUMN_INDEXES:
-                column = MAP_COLUMN_INDEXES.index(input_column)
+            if input_column in state.column_indexes:
+                column = state.column_indexes.index(input_column)
                 column_value_correct = True
                 column_return_message = ""
             else:
@@ -1648,21 +4223,21 @@ def player_shoot_input(map_hidden, map_display, enemy_fleet):
                                              column_return_message)
             # If the input is valid
             if coordinate_value_correct:
-                if row in MAP_ROW_INDEXES:
-                    row_index = MAP_ROW_INDEXES.index(row)
-                    column_index = MAP_COLUMN_INDEXES.index(column)
+                if row in state.row_indexes:
+                    row_index = state.row_indexes.index(row)
+                    column_index = state.column_indexes.index(column)
                     coordinates_check = ""
 
                     # Check if the coordinates are already shot at
                     coordinates_check = player_shoot_coordinates_check(
-                        row_index, column_index, map_hidden)
+                        state, row_index, column_index, map_hidden)
 
             # If the coordinates are valid and haven't been shot at, perform
             # the shooting action
             if coordinates_check:
                 map_hidden, map_display, fleet = action_perform_shoot(
-                    "Player", map_hidden, map_display, row_index,
-                    column_index, enemy_fleet, cpu_shot_log_tmp)
+                    state, "Player", map_hidden, map_display, row_index,
+                    column_index, enemy_fleet, state.cpu_shot_log_tmp)
                 return map_hidden, map_display, fleet
             else:
                 coordinate_value_correct = False
@@ -1675,11 +4250,12 @@ def player_shoot_input(map_hidden, map_display, enemy_fleet):
             return False
 
 
-def player_shoot_coordinates_check(row, column, map_game):
+def player_shoot_coordinates_check(state, row, column, map_game):
     """
     Checks if the provided coordinates have already been targeted.
 
     Args:
+        state (GameState): The game whose actions log is searched.
         row (int): Row index on the game map.
         column (int): Column index on the game map.
         map_game (list): The 2D array representing the game map.
@@ -1689,32 +4265,32 @@ def player_shoot_coordinates_check(row, column, map_game):
     """
 
     # Access the global variables
-    global DEFAULT_SYMBOL, game_actions_log
+    global CELL_EMPTY
 
     # Initialize result flag to True
     check_result = True
 
-    # Check if the coordinate on the game map is the default symbol (meaning
-    # not yet targeted)
-    if map_game[row][column] == DEFAULT_SYMBOL:
+    # Check if the coordinate on the game map is an empty cell (meaning not
+    # yet targeted)
+    if map_game[row][column] == CELL_EMPTY:
         check_result = True
 
-    # Loop through the game action logs to see if this coordinate has already
-    # been targeted
-    for log in game_actions_log:
-        if (int(row) == log[2] and int(column) == log[3] and log[0] ==
-                "Player"):
-            check_result = False  # Set result flag to False if coordinate
-            # has been targeted
+    # Look the coordinate up in the cells the player has already shot at
+    if state.shots_fired.get("Player", 0) & bitboard_cell(
+            map_game, int(row), int(column)):
+        check_result = False  # Set result flag to False if coordinate
+        # has been targeted
 
     return check_result  # Return the result flag
 
 
-def player_deploy_all_ships(map_hidden, map_display, fleet, gaps_on_map):
+def player_deploy_all_ships(state, map_hidden, map_display, fleet,
+                            gaps_on_map):
     """
     Deploys all ships for the player on the given maps.
 
     Args:
+        state (GameState): The game whose labels are used for input.
         map_display (list): The 2D array representing the display map.
         map_hidden (list): The 2D array representing the hidden map.
         fleet (dict): A dictionary containing the details of the fleet.
@@ -1725,8 +4301,12 @@ def player_deploy_all_ships(map_hidden, map_display, fleet, gaps_on_map):
         coordinates.
     """
 
-    # Access the global variables for default and ship symbols
-    global DEFAULT_SYMBOL, SHIP_SYMBOLS
+    # Access the global variables for empty and ship cell codes
+    global CELL_EMPTY, SHIP_CELLS
+
+    # Make sure the deployed cells are indexed
+    if not isinstance(fleet, Fleet):
+        fleet = Fleet(fleet)
 
     # Loop through each ship type in the fleet
     for ship_name, ship_info in fleet.items():
@@ -1739,23 +4319,24 @@ def player_deploy_all_ships(map_hidden, map_display, fleet, gaps_on_map):
         for i in range(quantity):
             # Deploy a single ship and get updated maps and coordinates
             map_hidden, map_display, coordinates_list = (
-                player_deploy_single_ship(map_hidden, map_display,
+                player_deploy_single_ship(state, map_hidden, map_display,
                                           ship_name, size, gaps_on_map,
                                           fleet))
 
             # Append the coordinates of deployed ship to the fleet dictionary
-            fleet[ship_name]["Coordinates"].append(coordinates_list)
+            fleet_add_ship_coordinates(fleet, ship_name, coordinates_list)
 
     # Return the updated display map and fleet dictionary
     return map_display, fleet
 
 
-def player_deploy_single_ship(map_hidden, map_display, ship_name, ship_size,
-                              gaps_on_map, fleet):
+def player_deploy_single_ship(state, map_hidden, map_display, ship_name,
+                              ship_size, gaps_on_map, fleet):
     """
     Handles the deployment of a single ship for the player on the game board.
 
     Args:
+        state (GameState): The game whose labels are used for input.
         map_display (list): 2D list representing the display map.
         map_hidden (list): 2D list representing the hidden map.
         ship_name (str): The name of the ship to be deployed.
@@ -1767,8 +4348,6 @@ def player_deploy_single_ship(map_hidden, map_display, ship_name, ship_size,
         tuple: Returns updated display map, hidden map, and coordinates list
         where the ship is deployed.
     """
-    global MAP_ROW_INDEXES, MAP_COLUMN_INDEXES  # Global constants for row
-    # and column indexes
     # Initialization of various validation flags
 
     input_validation = True
@@ -1783,30 +4362,41 @@ def player_deploy_single_ship(map_hidden, map_display, ship_name, ship_size,
     input_values = ""
     message_ship_does_not_fit = ""
     output_values_message = ""
+    value_error_message = ""
 
     while True:  # Main loop for user interaction
 
         try:
-            clear_terminal()
-            print_map_and_fleet_aligned_columns(map_display, fleet,
-                                                "Player Map", 10)
-            if ship_size == 1:
-                print(f'Please enter  2 values: coordinates '
-                      f'(Row, Column) for ship {ship_name} deployment')
-            else:
-                print(f'Please enter 3 values: coordinates (Row, Column) '
-                      f'for ship {ship_name} deployment and alignment')
-
-            # Display error messages based on the flags
+            # Error messages based on the flags
+            errors = []
             if not input_validation:
-                for message in output_values_message:
-                    print(message)
+                errors += output_values_message
             if not coordinate_value_correct:
-                print(coordinate_return_message)
+                errors.append(coordinate_return_message)
             if not alignment_value_correct:
-                print(alignment_mistake_message)
+                errors.append(alignment_mistake_message)
             if not map_check_result:
-                print(message_ship_does_not_fit)
+                errors.append(message_ship_does_not_fit)
+            if value_error_message:
+                errors.append(value_error_message)
+                value_error_message = ""
+
+            # The web client gets the ship to deploy and the errors only
+            if state.cell_events is not None:
+                output_json_prompt(state, "deploy", ship_name, ship_size,
+                                   errors=errors)
+            else:
+                clear_terminal()
+                print_map_and_fleet_aligned_columns(state, map_display, fleet,
+                                                    "Player Map", 10)
+                if ship_size == 1:
+                    print(f'Please enter  2 values: coordinates '
+                          f'(Row, Column) for ship {ship_name} deployment')
+                else:
+                    print(f'Please enter 3 values: coordinates (Row, Column) '
+                          f'for ship {ship_name} deployment and alignment')
+                for message in errors:
+                    print(message)
 
             input_validation = True
             coordinate_value_correct = True
@@ -1853,14 +4443,14 @@ def player_deploy_single_ship(map_hidden, map_display, ship_name, ship_size,
                         continue
 
             # Alignment is sorted, now we check coordinates:
-            # Determine the correct input type based on MAP_ROW_INDEXES and
-            # MAP_COLUMN_INDEXES.
-            input_row = get_corrected_input(input_values[0], MAP_ROW_INDEXES)
+            # Determine the correct input type based on state.row_indexes and
+            # state.column_indexes.
+            input_row = get_corrected_input(input_values[0], state.row_indexes)
             input_column = get_corrected_input(input_values[1],
-                                               MAP_COLUMN_INDEXES)
+                                               state.column_indexes)
 
-            if input_row in MAP_ROW_INDEXES:
-                row = MAP_ROW_INDEXES.index(input_row)
+            if input_row in state.row_indexes:
+                row = state.row_indexes.index(input_row)
                 row_value_correct = True
                 row_return_message = ""
             else:
@@ -1868,8 +4458,8 @@ def player_deploy_single_ship(map_hidden, map_display, ship_name, ship_size,
                 row_return_message = (f'There is no such Row on current map '
                                       f'with index {input_row}')
 
-            if input_column in MAP_COLUMN_INDEXES:
-                column = MAP_COLUMN_INDEXES.index(input_column)
+            if input_column in state.column_indexes:
+                column = state.column_indexes.index(input_column)
                 column_value_correct = True
                 column_return_message = ""
             else:
@@ -1907,6 +4497,9 @@ def player_deploy_single_ship(map_hidden, map_display, ship_name, ship_size,
                     map_display = map_show_ship_or_symbols(
                         map_display, coordinates_list, alignment, gaps_on_map)
                     map_display = map_show_only_ships(map_display)
+                    cell_events_add(state, OUTPUT_EVENT_DEPLOY,
+                                    (map_display,), coordinates_list,
+                                    ship_name, board=1)
                     return map_hidden, map_display, coordinates_list
             else:
                 continue
@@ -1914,8 +4507,13 @@ def player_deploy_single_ship(map_hidden, map_display, ship_name, ship_size,
                 continue
 
         except ValueError:
-            print("Values you have entered are not valid. Please enter the "
-                  "correct number of values.")
+            value_error = ("Values you have entered are not valid. Please "
+                           "enter the correct number of values.")
+            # The web client gets it with the next prompt
+            if state.cell_events is not None:
+                value_error_message = value_error
+            else:
+                print(value_error)
 
 
 def get_corrected_input(input_value, map_indexes):
@@ -1953,12 +4551,13 @@ def get_corrected_input(input_value, map_indexes):
         return None
 
 
-def user_input_check_input_is_integer(row, column):
+def user_input_check_input_is_integer(state, row, column):
     """
     Validates whether the row and column provided by the user are valid
-    integers and exist in MAP_ROW_INDEXES and MAP_COLUMN_INDEXES.
+    integers and exist in state.row_indexes and state.column_indexes.
 
     Args:
+        state (GameState): The game whose labels are checked.
         row (str): The row value entered by the user.
         column (str): The column value entered by the user.
 
@@ -1966,8 +4565,9 @@ def user_input_check_input_is_integer(row, column):
         tuple: Returns a tuple containing four elements:
                1. value_correct (bool): True if both row and column are
                valid, False otherwise.
-               2. row (int): The index of the row in MAP_ROW_INDEXES.
-               3. column (int): The index of the column in MAP_COLUMN_INDEXES.
+               2. row (int): The index of the row in state.row_indexes.
+               3. column (int): The index of the column in
+               state.column_indexes.
                4. return_message (str): A message explaining why validation
                failed, if it did.
     """
@@ -1987,9 +4587,9 @@ def user_input_check_input_is_integer(row, column):
     # validation
     if input_validation_is_integer:
 
-        # Validate the row against MAP_ROW_INDEXES
-        if row_column[0] in MAP_ROW_INDEXES:
-            row = MAP_ROW_INDEXES.index(row_column[0])
+        # Validate the row against state.row_indexes
+        if row_column[0] in state.row_indexes:
+            row = state.row_indexes.index(row_column[0])
             value_correct = True
             return_message = ""
         else:
@@ -1997,9 +4597,9 @@ def user_input_check_input_is_integer(row, column):
             return_message = (f'I am sorry, but there is no such {row} on '
                               f'the current map')
 
-        # Validate the column against MAP_COLUMN_INDEXES
-        if row_column[1] in MAP_COLUMN_INDEXES:
-            column = MAP_COLUMN_INDEXES.index(row_column[1])
+        # Validate the column against state.column_indexes
+        if row_column[1] in state.column_indexes:
+            column = state.column_indexes.index(row_column[1])
             value_correct = True
             return_message = ""
         else:
@@ -2161,34 +4761,31 @@ def player_deploy_single_ship_check_map_space(map_game, coordinates_list):
     Returns:
         bool: True if the ship can be deployed, False otherwise.
     """
-    global DEFAULT_SYMBOL  # Use the globally defined default symbol for an
-    # empty cell
-
     # Initialize variable to True. Will set to False if any coordinate is
     # occupied.
     checking_ship_fits_on_map = True
     message_text = ""
 
-    # Loop through each coordinate in the list
-    for coordinate in coordinates_list:
-        row, column = coordinate  # Unpack the tuple into row and column
-
-        # Checking if coordinates are within map boundaries
-        if 0 <= row < len(map_game) and 0 <= column < len(map_game[0]):
-
-            # If coordinates are within map, we check if it is empty space
-            if map_game[row][column] != DEFAULT_SYMBOL:
-                checking_ship_fits_on_map = False  # Set to False as the cell
-                # is occupied
-                message_text = (f' Sorry but it appears there is another '
-                                f'ship there, choose different coordinates')
-            else:
-                message_text = ""
-        else:
-            checking_ship_fits_on_map = False
-            message_text = (f' Sorry but with given coordinates, this part '
-                            f'of ship [{row}, {column}] will be out of map '
-                            f'boundaries')
+    # Bitboard of the ship cells which are inside of the map boundaries
+    ship_board = bitboard_from_coordinates(map_game, coordinates_list)
+
+    # Checking if coordinates are within map boundaries, any cell outside of
+    # the map is missing from the ship bitboard
+    if bin(ship_board).count("1") != len(coordinates_list):
+        checking_ship_fits_on_map = False
+        for row, column in coordinates_list:
+            if not (0 <= row < map_game.height and
+                    0 <= column < map_game.width):
+                message_text = (f' Sorry but with given coordinates, this '
+                                f'part of ship [{row}, {column}] will be out '
+                                f'of map boundaries')
+
+    # If coordinates are within map, we check if it is empty space
+    elif ship_board & ~bitboard_empty(map_game):
+        checking_ship_fits_on_map = False  # Set to False as a cell is
+        # occupied
+        message_text = (f' Sorry but it appears there is another '
+                        f'ship there, choose different coordinates')
 
     # If the loop completes, the ship fits and the function will return True
     return checking_ship_fits_on_map, message_text
@@ -2246,8 +4843,8 @@ def map_allocate_empty_space_for_ship(map_game, coordinates_list):
 
     This function modifies the given map_game to ensure that ships cannot be
     deployed touching each other. It marks the empty space around a ship with
-    'Miss' symbols. After all ships are deployed, these symbols will be
-    changed back to DEFAULT_SYMBOL.
+    'Miss' cells. After all ships are deployed, these cells will be
+    changed back to CELL_EMPTY.
 
     Args:
         map_game (list): The 2D map where the ship will be deployed.
@@ -2255,14 +4852,14 @@ def map_allocate_empty_space_for_ship(map_game, coordinates_list):
         located.
 
     Global Variables:
-        SHIP_SYMBOLS (dict): Dictionary containing ship symbols.
+        SHIP_CELLS (dict): Dictionary containing ship cell codes.
 
     Returns:
         list: Modified game map with empty spaces around the ship.
     """
 
-    # Access the global variable SHIP_SYMBOLS for ship symbols
-    global SHIP_SYMBOLS
+    # Access the global variable SHIP_CELLS for ship cell codes
+    global SHIP_CELLS
 
     # Define the relative positions for empty space around a single cell
     blank_space = [[-1, -1], [-1, 0], [-1, 1], [0, -1], [0, 0], [0, 1],
@@ -2286,7 +4883,11 @@ def map_allocate_empty_space_for_ship(map_game, coordinates_list):
     for new_space in blank_space_coordinates_list:
         b_row, b_column = new_space
         if 0 <= b_row < len(map_game) and 0 <= b_column < len(map_game[0]):
-            map_game[b_row][b_column] = SHIP_SYMBOLS["Miss"][0]
+            map_game[b_row][b_column] = SHIP_CELLS["Miss"][0]
+
+    # Reserve the same cells in the exclusion bitboard
+    map_mark_cells(map_game, bitboard_from_coordinates(
+        map_game, blank_space_coordinates_list), "exclusion")
 
     return map_game
 
@@ -2309,7 +4910,7 @@ def map_show_ship_or_symbols(map_game, coordinates_list, alignment,
         map. Default is True.
 
     Global Variables:
-        SHIP_SYMBOLS (dict): Dictionary containing ship symbols.
+        SHIP_CELLS (dict): Dictionary containing ship cell codes.
         DEFAULT_GAPS_BETWEEN_MAPS (bool): Default setting for gap between
         ships.
 
@@ -2317,8 +4918,8 @@ def map_show_ship_or_symbols(map_game, coordinates_list, alignment,
         list: Modified 2D game map with the ship or symbols deployed.
     """
 
-    # Use global variables for ship symbols and default gap settings
-    global SHIP_SYMBOLS
+    # Use global variables for ship cell codes and default gap settings
+    global SHIP_CELLS
     global DEFAULT_GAPS_BETWEEN_MAPS
 
     # If gaps are enabled, allocate empty space around the ship before
@@ -2327,57 +4928,58 @@ def map_show_ship_or_symbols(map_game, coordinates_list, alignment,
         map_game = map_allocate_empty_space_for_ship(map_game,
                                                      coordinates_list)
 
+    # Mark the ship cells as occupied on the bitboards
+    map_mark_cells(map_game, bitboard_from_coordinates(
+        map_game, coordinates_list), "occupied")
+
     # Case for single-cell ships
     if len(coordinates_list) == 1:
         row, column = coordinates_list[0]
-        map_game[row][column] = SHIP_SYMBOLS[alignment][0]
+        map_game[row][column] = SHIP_CELLS[alignment][0]
         return map_game
 
     # Case for multi-cell ships
     else:
         row, column = coordinates_list[0]
-        map_game[row][column] = SHIP_SYMBOLS[alignment][0]
+        map_game[row][column] = SHIP_CELLS[alignment][0]
 
         # Loop through the rest of the coordinates to place the ship symbols
         for cell in range(1, len(coordinates_list)):
             row, column = coordinates_list[cell]
-            map_game[row][column] = SHIP_SYMBOLS[alignment][1]
+            map_game[row][column] = SHIP_CELLS[alignment][1]
 
         return map_game
 
 
 def map_show_only_ships(map_game):
     """
-    Replace 'Miss' symbols on the game map with the default symbol.
+    Replace 'Miss' cells on the game map with empty cells.
 
     This function goes through each cell in the 2D game map and replaces
-    any 'Miss' symbols with the default symbol, effectively showing only ships
-    on the map.
+    any 'Miss' cells with CELL_EMPTY, effectively showing only ships on the
+    map.
 
     Args:
         map_game (list): The 2D game map to be modified.
 
     Global Variables:
-        SHIP_SYMBOLS (dict): Dictionary containing the symbols for different
-        ship states.
-        DEFAULT_SYMBOL (str): The symbol representing an empty cell on the
-        map.
+        SHIP_CELLS (dict): Dictionary containing the cell codes for
+        different ship states.
+        CELL_EMPTY (int): The code of an empty cell on the map.
 
     Returns:
         list: The modified 2D game map with only ship symbols.
     """
 
-    # Use global variables for ship symbols and the default symbol
-    global SHIP_SYMBOLS, DEFAULT_SYMBOL
+    # Use global variables for ship cell codes and the empty cell code
+    global SHIP_CELLS, CELL_EMPTY
 
-    # Loop through each row in the 2D game map
-    for row in range(len(map_game)):
-        # Loop through each column in the current row
-        for column in range(len(map_game[0])):
-            # If the current cell contains a 'Miss' symbol, replace it with
-            # the default symbol
-            if map_game[row][column] == SHIP_SYMBOLS["Miss"][0]:
-                map_game[row][column] = DEFAULT_SYMBOL
+    # 'Miss' symbols are exactly the cells of the shot and exclusion
+    # bitboards, so only those cells are visited
+    miss_board = map_game.shot | map_game.exclusion
+    for row, column in bitboard_to_coordinates(map_game, miss_board):
+        map_game[row][column] = CELL_EMPTY
+    map_mark_cells(map_game, miss_board, None)
 
     return map_game
 
@@ -2388,57 +4990,75 @@ def map_show_only_ships(map_game):
 
 def search_map_for_pattern(map_game, height, width):
     """
-    Search for occurrences of a pattern of DEFAULT_SYMBOL on the map and
+    Search for occurrences of a pattern of empty cells on the map and
     return their coordinates.
 
-    This function iterates through the game map to find all occurrences of a
-    pattern
-    of DEFAULT_SYMBOL of the specified height and width. The coordinates of
-    the top-left
-    corner of each found pattern are returned.
+    The anchors are looked up in the free-placement index of the map (see
+    map_free_anchors), which is only updated around the cells touched by
+    deployments and shots. The coordinates of the top-left corner of each
+    found pattern are returned in row order.
 
     Args:
-        map_game (List[List[str]]): The 2D game map.
+        map_game (GameMap): The 2D game map.
         height (int): The height of the pattern to search for.
         width (int): The width of the pattern to search for.
 
-    Global Variables:
-        DEFAULT_SYMBOL (str): The default symbol representing an empty cell
-        on the map.
-
     Returns:
         List[Tuple[int, int]]: A list of coordinates (row, col) where the
         pattern is found.
                                Returns an empty list if no pattern is found.
     """
 
-    # Reference the global variable for the default symbol
-    global DEFAULT_SYMBOL
+    # A pattern without cells matches on every anchor
+    if height <= 0 or width <= 0:
+        return map_scan_for_pattern(map_game, height, width)
+
+    return bitboard_to_coordinates(map_game, map_free_anchors(
+        map_game, height, width))  # Return the list of coordinates where
+    # the pattern is found
+
+
+def map_scan_for_pattern(map_game, height, width):
+    """
+    Scan the whole map for free windows of the given size.
+
+    Every window is checked in O(1) against the summed-area table of the
+    map, so one scan is a single pass over the map, and the table itself
+    is shared by all scans until the map changes.
+
+    Args:
+        map_game (GameMap): The 2D game map.
+        height (int): The height of the pattern to search for.
+        width (int): The width of the pattern to search for.
+
+    Returns:
+        List[Tuple[int, int]]: A list of coordinates (row, col) where the
+        pattern is found.
+    """
 
     # Retrieve the dimensions of the game map
-    map_height, map_width = len(map_game), len(map_game[0])
+    map_height, map_width = map_game.height, map_game.width
+
+    # A pattern without cells matches on every anchor
+    if height <= 0 or width <= 0:
+        return [(row, col) for row in range(map_height - height + 1)
+                for col in range(map_width - width + 1)]
+
+    area_index = map_get_area_index(map_game)
 
     # Initialize an empty list to collect coordinates where the pattern is
     # found
     coordinates = []
 
-    # Create the pattern using list comprehension
-    pattern = [[DEFAULT_SYMBOL] * width for _ in range(height)]
-
-    # Traverse the map to find matching patterns
+    # Traverse the map, a window is free when it holds no taken cells
     for row in range(map_height - height + 1):
-        for col in range(map_width - width + 1):
-            # Check if the section of the map matches the pattern
-            if all(
-                map_game[row + i][col + j] == pattern[i][j]
-                for i in range(height)
-                for j in range(width)
-            ):
-                # If the pattern matches, add the coordinates to the list
-                coordinates.append((row, col))
-
-    return coordinates  # Return the list of coordinates where the pattern is
-    # found
+        top, bottom = area_index[row], area_index[row + height]
+        coordinates.extend(
+            (row, col) for col in range(map_width - width + 1)
+            if bottom[col + width] - bottom[col] - top[col + width] +
+            top[col] == 0)
+
+    return coordinates
 
 
 def find_biggest_ship_in_fleet(fleet):
@@ -2480,11 +5100,35 @@ def find_biggest_ship_in_fleet(fleet):
     return biggest_ship, biggest_ship_size
 
 
+def fleet_placement_weights(fleet):
+    """
+    Count the ships left in the fleet by the windows they can be placed in.
+
+    Every ship can lie horizontally (1 x size) or vertically (size x 1), a
+    single cell ship has only one shape.
+
+    Args:
+        fleet (dict): A dictionary representing the fleet of ships.
+
+    Returns:
+        dict: (height, width) of a window mapped to the number of ships
+        which can be placed in it.
+    """
+    weights = {}
+    for ship_info in fleet.values():
+        if ship_info["Quantity"] <= 0:
+            continue
+        size = ship_info["Size"]
+        for window in {(1, size), (size, 1)}:
+            weights[window] = weights.get(window, 0) + ship_info["Quantity"]
+    return weights
+
+
 def map_search_reduce_width(height, width, map_game):
     """
     Reduce the width dimension and search for the pattern again.
 
-    This function attempts to find a pattern of DEFAULT_SYMBOL on the game
+    This function attempts to find a pattern of empty cells on the game
     map with
     given dimensions. If not found, it reduces the width by 1 and tries again.
     If it still doesn't find any, it reduces both height and width by 1.
@@ -2527,7 +5171,7 @@ def map_search_reduce_height(height, width, map_game):
     """
     Reduce the height dimension and search for the pattern again.
 
-    This function attempts to find a pattern of DEFAULT_SYMBOL on the game
+    This function attempts to find a pattern of empty cells on the game
     map with
     given dimensions. If not found, it reduces the height by 1 and tries
     again.
@@ -2568,12 +5212,15 @@ def map_search_reduce_height(height, width, map_game):
     # and found coordinates
 
 
-def cpu_choose_shooting_coordinates_biggest_ship(fleet_to_search, map_game):
+def cpu_choose_shooting_coordinates_biggest_ship(state, fleet_to_search,
+                                                 map_game):
     """
     Choose shooting coordinates for the CPU based on the biggest ship in the
     fleet.
 
     Args:
+        state (GameState): The game, its random generator is used and its
+        result is set when no ship is left.
         fleet_to_search (dict): List of ships in the fleet.
         map_game (list): The map to search for shooting coordinates.
 
@@ -2582,7 +5229,7 @@ def cpu_choose_shooting_coordinates_biggest_ship(fleet_to_search, map_game):
     """
 
     # Declare global variables used in the function
-    global DEFAULT_SYMBOL, game_result
+    global CELL_EMPTY
 
     # Initialize variables
     width = ""
@@ -2591,13 +5238,14 @@ def cpu_choose_shooting_coordinates_biggest_ship(fleet_to_search, map_game):
 
     # Check if there are any ships left in the fleet
     if ship_name is None:
-        game_result = False
+        state.game_result = False
     else:
         # Calculate the initial pattern dimensions based on the biggest ship
         width = ship_size * 2 - 1
         height = ship_size * 2 - 1
 
-        # Attempt to find the pattern in the map
+        # Attempt to find the pattern in the map. Window sizes searched in
+        # earlier moves are answered from the free-placement index
         coordinates = search_map_for_pattern(map_game, height, width)
 
         # If no suitable coordinates are found, enter a loop to adjust the
@@ -2613,7 +5261,7 @@ def cpu_choose_shooting_coordinates_biggest_ship(fleet_to_search, map_game):
                     break
 
                 # Randomly choose which dimension to reduce
-                reduction = random.choice(["height", "width"])
+                reduction = state.random.choice(["height", "width"])
 
                 # Reduce the height and search again
                 if reduction == "height":
@@ -2631,8 +5279,15 @@ def cpu_choose_shooting_coordinates_biggest_ship(fleet_to_search, map_game):
                         height < 1 or width < 1)):
                     break
 
+        # Fall back to any free cell when no window is left to search
+        if not coordinates or height < 1 or width < 1:
+            height, width = 1, 1
+            coordinates = search_map_for_pattern(map_game, 1, 1)
+            if not coordinates:
+                return None, None
+
         # Randomly choose from the found coordinates
-        chosen_coordinates = random.choice(coordinates)
+        chosen_coordinates = state.random.choice(coordinates)
 
         # Validate the format of the chosen coordinates
         if len(chosen_coordinates) != 2:
@@ -2642,8 +5297,10 @@ def cpu_choose_shooting_coordinates_biggest_ship(fleet_to_search, map_game):
         coord_row, coord_column = chosen_coordinates
 
         # Calculate the middle point of the pattern
-        middle_width = (width // 2) + random.choice([1, width % 2]) - 1
-        middle_height = (height // 2) + random.choice([1, height % 2]) - 1
+        middle_width = (width // 2) + state.random.choice(
+            [1, width % 2]) - 1
+        middle_height = (height // 2) + state.random.choice(
+            [1, height % 2]) - 1
 
         # Calculate the final shooting coordinates based on the middle point
         coordinate_column = coord_column + middle_width
@@ -2653,6 +5310,63 @@ def cpu_choose_shooting_coordinates_biggest_ship(fleet_to_search, map_game):
         return coordinate_row, coordinate_column
 
 
+def cpu_choose_shooting_coordinates_density(state, fleet_to_search,
+                                            map_game):
+    """
+    Choose shooting coordinates for the CPU where a ship is most likely.
+
+    Every cell is scored by how many legal placements of the ships left in
+    the fleet cover it (see map_density_set_weights) and the CPU shoots at
+    the best cell. Ties are broken by the random generator of the game.
+    Single cell ships add the same count to every free cell, so they are
+    left out of the density, they never change which cells are best.
+
+    Args:
+        state (GameState): The game, its random generator is used and its
+        result is set when no ship is left.
+        fleet_to_search (dict): List of ships in the fleet.
+        map_game (GameMap): The map to search for shooting coordinates.
+
+    Returns:
+        tuple: The chosen shooting coordinates (row, column), or (None,
+        None) if no cell is left to shoot at.
+    """
+    weights = fleet_placement_weights(fleet_to_search)
+
+    # Check if there are any ships left in the fleet
+    if not weights:
+        state.game_result = False
+        return None, None
+
+    weights.pop((1, 1), None)
+    map_density_set_weights(map_game, weights)
+    density = map_game.density
+    best = density.max() if map_uses_numpy(map_game) else max(density)
+
+    # Only single cell ships fit, or none at all, any free cell is as good
+    if not best:
+        coordinates = search_map_for_pattern(map_game, 1, 1)
+        if not coordinates:
+            return None, None
+        return state.random.choice(coordinates)
+
+    # Pick one of the best cells at random
+    if map_uses_numpy(map_game):
+        cells = np.flatnonzero(density == best)
+        cell = int(cells[state.random.randrange(len(cells))])
+    else:
+        # Only a few cells share the best count, list.index finds them
+        # without a Python loop over the whole map
+        cells = [density.index(best)]
+        try:
+            while True:
+                cells.append(density.index(best, cells[-1] + 1))
+        except ValueError:
+            pass
+        cell = state.random.choice(cells)
+    return divmod(cell, map_game.width)
+
+
 def find_ship_and_coordinates(fleet, target_coordinates):
     """
     Find the details of the ship and its coordinates in the fleet.
@@ -2668,6 +5382,17 @@ def find_ship_and_coordinates(fleet, target_coordinates):
                If no match is found, returns noneFound for each field.
     """
 
+    # Indexed fleets answer straight from the cell index
+    if isinstance(fleet, Fleet):
+        cell = fleet.cells.get(tuple(target_coordinates))
+        if cell is None:
+            return False, False, False, False, False
+        ship_name, coordinates_set_id, coordinates_id = cell
+        ship_info = fleet[ship_name]
+        return (ship_name, ship_info['Size'],
+                ship_info['Coordinates'][coordinates_set_id],
+                coordinates_set_id, coordinates_id)
+
     # Loop through the fleet dictionary to check each ship's coordinates
     for ship_name, ship_info in fleet.items():
 
@@ -2696,7 +5421,7 @@ def find_ship_and_coordinates(fleet, target_coordinates):
     return False, False, False, False, False
 
 
-def cpu_deploy_all_ships(map_game, fleet, gaps_on_map):
+def cpu_deploy_all_ships(state, map_game, fleet, gaps_on_map):
     """
     Deploy all CPU ships on the map.
 
@@ -2707,24 +5432,29 @@ def cpu_deploy_all_ships(map_game, fleet, gaps_on_map):
     for each ship.
 
     Args:
+        state (GameState): The game whose random generator places ships.
         map_game (list): 2D map for the CPU.
         fleet (dict): Contains the CPU's fleet information.
         gaps_on_map (bool): If True, adds gaps between ships.
 
 
     Global Variables:
-        DEFAULT_SYMBOL (str): Default symbol for empty cells.
-        SHIP_SYMBOLS (dict): Dictionary containing ship symbols.
+        CELL_EMPTY (int): Code of an empty cell.
+        SHIP_CELLS (dict): Dictionary containing ship cell codes.
 
     Returns:
         tuple: Updated map_game and fleet with the ship coordinates.
     """
 
     # Declare global variables for function access
-    global DEFAULT_SYMBOL, SHIP_SYMBOLS
+    global CELL_EMPTY, SHIP_CELLS
 
     # Initialize the map with default symbols if not already done
 
+    # Make sure the deployed cells are indexed
+    if not isinstance(fleet, Fleet):
+        fleet = Fleet(fleet)
+
     # Creating empty list for ship coordinates, which will be appended to
     # fleet later
     ship_coordinates = []
@@ -2748,7 +5478,8 @@ def cpu_deploy_all_ships(map_game, fleet, gaps_on_map):
 
             else:
                 # Randomly choose alignment for multi-cell ships
-                alignment = random.choice(["Horizontal", "Vertical"])
+                alignment = state.random.choice(["Horizontal",
+                                                 "Vertical"])
 
                 # Find a suitable location based on the alignment
                 # Try vertical alignment first
@@ -2772,7 +5503,7 @@ def cpu_deploy_all_ships(map_game, fleet, gaps_on_map):
                             # found
 
             # Choose a random suitable location
-            location = random.choice(result)
+            location = state.random.choice(result)
 
             if len(location) == 2:
                 # Deploy the ship at the chosen location
@@ -2781,8 +5512,8 @@ def cpu_deploy_all_ships(map_game, fleet, gaps_on_map):
                 map_show_ship_or_symbols(
                     map_game, coordinates_list, alignment, gaps_on_map)
 
-                # Append ship coordinates to the fleet
-                fleet[ship_name]["Coordinates"].append(coordinates_list)
+                # Append ship coordinates to the fleet and index its cells
+                fleet_add_ship_coordinates(fleet, ship_name, coordinates_list)
 
             if len(location) < 2:
                 return False  # Abort if no suitable location is found
@@ -2793,11 +5524,12 @@ def cpu_deploy_all_ships(map_game, fleet, gaps_on_map):
     return map_game, fleet  # Return the updated map and fleet
 
 
-def handle_miss(player, row, column, map_hidden, map_display):
+def handle_miss(state, player, row, column, map_hidden, map_display):
     """
     Handle the scenario where the shot misses any ship.
 
     Args:
+        state (GameState): The game, the miss is logged in its actions log.
         player (str): The player making the shot ("CPU" or "Human").
         column (int): The column-coordinate of the shot.
         row (int): The row-coordinate of the shot.
@@ -2805,41 +5537,45 @@ def handle_miss(player, row, column, map_hidden, map_display):
         map_display (list): The displayed map that shows ships.
 
     Global Variables:
-        SHIP_SYMBOLS (dict): Symbols used for different states of the ship.
-        start_time (float): The game start time for logging.
-        game_actions_log (list): Log of game actions.
+        SHIP_CELLS (dict): Cell codes used for different states of the ship.
 
     Returns:
         None
     """
 
-    # Declare global variables for ship symbols, start time, and the game
-    # actions log
-    global SHIP_SYMBOLS, start_time, game_actions_log
+    # Declare global variables for ship cell codes
+    global SHIP_CELLS
 
     # Calculate the time elapsed since the game started for logging purposes
-    timer = time.time() - start_time
+    timer = time.time() - state.start_time
 
-    # Create an action outcome message indicating a miss
-    action_outcome = (f'{player} performed shot on coordinates {row} and'
-                      f' {column} and it was a MISS')
-
-    # Log the miss action into the game actions log
-    game_actions_log.append([player, timer, row, column, action_outcome])
+    # Log the miss action into the game actions log, its message is built
+    # only when the log is printed
+    action_log_append(state.game_actions_log, player, timer, row, column,
+                      ACTION_MISS)
 
     # Update the hidden map at the given row and column to mark the miss
-    # Use the symbol designated for "Miss" in the SHIP_SYMBOLS dictionary
-    map_hidden[row][column] = SHIP_SYMBOLS["Miss"][0]
+    # Use the code designated for "Miss" in the SHIP_CELLS dictionary
+    map_hidden[row][column] = SHIP_CELLS["Miss"][0]
 
     # Update the display map at the given row and column to mark the miss
-    # Use the symbol designated for "Miss" in the SHIP_SYMBOLS dictionary
-    map_display[row][column] = SHIP_SYMBOLS["Miss"][0]
+    # Use the code designated for "Miss" in the SHIP_CELLS dictionary
+    map_display[row][column] = SHIP_CELLS["Miss"][0]
+
+    # Record the miss on the shot bitboards of both maps
+    map_mark_cells(map_hidden, bitboard_cell(map_hidden, row, column), "shot")
+    map_mark_cells(map_display, bitboard_cell(map_display, row, column),
+                   "shot")
+
+    # Changed cell for the web client, in JSON output mode
+    cell_events_add(state, ACTION_MISS, (map_hidden, map_display),
+                    [(row, column)])
 
     return map_hidden, map_display
 
 
-def action_perform_shoot(player, map_hidden, map_display, row, column,
-                         fleet, cpu_shot_log_tmp):
+def action_perform_shoot(state, player, map_hidden, map_display, row,
+                         column, fleet, cpu_shot_log_tmp):
     """
     Perform a shooting action on the game board.
 
@@ -2850,6 +5586,7 @@ def action_perform_shoot(player, map_hidden, map_display, row, column,
     shot hit a ship or missed.
 
     Args:
+        state (GameState): The game the shot is performed in.
         player (str): The player who is performing the action.
         row (int): The row coordinate for the shot.
         column (int): The column coordinate for the shot.
@@ -2859,8 +5596,6 @@ def action_perform_shoot(player, map_hidden, map_display, row, column,
         cpu_shot_log_tmp (list): Temporary log for CPU shots.
 
     Global Variables:
-        game_actions_log (list): Log of game actions.
-        start_time (datetime): The start time of the game.
         SHIP_SYMBOLS (dict): Dictionary containing ship symbols.
 
     Returns:
@@ -2872,7 +5607,11 @@ def action_perform_shoot(player, map_hidden, map_display, row, column,
     """
 
     # Declare global variables for function access
-    global game_actions_log, start_time, SHIP_SYMBOLS
+    global SHIP_SYMBOLS
+
+    # Remember the shot, so repeated shots are found without reading the log
+    state.shots_fired[player] = state.shots_fired.get(player, 0) | (
+        bitboard_cell(map_hidden, row, column))
 
     # Find the ship details at the given coordinates
     (ship_name, ship_size, coordinates_list, coordinates_set_id,
@@ -2883,14 +5622,14 @@ def action_perform_shoot(player, map_hidden, map_display, row, column,
         if ship_name:
             # Handle the logic for a hit ship
             map_hidden, map_display, fleet = handle_ship_hit(
-                player, row, column, map_hidden, map_display, fleet,
+                state, player, row, column, map_hidden, map_display, fleet,
                 ship_name, ship_size, coordinates_list, coordinates_set_id,
                 coordinates_id, cpu_shot_log_tmp)
             return map_hidden, map_display, fleet
 
         else:  # If no ship was found at the coordinates
             # Handle the logic for a missed shot
-            map_hidden, map_display = handle_miss(player, row, column,
+            map_hidden, map_display = handle_miss(state, player, row, column,
                                                   map_hidden, map_display)
             return map_hidden, map_display, fleet
 
@@ -2899,8 +5638,8 @@ def action_perform_shoot(player, map_hidden, map_display, row, column,
         return None  # Return None if an error occurs
 
 
-def handle_ship_hit(player, row, column, map_hidden, map_display, fleet,
-                    ship_name, ship_size, coordinates_list,
+def handle_ship_hit(state, player, row, column, map_hidden, map_display,
+                    fleet, ship_name, ship_size, coordinates_list,
                     coordinates_set_id, coordinates_list_id,
                     cpu_shot_log_tmp):
     """
@@ -2910,6 +5649,7 @@ def handle_ship_hit(player, row, column, map_hidden, map_display, fleet,
     It updates the map, checks if a ship is sunk, and logs the action.
 
     Args:
+        state (GameState): The game, the hit is logged in its actions log.
         player (str): The player making the shot ("CPU" or "Human").
         row (int): The row-coordinate of the shot.
         column (int): The column-coordinate of the shot.
@@ -2925,9 +5665,7 @@ def handle_ship_hit(player, row, column, map_hidden, map_display, fleet,
         cpu_shot_log_tmp (list): Temporary log for CPU actions.
 
     Global Variables:
-        game_actions_log (list): Log of game actions.
-        start_time (float): The game start time for logging.
-        SHIP_SYMBOLS (dict): Symbols used for different states of the ship.
+        SHIP_CELLS (dict): Cell codes used for different states of the ship.
 
     Returns:
         - fleet_target: Dictionary holding information about the CPU's fleet.
@@ -2936,24 +5674,28 @@ def handle_ship_hit(player, row, column, map_hidden, map_display, fleet,
         then display hit or miss
     """
 
-    # Declare global variables for logging and timing
-    global game_actions_log, start_time, SHIP_SYMBOLS
+    # Declare global variables for ship cell codes
+    global SHIP_CELLS
 
     # Calculate the elapsed time since the game started
-    timer = time.time() - start_time
+    timer = time.time() - state.start_time
 
     # Update the hidden and display maps to indicate a hit
-    map_hidden[row][column] = SHIP_SYMBOLS["Hit"][0]
-    map_display[row][column] = SHIP_SYMBOLS["Hit"][0]
-
-    # Log the action in the global game actions log
-    log_text = (f'{player} performed shot on coordinates {row} '
-                f'and {column} and it was a HIT. Some Ship Damaged')
-    game_actions_log.append([player, timer, row, column, log_text])
+    map_hidden[row][column] = SHIP_CELLS["Hit"][0]
+    map_display[row][column] = SHIP_CELLS["Hit"][0]
+    map_mark_cells(map_hidden, bitboard_cell(map_hidden, row, column), "hit")
+    map_mark_cells(map_display, bitboard_cell(map_display, row, column),
+                   "hit")
+    cell_events_add(state, ACTION_HIT, (map_hidden, map_display),
+                    [(row, column)])
+
+    # Log the action in the game actions log
+    action_log_append(state.game_actions_log, player, timer, row, column,
+                      ACTION_HIT)
 
     # If the player is the CPU, append the shot to the CPU's temporary shot
     # log
-    if player == "CPU":
+    if player.startswith("CPU"):
         cpu_shot_log_tmp.append([row, column])
 
     # Initialize the ship_sunk flag as False
@@ -2962,29 +5704,29 @@ def handle_ship_hit(player, row, column, map_hidden, map_display, fleet,
     # Determine the alignment of the ship
     alignment, coordinates_index = find_first_ship_alignment(coordinates_list)
 
-    # Check if the ship is sunk
-    for coord in coordinates_list:
-        r, c = coord
-        if map_hidden[r][c] != SHIP_SYMBOLS["Hit"][0]:
-            ship_sunk = False
-            break
+    # Check if the ship is sunk, every ship cell has to be on hit bitboard
+    ship_board = bitboard_from_coordinates(map_hidden, coordinates_list)
+    if ship_board and not ship_board & ~map_hidden.hit:
         ship_sunk = True
 
     # If the ship is sunk, handle additional logic
     if ship_sunk:
         alignment += "Sunk"
         map_hidden, map_display, fleet = (
-            handle_ship_sunk(map_hidden, map_display, player, fleet,
-                             ship_name, row, column, ship_size, alignment,
-                             coordinates_list, coordinates_set_id,
-                             coordinates_list_id, cpu_shot_log_tmp))
+            handle_ship_sunk(state, map_hidden, map_display, player, fleet,
+                             ship_name, ship_size=ship_size, row=row,
+                             column=column, alignment=alignment,
+                             coordinates_list=coordinates_list,
+                             coordinates_set_id=coordinates_set_id,
+                             coordinates_list_id=coordinates_list_id,
+                             cpu_shot_log_tmp=cpu_shot_log_tmp))
     return map_hidden, map_display, fleet
 
 
-def handle_ship_sunk(map_hidden, map_display, player, fleet, ship_name,
-                     ship_size, row, column, alignment, coordinates_list,
-                     coordinates_set_id, coordinates_list_id, cpu_shot_log_tmp,
-                     gaps_on_map=True):
+def handle_ship_sunk(state, map_hidden, map_display, player, fleet,
+                     ship_name, ship_size, row, column, alignment,
+                     coordinates_list, coordinates_set_id, coordinates_list_id,
+                     cpu_shot_log_tmp):
     """
     Handle actions and updates for when a ship is sunk.
 
@@ -2993,10 +5735,15 @@ def handle_ship_sunk(map_hidden, map_display, player, fleet, ship_name,
     the fleet, and various logs.
 
     Args:
+        state (GameState): The game, the sinking is logged in its actions
+        log and its gap setting decides if the cells around the ship are
+        shown as missed.
         player (str): The player who sunk the ship ("CPU" or "Human").
         fleet (dict): The current fleet information.
         ship_name (str): The name of the ship that was sunk.
         ship_size (int): The size of the ship.
+        row (int): Row of the shot which sunk the ship.
+        column (int): Column of the shot which sunk the ship.
         coordinates_list (list): The list of coordinates of the ship.
         coordinates_set_id (int): The ID of the coordinate set in the fleet.
         coordinates_list_id (int): The ID of the coordinates in the
@@ -3006,14 +5753,9 @@ def handle_ship_sunk(map_hidden, map_display, player, fleet, ship_name,
         cpu_shot_log_tmp (list): Temporary log of CPU actions.
         alignment (str): The alignment of the ship ("Horizontal" or
         "Vertical").
-        gaps_on_map (bool): Flag to indicate if gaps are allowed on the map.
-
 
     Global Variables:
-        start_time (float): Game start time for logging.
         SHIP_SYMBOLS (dict): Symbols for different ship states.
-        game_actions_log (list): Log of game actions.
-        game_result (str): The result of the game ("Game Over" or None).
 
     Returns:
         - fleet_target: Dictionary holding information about the CPU's fleet.
@@ -3021,24 +5763,27 @@ def handle_ship_sunk(map_hidden, map_display, player, fleet, ship_name,
         - map_display: Display map if shoot is success,
         then display hit or miss
     """
-    # Declare global variables for logging and timing
-    global start_time, SHIP_SYMBOLS, game_actions_log, game_result
+    # Declare global variables for ship symbols
+    global SHIP_SYMBOLS
 
-    # Update the display and hidden maps to reflect the sunk ship
+    # Update the display and hidden maps to reflect the sunk ship. Cells
+    # around it can only be shown as missed if ships can not touch
+    snapshot = cell_events_snapshot(state, (map_hidden, map_display),
+                                    coordinates_list)
     map_show_ship_or_symbols(map_display, coordinates_list, alignment,
-                             gaps_on_map)
+                             state.gaps_on_map)
     map_show_ship_or_symbols(map_hidden, coordinates_list, alignment,
-                             gaps_on_map)
+                             state.gaps_on_map)
+    cell_events_add_changes(state, ACTION_SUNK, snapshot, ship_name)
 
     # Log the action of sinking the ship
-    timer = time.time() - start_time
-    action_outcome = (f'{player} performed shot on coordinates {row} '
-                      f'and {column} and {ship_name} was SUNK')
-    game_actions_log.append([player, timer, coordinates_list[0][0],
-                             coordinates_list[0][1], action_outcome])
+    timer = time.time() - state.start_time
+    action_log_append(state.game_actions_log, player, timer,
+                      coordinates_list[0][0], coordinates_list[0][1],
+                      ACTION_SUNK, ship_name, row, column)
 
     # If the player is the CPU, update its temporary shot log
-    if player == "CPU":
+    if player.startswith("CPU"):
         cpu_shot_log_tmp = update_cpu_shot_log(coordinates_list,
                                                cpu_shot_log_tmp)
 
@@ -3047,10 +5792,13 @@ def handle_ship_sunk(map_hidden, map_display, player, fleet, ship_name,
 
     # Check for game over condition
     if not fleet:
-        timer = time.time() - start_time
-        game_actions_log.append([player, timer, coordinates_list[0][0],
-                                 coordinates_list[0][1], "Game Over"])
-        game_result = False
+        timer = time.time() - state.start_time
+        action_log_append(state.game_actions_log, player, timer,
+                          coordinates_list[0][0], coordinates_list[0][1],
+                          ACTION_GAME_OVER)
+        cell_events_add(state, ACTION_GAME_OVER, (map_hidden, map_display),
+                        [])
+        state.game_result = False
     return map_hidden, map_display, fleet
 
 
@@ -3060,18 +5808,15 @@ def remove_coordinates_from_fleet(fleet, ship_name, coordinates_list_set_id):
     Also removes any empty coordinate sets in the list.
 
     Parameters:
-    - fleet (dict): The fleet information
+    - fleet (Fleet): The fleet information
     - ship_name (str): The name of the ship to update
     - coordinates_list_set_id (int): Index of the set of coordinates to remove
     """
-    # Initial logging to display the current state of the fleet
-    # coordinates_list_set_id)
-    print_fleet(fleet)
-
     try:
 
         # Remove the entire set of coordinates from the ship
-        del fleet[ship_name]["Coordinates"][coordinates_list_set_id]
+        removed_coordinates = fleet[ship_name]["Coordinates"].pop(
+            coordinates_list_set_id)
 
         # Remove any empty coordinate sets from the ship's list of coordinates
         fleet[ship_name]["Coordinates"] = [coords for coords in fleet[
@@ -3085,6 +5830,14 @@ def remove_coordinates_from_fleet(fleet, ship_name, coordinates_list_set_id):
         if fleet[ship_name]["Quantity"] <= 0:
             del fleet[ship_name]
 
+        # Keep the cell index in sync, only this ship type is re-indexed as
+        # its later coordinate sets have moved
+        if isinstance(fleet, Fleet):
+            for row, column in removed_coordinates:
+                fleet.cells.pop((row, column), None)
+            if ship_name in fleet:
+                fleet_index_ship(fleet, ship_name)
+
     except KeyError:
         # Handle cases where the specified ship name does not exist in the
         # fleet
@@ -3173,18 +5926,19 @@ def find_first_ship_alignment(coordinates_list):
     return ('None', None)
 
 
-def select_best_shot_based_on_alignment(map_to_search, cpu_shot_log_tmp):
+def select_best_shot_based_on_alignment(state, map_to_search,
+                                        cpu_shot_log_tmp):
     """
     Chooses the best coordinates to shoot at based on ship alignment
     detection.
 
     Args:
+        state (GameState): The game whose random generator picks the shot.
         map_to_search (list of lists): The map to search for ship coordinates.
+        cpu_shot_log_tmp (list of lists): Temporary log of CPU shots.
 
     Global Variables:
-        cpu_shot_log_tmp (list of lists): Temporary log of CPU shots.
-        DEFAULT_SYMBOL (str): The default symbol representing untargeted
-        cells in the map.
+        CELL_EMPTY (int): The code of untargeted cells in the map.
 
     Returns:
         tuple: The chosen column and row coordinates to target next based on
@@ -3192,7 +5946,7 @@ def select_best_shot_based_on_alignment(map_to_search, cpu_shot_log_tmp):
                Returns (None, None) if no suitable coordinates are found.
     """
     # Access global variables
-    global DEFAULT_SYMBOL
+    global CELL_EMPTY
 
     # Get the alignment and last index from the CPU shot log
     alignment_info = find_first_ship_alignment(cpu_shot_log_tmp)
@@ -3211,6 +5965,9 @@ def select_best_shot_based_on_alignment(map_to_search, cpu_shot_log_tmp):
     max_row = len(map_to_search) - 1
     max_column = len(map_to_search[0]) - 1
 
+    # Bitboard of the cells which have not been shot at yet
+    empty_board = bitboard_empty(map_to_search)
+
     # Initialize a list to store potential shot coordinates
     potential_shots = []
     shifts = []
@@ -3232,7 +5989,8 @@ def select_best_shot_based_on_alignment(map_to_search, cpu_shot_log_tmp):
             # Check if the cell is within map boundaries and is untargeted
             if 0 <= new_row <= max_row and 0 <= new_column <= max_column:
                 # Then check if the cell hasn't been shot at before
-                if map_to_search[new_row][new_column] == DEFAULT_SYMBOL:
+                if empty_board & bitboard_cell(map_to_search, new_row,
+                                               new_column):
                     potential_shots.append([new_row, new_column])
 
         if len(potential_shots) > 0:
@@ -3248,7 +6006,8 @@ def select_best_shot_based_on_alignment(map_to_search, cpu_shot_log_tmp):
                 # haven't been shot at before
                 if 0 <= new_row <= max_row and 0 <= new_column <= max_column:
                     # Then check if the cell hasn't been shot at before
-                    if map_to_search[new_row][new_column] == DEFAULT_SYMBOL:
+                    if empty_board & bitboard_cell(map_to_search, new_row,
+                                                   new_column):
                         potential_shots.append([new_row, new_column])
                 if len(potential_shots) > 0:
                     break
@@ -3256,28 +6015,30 @@ def select_best_shot_based_on_alignment(map_to_search, cpu_shot_log_tmp):
                 break
     # Randomly choose one of the potential shots if any are available
     if len(potential_shots) > 0:
-        selected_row, selected_column = random.choice(potential_shots)
+        selected_row, selected_column = state.random.choice(
+            potential_shots)
         return selected_row, selected_column
 
     # If no potential shots were found, return None, None
     return None, None
 
 
-def cpu_move(map_hidden, map_display, fleet_target, cpu_shot_log_tmp):
+def cpu_move(state, map_hidden, map_display, fleet_target, cpu_shot_log_tmp,
+             player="CPU"):
     """
     Executes the CPU's move during the game.
     Args:
+        - state: The game the move is played in.
         - fleet_target: Dictionary holding information about the CPU's fleet.
         - map_hidden: Hidden map here we perform search and shoot
         - map_display: Display map if shoot is success,
         then display hit or miss
         - cpu_shot_log_tmp: Temporary log for the CPU's shots.
+        - player: Name of the CPU player used in logs, it has to start with
+        "CPU". Default is "CPU".
 
 
     Global Variables:
-        - game_result: Holds current state of the game ("Game Over" or None)
-        - game_actions_log: Log for game actions.
-        - start_time: Time when the game started.
         - SHIP_SYMBOLS: Dictionary holding symbols for different ship states.
 
     Returns:
@@ -3285,176 +6046,330 @@ def cpu_move(map_hidden, map_display, fleet_target, cpu_shot_log_tmp):
     """
 
     # Declare global variables accessed within the function
-    global game_actions_log, start_time, SHIP_SYMBOLS, game_result
-
-    # Identify the player as CPU for logging and action purposes
+    global SHIP_SYMBOLS
 
-    player = "CPU"
+    row, column = None, None
 
     # Check if there are any damaged but not sunk ships in cpu_shot_log_tmp
-    if len(cpu_shot_log_tmp) == 0:
-        # If no damaged ships are found, choose coordinates based  n the
-        # largest ship in the fleet
-        row, column = cpu_choose_shooting_coordinates_biggest_ship(
-            fleet_target, map_hidden)
-        # Perform the shooting action and update the game state
-        map_hidden, map_display, fleet = (
-            action_perform_shoot(player, map_hidden, map_display, row,
-                                 column, fleet_target, cpu_shot_log_tmp))
-        return map_hidden, map_display, fleet
-
-        # Check for game over condition
-    else:
+    if len(cpu_shot_log_tmp) > 0:
         # If damaged ships are found, focus on sinking them by selecting the
         # best shot based on ship alignment
-        row, column = select_best_shot_based_on_alignment(map_hidden,
+        row, column = select_best_shot_based_on_alignment(state, map_hidden,
                                                           cpu_shot_log_tmp)
-        # Perform the shooting action and update the game state
-        map_hidden, map_display, fleet = (
-            action_perform_shoot(player, map_hidden, map_display, row,
-                                 column, fleet_target, cpu_shot_log_tmp))
-        return map_hidden, map_display, fleet
+
+    # If no damaged ships are found (or none of them has a free cell next
+    # to it), hunt for the next ship the way the game is set up to
+    if row is None and state.hunt_mode == "density":
+        row, column = cpu_choose_shooting_coordinates_density(
+            state, fleet_target, map_hidden)
+    elif row is None:
+        row, column = cpu_choose_shooting_coordinates_biggest_ship(
+            state, fleet_target, map_hidden)
+
+    # No cell is left to shoot at, nothing changes
+    if row is None:
+        return map_hidden, map_display, fleet_target
+
+    # Perform the shooting action and update the game state
+    map_hidden, map_display, fleet = (
+        action_perform_shoot(state, player, map_hidden, map_display, row,
+                             column, fleet_target, cpu_shot_log_tmp))
+    return map_hidden, map_display, fleet
 
 
 """Game Start Functions
 ---------------------"""
 
 
-def cpu_vs_cpu(height, width, fleet, gaps_on_map):
+def cpu_vs_cpu(state, height, width, fleet, gaps_on_map):
     """
     Simulate a CPU vs CPU game.
 
     This function initializes game variables, runs a loop simulating CPU
     moves,
     and displays game maps and logs.
+
+    The simulation is played in its own GameState, which shares labels and
+    random generator with 'state', so the game being set up is untouched.
     """
     # Declare global variables
-    global DEFAULT_SYMBOL, cpu_shot_log_tmp, game_actions_log
+    global CELL_EMPTY
+
+    # Separate game for the simulation, printed with the same labels
+    cvc_state = GameState(height, width, fleet, gaps_on_map,
+                          hunt_mode=state.hunt_mode,
+                          log_sink=state.log_sink)
+    cvc_state.row_indexes = state.row_indexes
+    cvc_state.column_indexes = state.column_indexes
+    cvc_state.random = state.random
 
     # Initialize map and fleet for CPU
     map_cpu_hidden, map_cpu_display, fleet_cpu = (
-        create_initial_game_variables(height, width, DEFAULT_SYMBOL, fleet))
+        create_initial_game_variables(height, width, CELL_EMPTY, fleet))
 
     # Deploy CPU's ships on its map
-    map_cpu_display, fleet_cpu = cpu_deploy_all_ships(map_cpu_display,
-                                                      fleet_cpu, gaps_on_map)
-
-    # Initialize game actions log
-    game_actions_log = [["Player", "Time", "Row", "Column", ""]]
+    map_cpu_display, fleet_cpu = cpu_deploy_all_ships(
+        cvc_state, map_cpu_display, fleet_cpu, gaps_on_map)
 
     # Calculate the maximum number of game moves
     game_moves = len(map_cpu_display) * len(map_cpu_display[0])
 
     # Main game loop
     for i in range(game_moves):
-        # Clear terminal for fresh display
-        clear_terminal()
-
-        # Display the last action message from the log
-        print(game_actions_log[-1][4])
-
-        # Print both maps side by side
-        print_two_maps(map_cpu_hidden, map_cpu_display, "CPU Map", "Player "
-                                                                   "Map", 10)
+        # Display the last action message from the log and both maps side
+        # by side, only changed cells are redrawn
+        screen_draw(cvc_state.screen,
+                    action_log_messages(cvc_state.game_actions_log, 1) +
+                    render_two_maps(cvc_state, map_cpu_hidden,
+                                    map_cpu_display, "CPU Map", "Player Map",
+                                    10))
+        output_end_frame()
 
         # Simulate a move by the CPU
         map_cpu_hidden, map_cpu_display, fleet_cpu = cpu_move(
-            map_cpu_hidden, map_cpu_display, fleet_cpu, cpu_shot_log_tmp
+            cvc_state, map_cpu_hidden, map_cpu_display, fleet_cpu,
+            cvc_state.cpu_shot_log_tmp
         )
 
-        # Break the loop if the game has ended (assuming game result is a
-        # global variable)
-        if not game_result:
+        # Break the loop if the game has ended
+        if not cvc_state.game_result:
             break
 
     # Final display of maps and logs
-    print_two_maps(map_cpu_hidden, map_cpu_display, "CPU Map", "Player "
-                                                               "Map", 10)
-    print_aligned_log(game_actions_log, 5)
+    print_two_maps(cvc_state, map_cpu_hidden, map_cpu_display, "CPU Map",
+                   "Player Map", 10)
+    print_aligned_log(cvc_state.game_actions_log, 5, LOG_PRINT_TAIL)
+
+    # The simulation is over, its log is made safe on disk
+    log_sink_sync(cvc_state.log_sink)
+
+
+def simulate_cpu_vs_cpu(height, width, fleet, gaps_on_map, seed=None,
+                        hunt_mode=DEFAULT_CPU_HUNT_MODE):
+    """
+    Play one whole CPU vs CPU game without any output.
+
+    Two CPUs ("CPU 1" and "CPU 2") deploy the same fleet and take turns
+    shooting at each other until one fleet is sunk. Nothing is rendered,
+    the terminal is not cleared, and every game gets its own GameState, so
+    it is safe to call it many thousand times in a row.
+
+    Args:
+        height (int): The height of the game map.
+        width (int): The width of the game map.
+        fleet (dict): The fleet configuration used by both CPUs.
+        gaps_on_map (bool): If True, ships can not touch each other.
+        seed (int, optional): Seed for the random generator, so the game
+        can be replayed.
+        hunt_mode (str, optional): How both CPUs hunt for ships, one of
+        CPU_HUNT_MODES.
+
+    Returns:
+        SimulationResult: Winner, shots to win, the turn every ship was
+        sunk on and the hit cells of both maps. Returns None if a fleet
+        can not be deployed.
+    """
+    # Both CPUs play in one game state with its own random generator. Nobody
+    # reads the log of a headless game, so only the latest actions are kept
+    state = GameState(height, width, fleet, gaps_on_map, seed, hunt_mode,
+                      SIMULATION_LOG_CAPACITY)
+
+    # Create and deploy the maps and fleets of both CPUs
+    sides = []
+    for player in ("CPU 1", "CPU 2"):
+        map_hidden, map_display, side_fleet = create_initial_game_variables(
+            height, width, CELL_EMPTY, fleet)
+        deployed = cpu_deploy_all_ships(state, map_display, side_fleet,
+                                        gaps_on_map)
+        if not deployed:
+            return None
+        map_display, side_fleet = deployed
+        sides.append({"player": player, "map_hidden": map_hidden,
+                      "map_display": map_display, "fleet": side_fleet,
+                      "shot_log": [], "shots": 0})
+
+    sunk_turns = []
+
+    # Every cell of both maps can be shot only once
+    for turn in range(2 * height * width):
+        attacker = sides[turn % 2]
+        defender = sides[1 - turn % 2]
+        target_fleet = defender["fleet"]
+
+        # Quantities before the shot tell which ship was sunk by it
+        quantities = {ship_name: ship_info["Quantity"] for
+                      ship_name, ship_info in target_fleet.items()}
+
+        defender["map_hidden"], defender["map_display"], target_fleet = (
+            cpu_move(state, defender["map_hidden"], defender["map_display"],
+                     target_fleet, attacker["shot_log"],
+                     attacker["player"]))
+        defender["fleet"] = target_fleet
+        attacker["shots"] += 1
+
+        for ship_name, quantity in quantities.items():
+            if target_fleet.get(ship_name, {"Quantity": 0})[
+                    "Quantity"] < quantity:
+                sunk_turns.append((attacker["player"], ship_name, turn + 1))
+
+        if not target_fleet:
+            break
+    else:
+        attacker = {"player": None, "shots": 0}
+
+    # Sunk ships are drawn over their hits, so both layers are hit cells
+    hit_cells = tuple(side["map_hidden"].hit | side["map_hidden"].occupied
+                      for side in sides)
+    return SimulationResult(attacker["player"], attacker["shots"],
+                            tuple(sunk_turns), hit_cells)
 
 
 # Run the game
-def battleship_game_singe():
+def battleship_game_singe(intro_mode=DEFAULT_INTRO_MODE, log_sink=None,
+                          output_mode=DEFAULT_OUTPUT_MODE):
     """
     Main game loop for the CPU's Battleship game.
 
+    The whole game lives in one GameState: settings, labels, maps and
+    fleets of the player and the CPU, the CPU's shot log and the game
+    actions log.
+
+    Args:
+    - intro_mode (str, optional): How the logo is shown before the first
+    prompt, one of INTRO_MODES.
+    - log_sink (LogSink, optional): File every game action is streamed to.
+    - output_mode (str, optional): How the game is drawn, one of
+    OUTPUT_MODES.
+
     Global Variables:
-    - start_time: Time when the game started.
-    - map_cpu_hidden: Hidden map for the CPU.
-    - map_cpu_display: Display map for the CPU.
-    - cpu_shot_log_tmp: Temporary log for the CPU's shots.
-    - game_actions_log: Log for game actions.
-    - fleet_cpu: Dictionary holding information about the CPU's fleet.
+    - CELL_EMPTY: The code of an empty cell to fill the game maps with.
 
     Returns:
     - play_again (bool): if it is true, new game will start.
     """
 
     # Declare global variables accessed within the function
-    global cpu_shot_log_tmp, game_actions_log, DEFAULT_SYMBOL, game_result
+    global CELL_EMPTY
 
-    # Clear terminal for a clean game start (assuming the function
-    # 'clear_terminal' exists)
-    clear_terminal()
+    # Every game starts with default settings and its own state
+    state = GameState(log_sink=log_sink, output_mode=output_mode)
+
+    # The web client draws its own page, terminals get a clean screen and
+    # the ASCII art
+    if state.cell_events is None:
+        # Clear terminal for a clean game start (assuming the function
+        # 'clear_terminal' exists)
+        clear_terminal()
 
-    # Print ASCII art
-    print_acid_effect()
+        # Print ASCII art
+        print_acid_effect(intro_mode)
 
     # Initializing game instructions
-    height, width, fleet, gaps_on_map = game_instructions()
+    state.height, state.width, state.fleet, state.gaps_on_map = (
+        game_instructions(state))
 
     # Creating Maps for player and CPU:
-    map_cpu_hidden, map_cpu_display, fleet_cpu = (
-        create_initial_game_variables(height, width, DEFAULT_SYMBOL, fleet))
+    state.map_cpu_hidden, state.map_cpu_display, state.fleet_cpu = (
+        create_initial_game_variables(state.height, state.width,
+                                      CELL_EMPTY, state.fleet))
 
-    map_player_hidden, map_player_display, fleet_player = (
-        create_initial_game_variables(height, width, DEFAULT_SYMBOL, fleet))
+    state.map_player_hidden, state.map_player_display, state.fleet_player = (
+        create_initial_game_variables(state.height, state.width,
+                                      CELL_EMPTY, state.fleet))
 
     # Now we will ask player to Deploy all ships:
-    map_player_display, fleet_player = player_deploy_all_ships(
-        map_player_display, map_player_hidden, fleet_player, gaps_on_map)
+    state.map_player_display, state.fleet_player = player_deploy_all_ships(
+        state, state.map_player_display, state.map_player_hidden,
+        state.fleet_player, state.gaps_on_map)
 
     """ temporary code so cpu deploys ships for player
-    map_player_display, fleet_player = (
-        cpu_deploy_all_ships(map_player_display, fleet_player, gaps_on_map))
+    state.map_player_display, state.fleet_player = (
+        cpu_deploy_all_ships(state, state.map_player_display,
+                             state.fleet_player, state.gaps_on_map))
         """
 
     # After all player ships are deployed, we will reset hidden map, so it is
     # blank. This map will be attacked by CPU.
-    map_player_hidden = create_map(height, width, DEFAULT_SYMBOL)
-    map_player_display = map_show_only_ships(map_player_display)
+    state.map_player_hidden = create_map(state.height, state.width,
+                                         CELL_EMPTY)
+    state.map_player_display = map_show_only_ships(state.map_player_display)
 
     # CPU time to deploy its ships
-    map_cpu_display, fleet_cpu = cpu_deploy_all_ships(map_cpu_display,
-                                                      fleet_cpu, gaps_on_map)
+    state.map_cpu_display, state.fleet_cpu = cpu_deploy_all_ships(
+        state, state.map_cpu_display, state.fleet_cpu, state.gaps_on_map)
 
     # now creating loop for this current game
-    game_result = True
-    game_actions_log = [["Player", "Time", "Row", "Column", ""]]
+    game_state_reset(state)
 
     while True:
-        if not game_result:
+        if not state.game_result:
             break
-        clear_terminal()
-        if len(game_actions_log) > 1:
-            print(game_actions_log[-2][4])
-        print(game_actions_log[-1][4])
-        print_two_maps(map_cpu_hidden, map_player_display, "CPU Map",
-                       "Player Map", 10)
+        # Last actions and both maps, only changed cells are redrawn. The
+        # web client gets the changed cells with the prompt instead.
+        if state.cell_events is None:
+            messages = action_log_messages(state.game_actions_log, 2)
+            screen_draw(state.screen, messages + render_two_maps(
+                state, state.map_cpu_hidden, state.map_player_display,
+                "CPU Map", "Player Map", 10))
         # Player goes first
-        map_cpu_hidden, map_cpu_display, fleet_cpu = player_shoot_input(
-            map_cpu_hidden, map_cpu_display, fleet_cpu)
-        if not game_result:
+        state.map_cpu_hidden, state.map_cpu_display, state.fleet_cpu = (
+            player_shoot_input(state, state.map_cpu_hidden,
+                               state.map_cpu_display, state.fleet_cpu))
+        if not state.game_result:
             break
-        map_player_hidden, map_player_display, fleet_player = cpu_move(
-            map_player_hidden, map_player_display, fleet_player,
-            cpu_shot_log_tmp)
+        (state.map_player_hidden, state.map_player_display,
+         state.fleet_player) = cpu_move(
+            state, state.map_player_hidden, state.map_player_display,
+            state.fleet_player, state.cpu_shot_log_tmp)
+        # The turn is over, whatever it printed goes out together
+        output_end_frame()
+
+    # Game is over, its log is made safe on disk before anything else
+    log_sink_sync(state.log_sink)
 
     # Game is over, lets call out function to handle this
-    print("Game over, Thank you for playing this Game")
-    print("If you would like to play again, type Y and game will start again")
+    if state.cell_events is not None:
+        output_json_prompt(state, "over")
+    else:
+        print("Game over, Thank you for playing this Game")
+        print("If you would like to play again, type Y and game will start "
+              "again")
     play_again = input()
     return play_again
 
 
-battleship_game_singe()
+def main(argv, environ):
+    """
+    Plays one game on the terminal with the options given on the command
+    line and in the environment. A game ended by a session limit is ended
+    like any other: its log is flushed and synced before main() returns.
+
+    Args:
+        argv (list): Command line arguments, without the program name.
+        environ (mapping): Environment variables.
+    """
+    intro_mode = read_intro_mode(argv, environ)
+    output_mode = read_output_mode(environ)
+    install_output_coalescer(read_output_window(environ))
+    game_log_sink = open_log_sink(environ.get(LOG_SINK_VARIABLE))
+    # Lines typed by the web client are not echoed back to it
+    terminal_echo = (terminal_echo_off() if output_mode == "json" else
+                     None)
+    session_input, memory_soft_limit = install_session_limits(environ)
+    try:
+        battleship_game_singe(intro_mode, game_log_sink, output_mode)
+    except SessionExpired as error:
+        print(f"\nSession ended: {error}")
+    except MemoryError:
+        release_session_limits(session_input, memory_soft_limit)
+        print("\nSession ended: memory limit reached")
+    finally:
+        # Whatever ended the game, its log is written out and synced
+        release_session_limits(session_input, memory_soft_limit)
+        log_sink_close(game_log_sink)
+        terminal_echo_restore(terminal_echo)
+        output_end_frame()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:], os.environ)
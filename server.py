@@ -0,0 +1,302 @@
+# server.py - host many terminal Battleship sessions in one Python process
+
+# Import required libraries
+import argparse  # For reading the server settings from command line
+import asyncio  # For serving all connections from one event loop
+import concurrent.futures  # For the threads the game sessions run in
+import contextvars  # For finding the session of the running game
+import os  # For the terminal size every session is drawn for
+import sys  # For routing input() and print() to the sessions
+import threading  # For the stack size of session threads
+
+import run  # The game engine
+
+
+# Default server settings, can be changed from command line
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8023
+DEFAULT_MAX_SESSIONS = 500
+# Terminal size sessions are drawn for, the same the pty bridge uses
+DEFAULT_COLUMNS = 120
+DEFAULT_LINES = 24
+# Stack size of a session thread. The game never recurses deeply, so a
+# small stack keeps hundreds of sessions cheap.
+SESSION_STACK_SIZE = 512 * 1024
+
+# Session of the game running in the current thread, None outside games
+CURRENT_SESSION = contextvars.ContextVar("CURRENT_SESSION", default=None)
+
+
+"""Session functions
+------------------"""
+
+
+class Session:
+    """
+    One connected player: the connection and the text the game printed
+    but has not sent yet.
+
+    The game itself is the usual synchronous flow of run.py, played in its
+    own thread and in its own GameState. Lines typed by the player are read
+    by the event loop through the async reader and handed to the blocked
+    input() call, and printed text is sent by the event loop.
+
+    Attributes:
+        reader (asyncio.StreamReader): Input of the connection.
+        writer (asyncio.StreamWriter): Output of the connection.
+        loop (asyncio.AbstractEventLoop): Loop serving the connection.
+        pending (list): Text printed by the game and not sent yet.
+        closed (bool): True once the player has disconnected.
+        idle_timeout (float): Seconds a prompt may wait for the player, 0
+        for no limit.
+    """
+
+    __slots__ = ("reader", "writer", "loop", "pending", "closed",
+                 "idle_timeout")
+
+    def __init__(self, reader, writer, loop, idle_timeout=0):
+        self.reader = reader
+        self.writer = writer
+        self.loop = loop
+        self.pending = []
+        self.closed = False
+        self.idle_timeout = idle_timeout
+
+
+def session_readline(session):
+    """
+    Wait in the game thread for the next line typed by the player.
+
+    A player who types nothing for the idle timeout, or whose connection
+    is half-open and will never send anything again, ends the game, so the
+    thread and the session slot are given back.
+
+    Args:
+        session (Session): The session to read from.
+
+    Returns:
+        str: The line with a single new line at the end, or "" once the
+        player has disconnected, so input() raises EOFError.
+
+    Raises:
+        run.SessionExpired: If the player stayed idle for too long.
+    """
+    session_flush(session)
+    if session.closed:
+        return ""
+    readline = session.reader.readline()
+    if session.idle_timeout:
+        readline = asyncio.wait_for(readline, session.idle_timeout)
+    try:
+        line = asyncio.run_coroutine_threadsafe(readline,
+                                                session.loop).result()
+    except asyncio.TimeoutError:
+        raise run.SessionExpired("no input for too long")
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        line = b""
+    if not line:
+        session.closed = True
+        return ""
+
+    # Terminals end lines with CR LF, the game expects a bare new line
+    return line.decode("utf-8", "replace").rstrip("\r\n") + "\n"
+
+
+def session_flush(session):
+    """
+    Send everything the game printed in one write, from the game thread.
+
+    Args:
+        session (Session): The session to flush.
+    """
+    if not session.pending or session.closed:
+        session.pending.clear()
+        return
+    text = "".join(session.pending)
+    session.pending.clear()
+
+    # No pty translates new lines for us, so it is done here
+    data = text.replace("\n", "\r\n").encode("utf-8")
+    session.loop.call_soon_threadsafe(session.writer.write, data)
+
+
+class SessionStdin:
+    """
+    Stand-in for sys.stdin, reading from the session of the current game.
+
+    Outside a session, the real standard input is used.
+    """
+
+    def readline(self):
+        session = CURRENT_SESSION.get()
+        if session is None:
+            return sys.__stdin__.readline()
+        return session_readline(session)
+
+
+class SessionStdout:
+    """
+    Stand-in for sys.stdout, collecting the text printed by the current
+    game in its session until it is flushed.
+
+    Outside a session, the real standard output is used.
+    """
+
+    encoding = "utf-8"
+    errors = "replace"
+
+    def write(self, text):
+        session = CURRENT_SESSION.get()
+        if session is None:
+            return sys.__stdout__.write(text)
+        session.pending.append(text)
+        return len(text)
+
+    def flush(self):
+        session = CURRENT_SESSION.get()
+        if session is None:
+            sys.__stdout__.flush()
+        else:
+            session_flush(session)
+
+
+def play_session(session, intro_mode):
+    """
+    Play one whole game for a session, in a thread of the session pool.
+
+    Args:
+        session (Session): The session the game is played in.
+        intro_mode (str): How the logo is shown, one of run.INTRO_MODES.
+    """
+    CURRENT_SESSION.set(session)
+    try:
+        run.battleship_game_singe(intro_mode)
+    except (EOFError, ConnectionError):
+        # Player left in the middle of the game
+        pass
+    except run.SessionExpired as error:
+        print(f"\nSession ended: {error}")
+    finally:
+        session_flush(session)
+
+
+"""Server functions
+-----------------"""
+
+
+async def handle_connection(reader, writer, executor, slots, intro_mode,
+                            idle_timeout):
+    """
+    Serve one connection: play a game in it and close it afterwards.
+
+    Args:
+        reader (asyncio.StreamReader): Input of the connection.
+        writer (asyncio.StreamWriter): Output of the connection.
+        executor (ThreadPoolExecutor): Threads the games are played in.
+        slots (asyncio.Semaphore): Free session slots.
+        intro_mode (str): How the logo is shown, one of run.INTRO_MODES.
+        idle_timeout (float): Seconds a prompt may wait for the player, 0
+        for no limit.
+    """
+    if slots.locked():
+        writer.write(b"Server is full, please try again later.\r\n")
+        await writer.drain()
+        writer.close()
+        return
+
+    async with slots:
+        loop = asyncio.get_running_loop()
+        session = Session(reader, writer, loop, idle_timeout)
+        # Every game runs in a copy of the context, so setting its session
+        # does not touch any other game
+        context = contextvars.copy_context()
+        try:
+            await loop.run_in_executor(executor, context.run, play_session,
+                                       session, intro_mode)
+        finally:
+            session.closed = True
+            writer.close()
+
+
+async def serve(host, port, max_sessions, intro_mode):
+    """
+    Accept connections and play a game in every one of them, until the
+    server is stopped.
+
+    Args:
+        host (str): Address to listen on.
+        port (int): Port to listen on.
+        max_sessions (int): How many games are played at the same time,
+        more connections are turned away.
+        intro_mode (str): How the logo is shown, one of run.INTRO_MODES.
+    """
+    # Output and input of every game go to its own session
+    sys.stdin = SessionStdin()
+    sys.stdout = SessionStdout()
+    # Idle players are timed out by the event loop, the signal timer of
+    # run.py only works in the main thread
+    idle_timeout = run.read_session_limit(os.environ,
+                                          run.IDLE_TIMEOUT_VARIABLE)
+
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max_sessions, thread_name_prefix="session")
+    slots = asyncio.Semaphore(max_sessions)
+    server = await asyncio.start_server(
+        lambda reader, writer: handle_connection(reader, writer, executor,
+                                                 slots, intro_mode,
+                                                 idle_timeout),
+        host, port)
+
+    sys.__stdout__.write(f"Serving Battleship on {host}:{port}, up to "
+                         f"{max_sessions} players\n")
+    sys.__stdout__.flush()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        # Games only start when a slot is free, so there is always a free
+        # thread and no game waits in the queue of the executor
+        executor.shutdown(wait=False)
+
+
+"""Command line
+-------------"""
+
+
+def main():
+    """
+    Reads the server settings from command line and starts serving.
+    """
+    parser = argparse.ArgumentParser(
+        description="Serve Battleship to many terminal players from one "
+                    "process.")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="port to listen on")
+    parser.add_argument("--max-sessions", type=int,
+                        default=DEFAULT_MAX_SESSIONS,
+                        help="games played at the same time")
+    parser.add_argument("--intro", choices=run.INTRO_MODES,
+                        default="instant", help="how the logo is shown")
+    parser.add_argument("--columns", type=int, default=DEFAULT_COLUMNS,
+                        help="terminal width sessions are drawn for")
+    parser.add_argument("--lines", type=int, default=DEFAULT_LINES,
+                        help="terminal height sessions are drawn for")
+    args = parser.parse_args()
+
+    # Frames are sized from these instead of the server's own terminal
+    os.environ["COLUMNS"] = str(args.columns)
+    os.environ["LINES"] = str(args.lines)
+
+    threading.stack_size(SESSION_STACK_SIZE)
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.max_sessions,
+                          args.intro))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
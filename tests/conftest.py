@@ -0,0 +1,8 @@
+# conftest.py - lets the checks import run.py from the repository root
+
+# Import required libraries
+import os  # For finding the repository root
+import sys  # For the import path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
@@ -0,0 +1,126 @@
+# test_fleet_fits.py - checks fleet_fits_on_map against a brute-force
+# packer on small maps
+
+# Import required libraries
+import itertools  # For every fleet of a few small ships
+
+import pytest  # For parametrized checks
+
+import run
+
+
+# Biggest checked map side, ship size and number of ships
+MAX_SIDE = 6
+MAX_SHIP_SIZE = 4
+MAX_SHIPS = 5
+
+
+def brute_force_fits(height, width, ship_sizes, gaps_on_map):
+    """
+    Find out if the ships fit by trying every placement of every ship, in
+    order, with the cells of the map as plain sets.
+
+    Args:
+        height (int): The height of the map.
+        width (int): The width of the map.
+        ship_sizes (tuple): Sizes of the ships.
+        gaps_on_map (bool): If True, ships can not touch each other, not
+        even at a corner.
+
+    Returns:
+        bool: True if all ships can be placed.
+    """
+    placements = []
+    for size in ship_sizes:
+        ship_placements = set()
+        for row in range(height):
+            for column in range(width):
+                for row_step, column_step in ((0, 1), (1, 0)):
+                    cells = frozenset((row + row_step * step,
+                                       column + column_step * step)
+                                      for step in range(size))
+                    if all(cell_row < height and cell_column < width
+                           for cell_row, cell_column in cells):
+                        ship_placements.add(cells)
+        placements.append(ship_placements)
+
+    failed = set()
+
+    def place(index, taken, blocked):
+        if index == len(ship_sizes):
+            return True
+        if (index, taken) in failed:
+            return False
+        for cells in placements[index]:
+            if cells & blocked:
+                continue
+            around = cells
+            if gaps_on_map:
+                around = frozenset(
+                    (row + row_step, column + column_step)
+                    for row, column in cells for row_step in (-1, 0, 1)
+                    for column_step in (-1, 0, 1))
+            if place(index + 1, taken | cells, blocked | around):
+                return True
+        failed.add((index, taken))
+        return False
+
+    return place(0, frozenset(), frozenset())
+
+
+@pytest.mark.parametrize("gaps_on_map", [True, False])
+def test_fleet_fits_matches_brute_force(gaps_on_map):
+    """
+    Every fleet of up to MAX_SHIPS ships up to MAX_SHIP_SIZE long gets the
+    same answer as the brute-force packer, on every map up to MAX_SIDE x
+    MAX_SIDE.
+    """
+    for height, width in itertools.product(range(1, MAX_SIDE + 1),
+                                           repeat=2):
+        for count in range(MAX_SHIPS + 1):
+            for ship_sizes in itertools.combinations_with_replacement(
+                    range(MAX_SHIP_SIZE, 0, -1), count):
+                assert run.fleet_fits_on_map(
+                    height, width, ship_sizes, gaps_on_map) is (
+                    brute_force_fits(height, width, ship_sizes,
+                                     gaps_on_map)), (height, width,
+                                                     ship_sizes)
+
+
+def test_fleet_fits_unknown_when_out_of_budget(monkeypatch):
+    """
+    A search which runs out of placements answers FLEET_FIT_UNKNOWN, not
+    False, and the settings check settles it by deploying the fleet, once
+    for every map and fleet signature.
+    """
+    monkeypatch.setattr(run, "FLEET_FIT_SEARCH_LIMIT", 1)
+    deploy = run.cpu_deploy_all_ships
+    deployments = []
+
+    def count_deployments(*args):
+        deployments.append(args)
+        return deploy(*args)
+
+    monkeypatch.setattr(run, "cpu_deploy_all_ships", count_deployments)
+    run.fleet_fits_on_map.cache_clear()
+    run.fleet_fits_by_deploying.cache_clear()
+    try:
+        ship_sizes = (3, 2, 2, 1)
+        assert run.fleet_fits_on_map(6, 6, ship_sizes, True) is (
+            run.FLEET_FIT_UNKNOWN)
+        fleet = {"Cruiser": {"Size": 3, "Quantity": 1, "Coordinates": []},
+                 "Destroyer": {"Size": 2, "Quantity": 2, "Coordinates": []},
+                 "Tugboat": {"Size": 1, "Quantity": 1, "Coordinates": []}}
+        assert run.game_adjust_check_if_fleet_fits_on_map(6, 6, fleet, True)
+        assert deployments
+
+        # Same sizes under other names are answered from the cache
+        deployments.clear()
+        renamed = {"Ship " + name: ship_info
+                   for name, ship_info in fleet.items()}
+        assert run.game_adjust_check_if_fleet_fits_on_map(6, 6, renamed,
+                                                          True)
+        assert not deployments
+    finally:
+        run.fleet_fits_on_map.cache_clear()
+        run.fleet_fits_by_deploying.cache_clear()
@@ -0,0 +1,74 @@
+# test_output.py - checks that coalesced output and the prompt of input()
+# reach a terminal in the order they were printed
+
+# Import required libraries
+import os  # For the pty of the game process
+import select  # For reading the pty with a timeout
+import sys  # For starting the game process with the same interpreter
+
+import pytest  # For parametrized checks
+
+pty = pytest.importorskip("pty")  # Unix only
+
+
+# Repository root, run.py is imported from there by the child process
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Child process: coalesced output, then a prompt read from the terminal
+PROGRAM = """
+import sys
+import run
+run.install_output_coalescer(float(sys.argv[1]))
+print("FRAME-LINE")
+print("GOT", input("PROMPT> "))
+run.output_end_frame()
+"""
+
+
+def read_until(fd, marker=None, timeout=10):
+    """
+    Read a pty until the marker shows up, or until the other end is closed.
+
+    Args:
+        fd (int): Master end of the pty.
+        marker (bytes, optional): Bytes to wait for, None to read until the
+        other end is closed.
+        timeout (float): Seconds to wait for every read.
+
+    Returns:
+        bytes: Everything read.
+    """
+    output = b""
+    while marker is None or marker not in output:
+        ready, _, _ = select.select([fd], [], [], timeout)
+        assert ready, output
+        try:
+            chunk = os.read(fd, 65536)
+        except OSError:
+            # Linux reports a closed pty as an error
+            chunk = b""
+        if not chunk:
+            break
+        output += chunk
+    return output
+
+
+@pytest.mark.parametrize("window", [0, 0.05])
+def test_prompt_follows_coalesced_output(window):
+    """
+    The prompt of input() comes after the output printed before it, with
+    and without a flush window.
+    """
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.chdir(ROOT)
+        os.execv(sys.executable, [sys.executable, "-c", PROGRAM,
+                                  str(window)])
+    try:
+        output = read_until(fd, b"PROMPT> ")
+        os.write(fd, b"abc\n")
+        output += read_until(fd)
+    finally:
+        os.close(fd)
+        os.waitpid(pid, 0)
+    assert output.index(b"FRAME-LINE") < output.index(b"PROMPT> ")
+    assert b"GOT abc" in output
@@ -0,0 +1,106 @@
+# test_placements.py - checks the free-placement index and the placement
+# density of a map against a rebuild from scratch
+
+# Import required libraries
+import pytest  # For parametrized checks
+
+import run
+
+
+# Fleet of the checked games, small enough to leave free windows on the map
+# until late in the game
+FLEET = {"Cruiser": {"Size": 3, "Quantity": 2, "Coordinates": []},
+         "Destroyer": {"Size": 2, "Quantity": 2, "Coordinates": []},
+         "Tugboat": {"Size": 1, "Quantity": 2, "Coordinates": []}}
+
+
+def rebuilt_anchors(map_game, height, width):
+    """
+    Find the free anchors of a window by scanning the whole map.
+
+    Args:
+        map_game (GameMap): The game map.
+        height (int): The height of the window.
+        width (int): The width of the window.
+
+    Returns:
+        int: Bitboard of the top-left anchors of free windows.
+    """
+    return run.bitboard_from_coordinates(
+        map_game, run.map_scan_for_pattern(map_game, height, width))
+
+
+def rebuilt_density(map_game):
+    """
+    Count for every cell the free windows covering it, weighted the way the
+    density of the map is, from a scan of the whole map.
+
+    Args:
+        map_game (GameMap): The game map, its density has to be built.
+
+    Returns:
+        list: Weighted count of free windows for every cell.
+    """
+    density = [0] * (map_game.height * map_game.width)
+    for (height, width), weight in map_game.density_weights.items():
+        for row, column in run.map_scan_for_pattern(map_game, height, width):
+            for window_row in range(row, row + height):
+                for window_column in range(column, column + width):
+                    density[window_row * map_game.width +
+                            window_column] += weight
+    return density
+
+
+def check_map(map_game):
+    """
+    Check every kept window size, and the density once it is built,
+    against a rebuild.
+
+    Args:
+        map_game (GameMap): The game map.
+    """
+    for (height, width), anchors in map_game.placements.items():
+        assert anchors == rebuilt_anchors(map_game, height, width), (
+            height, width)
+    if map_game.density is not None:
+        assert [int(count) for count in map_game.density] == (
+            rebuilt_density(map_game))
+
+
+@pytest.mark.parametrize("size, hunt_mode", [
+    (10, "density"),
+    (10, "biggest_ship"),
+    (7, "density"),
+    # Big enough for the NumPy search when NumPy is installed
+    (32, "density"),
+])
+def test_index_matches_rebuild(monkeypatch, size, hunt_mode):
+    """
+    After every deployed ship and every shot of seeded CPU games, the
+    index and the density of both maps match a rebuild.
+    """
+    show_ship = run.map_show_ship_or_symbols
+
+    def show_ship_and_check(map_game, *args):
+        result = show_ship(map_game, *args)
+        check_map(map_game)
+        return result
+
+    monkeypatch.setattr(run, "map_show_ship_or_symbols",
+                        show_ship_and_check)
+
+    for seed in range(2 if size > 10 else 5):
+        state = run.GameState(size, size, FLEET, True, seed, hunt_mode)
+        map_hidden, map_display, fleet = run.create_initial_game_variables(
+            size, size, run.CELL_EMPTY, FLEET)
+        map_display, fleet = run.cpu_deploy_all_ships(state, map_display,
+                                                      fleet, True)
+        for _ in range(size * size):
+            map_hidden, map_display, fleet = run.cpu_move(
+                state, map_hidden, map_display, fleet,
+                state.cpu_shot_log_tmp)
+            check_map(map_hidden)
+            check_map(map_display)
+            if not state.game_result:
+                break
+        assert not state.game_result
@@ -0,0 +1,168 @@
+# test_screen.py - checks screen_draw against a full redraw of every frame
+
+# Import required libraries
+import os  # For the terminal size type
+import re  # For splitting the output into escape sequences and text
+
+import pytest  # For parametrized checks
+
+import run
+
+
+# Escape sequences written by screen_draw, or one character of text
+TERMINAL_TOKEN_PATTERN = re.compile(r"\x1b\[([0-9;]*)([A-Za-z])|(.)",
+                                    re.DOTALL)
+# Prompt printed under every frame, as the game does before input()
+PROMPT = "Please enter coordinates to shoot, Row and Column\n> 1,2\n"
+
+
+class Terminal:
+    """
+    Small terminal emulator, just enough for the output of the game.
+
+    Long lines wrap onto the next row and a line feed on the last row
+    scrolls the terminal, like a real terminal does, so cursor moves are
+    only right when the drawn frame really is where screen_draw thinks.
+
+    Attributes:
+        columns (int): Width of the terminal.
+        lines (int): Height of the terminal.
+        cells (list): Rows of (color, character) cells.
+        row, column (int): Cursor position, counted from 0.
+        wrap (bool): True when the cursor is past the last column and the
+        next character goes to the next row.
+        color (str): Color escape sequence in effect, or "".
+    """
+
+    __slots__ = ("columns", "lines", "cells", "row", "column", "wrap",
+                 "color")
+
+    def __init__(self, columns, lines):
+        self.columns = columns
+        self.lines = lines
+        self.cells = [self.blank_row() for _ in range(lines)]
+        self.row = self.column = 0
+        self.wrap = False
+        self.color = ""
+
+    def blank_row(self):
+        return [("", " ")] * self.columns
+
+    def line_feed(self):
+        if self.row == self.lines - 1:
+            self.cells.pop(0)
+            self.cells.append(self.blank_row())
+        else:
+            self.row += 1
+
+    def write(self, text):
+        for match in TERMINAL_TOKEN_PATTERN.finditer(text):
+            parameters, command, character = match.groups()
+            if character is None:
+                self.escape(parameters, command)
+            elif character == "\n":
+                # The pty turns a new line into a carriage return too
+                self.column = 0
+                self.wrap = False
+                self.line_feed()
+            else:
+                if self.wrap:
+                    self.column = 0
+                    self.wrap = False
+                    self.line_feed()
+                self.cells[self.row][self.column] = (self.color, character)
+                if self.column == self.columns - 1:
+                    self.wrap = True
+                else:
+                    self.column += 1
+
+    def escape(self, parameters, command):
+        self.wrap = False
+        if command == "m":
+            sequence = f"\x1b[{parameters}m"
+            self.color = "" if sequence == run.SCREEN_RESET else sequence
+        elif command == "H":
+            row, _, column = parameters.partition(";")
+            self.row = min(int(row or 1), self.lines) - 1
+            self.column = min(int(column or 1), self.columns) - 1
+        elif command == "J":
+            start = self.row
+            if parameters == "2":
+                start = 0
+            else:
+                self.cells[self.row][self.column:] = (
+                    self.blank_row()[self.column:])
+                start += 1
+            for row in range(start, self.lines):
+                self.cells[row] = self.blank_row()
+        elif command == "K":
+            self.cells[self.row][self.column:] = (
+                self.blank_row()[self.column:])
+
+
+def play_frames(height, width, seed):
+    """
+    Build the frames of a seeded CPU game, the way cpu_vs_cpu draws them.
+
+    Args:
+        height (int): The height of the game map.
+        width (int): The width of the game map.
+        seed (int): Seed of the game.
+
+    Returns:
+        list: Every frame of the game, in order.
+    """
+    fleet = {"Cruiser": {"Size": 3, "Quantity": 1, "Coordinates": []},
+             "Tugboat": {"Size": 1, "Quantity": 2, "Coordinates": []}}
+    state = run.GameState(height, width, fleet, True, seed)
+    map_hidden, map_display, fleet_cpu = run.create_initial_game_variables(
+        height, width, run.CELL_EMPTY, fleet)
+    map_display, fleet_cpu = run.cpu_deploy_all_ships(
+        state, map_display, fleet_cpu, True)
+
+    frames = []
+    for _ in range(height * width):
+        frames.append(run.action_log_messages(state.game_actions_log, 1) +
+                      run.render_two_maps(state, map_hidden, map_display,
+                                          "CPU Map", "Player Map", 10))
+        map_hidden, map_display, fleet_cpu = run.cpu_move(
+            state, map_hidden, map_display, fleet_cpu,
+            state.cpu_shot_log_tmp)
+        if not state.game_result:
+            break
+    return frames
+
+
+@pytest.mark.parametrize("height, width, columns, lines, diffs", [
+    (10, 10, 120, 40, True),
+    # The 10x10 frame is about 100 columns wide, it wraps on 80 columns
+    (10, 10, 80, 24, False),
+    (5, 5, 80, 24, True),
+    # Too tall to leave the prompt lines free
+    (10, 5, 80, 16, False),
+])
+def test_screen_draw_matches_full_redraw(monkeypatch, capsys, height, width,
+                                         columns, lines, diffs):
+    """
+    After every frame and prompt the terminal shows what a full redraw of
+    the frame followed by the same prompt shows.
+    """
+    monkeypatch.setattr(run.shutil, "get_terminal_size",
+                        lambda *args: os.terminal_size((columns, lines)))
+    screen = run.Screen()
+    terminal = Terminal(columns, lines)
+
+    for seed in range(3):
+        run.screen_forget(screen)
+        for index, frame in enumerate(play_frames(height, width, seed)):
+            run.screen_draw(screen, frame)
+            output = capsys.readouterr().out
+            terminal.write(output + PROMPT)
+
+            expected = Terminal(columns, lines)
+            expected.write(run.SCREEN_CLEAR + frame + PROMPT)
+            assert terminal.cells == expected.cells, (seed, index)
+
+            # Later frames go out as cell changes only when the frame fits
+            if index:
+                assert output.startswith(run.SCREEN_CLEAR) != diffs
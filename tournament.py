@@ -0,0 +1,322 @@
+# tournament.py - play many CPU vs CPU games in parallel and report stats
+
+# Import required libraries
+import argparse  # For reading the tournament settings from command line
+import collections  # For counting shots and hit cells
+import concurrent.futures  # For running games in worker processes
+import os  # For finding out how many cores are available
+import time  # For measuring how long the tournament took
+
+import run  # The game engine and its headless simulation API
+
+
+# Default tournament settings, can be changed from command line
+DEFAULT_GAMES = 1000
+DEFAULT_CHUNK_SIZE = 250
+DEFAULT_SEED = 0
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+
+
+"""Worker functions
+-----------------"""
+
+
+def play_chunk(first_game, games, height, width, fleet, gaps_on_map,
+               seed, hunt_mode=run.DEFAULT_CPU_HUNT_MODE):
+    """
+    Plays a chunk of games in a worker process and sums up the results.
+
+    Every game gets its own seed (tournament seed plus the game number),
+    so the result of a tournament does not depend on how many workers
+    played it or in which order the chunks were finished. Only counters
+    are sent back to the main process, never the games themselves, so a
+    chunk result stays small no matter how many games it holds.
+
+    Args:
+        first_game (int): Number of the first game in this chunk.
+        games (int): How many games to play in this chunk.
+        height (int): The height of the game map.
+        width (int): The width of the game map.
+        fleet (dict): The fleet configuration used by both CPUs.
+        gaps_on_map (bool): If True, ships can not touch each other.
+        seed (int): The tournament seed.
+        hunt_mode (str, optional): How both CPUs hunt for ships, one of
+        run.CPU_HUNT_MODES.
+
+    Returns:
+        dict: Partial tournament statistics, see 'create_statistics'.
+    """
+    statistics = create_statistics()
+
+    for game in range(first_game, first_game + games):
+        result = run.simulate_cpu_vs_cpu(height, width, fleet, gaps_on_map,
+                                         seed=seed + game,
+                                         hunt_mode=hunt_mode)
+        statistics["games"] += 1
+
+        # Fleet could not be deployed or nobody won
+        if result is None or result.winner is None:
+            statistics["unfinished"] += 1
+            continue
+
+        statistics["wins"][result.winner] += 1
+        statistics["shots"][result.shots] += 1
+
+        # Bitboards are added bit by bit, so cell index is bit index
+        for board in result.hit_cells:
+            while board:
+                lowest_bit = board & -board
+                statistics["hit_cells"][lowest_bit.bit_length() - 1] += 1
+                board ^= lowest_bit
+
+    return statistics
+
+
+"""Statistics functions
+---------------------"""
+
+
+def create_statistics():
+    """
+    Creates empty tournament statistics.
+
+    Shots to win are kept as a histogram (shots -> games), so partial
+    statistics can be merged by adding them up and percentiles can still
+    be found exactly at the end.
+
+    Returns:
+        dict: Statistics with keys:
+            - games (int): Games played.
+            - unfinished (int): Games without a winner.
+            - wins (Counter): Player -> games won.
+            - shots (Counter): Shots to win -> games.
+            - hit_cells (Counter): Bit index of a cell -> times hit.
+    """
+    return {"games": 0, "unfinished": 0, "wins": collections.Counter(),
+            "shots": collections.Counter(),
+            "hit_cells": collections.Counter()}
+
+
+def merge_statistics(statistics, partial):
+    """
+    Adds partial statistics of one chunk to the tournament statistics.
+
+    Args:
+        statistics (dict): Tournament statistics, updated in place.
+        partial (dict): Statistics returned by 'play_chunk'.
+
+    Returns:
+        dict: The updated tournament statistics.
+    """
+    statistics["games"] += partial["games"]
+    statistics["unfinished"] += partial["unfinished"]
+    for key in ("wins", "shots", "hit_cells"):
+        statistics[key].update(partial[key])
+    return statistics
+
+
+def statistics_mean(histogram):
+    """
+    Calculates the mean value of a histogram.
+
+    Args:
+        histogram (Counter): Value -> how many times it happened.
+
+    Returns:
+        float: The mean value, or None if the histogram is empty.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+    return sum(value * count for value, count in histogram.items()) / total
+
+
+def statistics_percentile(histogram, percentile):
+    """
+    Finds a percentile of a histogram using the nearest rank method.
+
+    Args:
+        histogram (Counter): Value -> how many times it happened.
+        percentile (float): Percentile to find, from 0 to 100.
+
+    Returns:
+        int: The smallest value with at least 'percentile' percent of
+        all values at or below it, or None if the histogram is empty.
+    """
+    total = sum(histogram.values())
+    if not total:
+        return None
+
+    # Nearest rank, ceil done with integers to avoid float rounding
+    rank = max(1, -(-percentile * total // 100))
+    seen = 0
+    for value in sorted(histogram):
+        seen += histogram[value]
+        if seen >= rank:
+            return value
+    return None
+
+
+"""Tournament functions
+---------------------"""
+
+
+def run_tournament(games, height, width, fleet, gaps_on_map, seed=0,
+                   workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                   progress=None, hunt_mode=run.DEFAULT_CPU_HUNT_MODE):
+    """
+    Plays a tournament of CPU vs CPU games spread over worker processes.
+
+    Games are split into chunks of 'chunk_size' games. Chunks are sent
+    to a pool of worker processes, and their results are merged as soon
+    as each chunk is finished, so the main process never holds more than
+    the running totals.
+
+    Args:
+        games (int): How many games to play.
+        height (int): The height of the game map.
+        width (int): The width of the game map.
+        fleet (dict): The fleet configuration used by both CPUs.
+        gaps_on_map (bool): If True, ships can not touch each other.
+        seed (int, optional): Tournament seed, game 'n' uses 'seed + n'.
+        workers (int, optional): Number of worker processes, defaults to
+        the number of available cores.
+        chunk_size (int, optional): Games played by a worker in one go.
+        progress (callable, optional): Called with the statistics after
+        every merged chunk.
+        hunt_mode (str, optional): How both CPUs hunt for ships, one of
+        run.CPU_HUNT_MODES.
+
+    Returns:
+        dict: Tournament statistics, see 'create_statistics'.
+    """
+    if workers is None:
+        workers = available_cores()
+    chunk_size = max(1, chunk_size)
+
+    statistics = create_statistics()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as \
+            executor:
+        futures = [executor.submit(play_chunk, first_game,
+                                   min(chunk_size, games - first_game),
+                                   height, width, fleet, gaps_on_map, seed,
+                                   hunt_mode)
+                   for first_game in range(0, games, chunk_size)]
+
+        # Merge chunks in the order they are finished
+        for future in concurrent.futures.as_completed(futures):
+            merge_statistics(statistics, future.result())
+            if progress is not None:
+                progress(statistics)
+
+    return statistics
+
+
+def available_cores():
+    """
+    Finds how many cores this process is allowed to run on.
+
+    Returns:
+        int: Number of available cores, at least 1.
+    """
+    # Affinity is more precise on Linux (containers, taskset)
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+"""Print functions
+----------------"""
+
+
+def print_statistics(statistics, height, width, elapsed,
+                     percentiles=DEFAULT_PERCENTILES):
+    """
+    Prints tournament statistics and a per-cell hit frequency map.
+
+    Args:
+        statistics (dict): Tournament statistics.
+        height (int): The height of the game map.
+        width (int): The width of the game map.
+        elapsed (float): Time the tournament took, in seconds.
+        percentiles (tuple, optional): Percentiles of shots to win.
+    """
+    games = statistics["games"]
+    finished = games - statistics["unfinished"]
+    speed = games / elapsed if elapsed else 0
+    print(f"Games played: {games} in {elapsed:.2f}s ({speed:.0f} games/s)")
+    print(f"Unfinished games: {statistics['unfinished']}")
+    for player, wins in sorted(statistics["wins"].items()):
+        print(f"{player} wins: {wins} ({100 * wins / finished:.1f}%)")
+
+    if not finished:
+        return
+
+    mean = statistics_mean(statistics["shots"])
+    print(f"Shots to win, mean: {mean:.2f}")
+    for percentile in percentiles:
+        value = statistics_percentile(statistics["shots"], percentile)
+        print(f"Shots to win, p{percentile}: {value}")
+
+    # Reference map, so bit indexes are laid out the way the engine does
+    map_game = run.create_initial_game_variables(
+        height, width, run.CELL_EMPTY, {})[0]
+    frequency = [[0.0] * map_game.width for _ in range(map_game.height)]
+    for bit, hits in statistics["hit_cells"].items():
+        row, column = divmod(bit, map_game.width)
+        # Every finished game has two maps that could be hit
+        frequency[row][column] = 100 * hits / (2 * finished)
+
+    print("Hit frequency per cell (% of maps):")
+    for row in frequency:
+        print(" ".join(f"{value:5.1f}" for value in row))
+
+
+"""Command line
+-------------"""
+
+
+def main():
+    """
+    Reads the tournament settings from command line and runs it.
+    """
+    parser = argparse.ArgumentParser(
+        description="Play many CPU vs CPU Battleship games in parallel.")
+    parser.add_argument("--games", type=int, default=DEFAULT_GAMES,
+                        help="number of games to play")
+    parser.add_argument("--height", type=int,
+                        default=run.DEFAULT_MAP_HEIGHT, help="map height")
+    parser.add_argument("--width", type=int,
+                        default=run.DEFAULT_MAP_WIDTH, help="map width")
+    parser.add_argument("--no-gaps", action="store_true",
+                        help="let ships touch each other")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                        help="tournament seed, game n uses seed + n")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes, defaults to all cores")
+    parser.add_argument("--chunk-size", type=int,
+                        default=DEFAULT_CHUNK_SIZE,
+                        help="games played by a worker in one go")
+    parser.add_argument("--hunt-mode", choices=run.CPU_HUNT_MODES,
+                        default=run.DEFAULT_CPU_HUNT_MODE,
+                        help="how the CPUs hunt for ships")
+    args = parser.parse_args()
+
+    def progress(statistics):
+        print(f"\r{statistics['games']}/{args.games} games", end="",
+              flush=True)
+
+    start = time.perf_counter()
+    statistics = run_tournament(args.games, args.height, args.width,
+                                run.DEFAULT_FLEET, not args.no_gaps,
+                                seed=args.seed, workers=args.workers,
+                                chunk_size=args.chunk_size,
+                                progress=progress,
+                                hunt_mode=args.hunt_mode)
+    print()
+    print_statistics(statistics, args.height, args.width,
+                     time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()